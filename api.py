@@ -0,0 +1,68 @@
+"""
+    Helpers of the APIs of a node (flask_server.py) and of the coordinator (coordinator.py). Importing this module
+    does nothing else than defining them: no queue, no heartbeat.
+"""
+import os
+from functools import wraps
+
+import yaml
+from flask import request, jsonify
+
+from config.config import TOKEN_FILE
+from handler import reject_with_traceback
+
+_token_cache = {}
+
+
+def load_tokens():
+  """
+  token.yaml is read again only when it is modified
+  """
+  mtime = os.stat(TOKEN_FILE).st_mtime_ns
+  if _token_cache.get('mtime') != mtime:
+    with open(TOKEN_FILE) as token_fs:
+      _token_cache.update(mtime=mtime, tokens=yaml.safe_load(token_fs.read()))
+  return _token_cache['tokens']
+
+
+def check_auth(username, password):
+  tokens = load_tokens()
+  return username == tokens['username'] and password == tokens['password']
+
+
+def authorization_failed():
+  return jsonify({'status': 'reject', 'message': 'authorization failed'})
+
+
+def auth_required(f):
+  @wraps(f)
+  def decorated(*args, **kwargs):
+    auth = request.authorization
+    if not auth or not check_auth(auth.username, auth.password):
+      return authorization_failed()
+    return f(*args, **kwargs)
+
+  return decorated
+
+
+def response_ok(**kwargs):
+  kwargs.update(status='received')
+  return jsonify(kwargs)
+
+
+def request_data():
+  """
+  Query APIs are GET requests, which take a JSON body as well as query string arguments
+  """
+  return request.get_json(silent=True) or request.args
+
+
+def with_traceback_on_err(f):
+  @wraps(f)
+  def decorated(*args, **kwargs):
+    try:
+      return f(*args, **kwargs)
+    except:
+      return jsonify(reject_with_traceback())
+
+  return decorated
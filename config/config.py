@@ -7,12 +7,27 @@ from enum import Enum
 
 _CONFIG_BASE = path.dirname(path.abspath(__file__))
 PROJECT_BASE = path.dirname(_CONFIG_BASE)
-_RUN_BASE = path.join(PROJECT_BASE, 'run')
+# several nodes can run from one checkout, each with a run directory of its own
+_RUN_BASE = os.environ.get("RUN_BASE", path.join(PROJECT_BASE, 'run'))
 DATA_BASE = path.join(_RUN_BASE, 'data')
 SUB_BASE = path.join(_RUN_BASE, 'sub')
 SPJ_BASE = path.join(_RUN_BASE, "spj")
+COMPILE_CACHE_BASE = path.join(SUB_BASE, "cache")
 TMP_BASE = path.join(_RUN_BASE, "tmp")
-LIB_BASE = path.abspath(path.join(_RUN_BASE, '../lib'))
+STATE_BASE = path.join(_RUN_BASE, "state")
+REPORT_BASE = path.join(_RUN_BASE, "report")
+QUEUE_FILE = path.join(STATE_BASE, "queue.sqlite3")
+SLOT_BASE = path.join(TMP_BASE, "slot")
+COMPILE_SLOT_BASE = path.join(SLOT_BASE, "compile")
+ADMISSION_FILE = path.join(SLOT_BASE, "admission.json")
+SPJ_INDEX_FILE = path.join(STATE_BASE, "spj_index.json")
+CASE_STATS_FILE = path.join(STATE_BASE, "stats.sqlite3")
+METRICS_BASE = path.join(_RUN_BASE, "metrics")
+CANCEL_BASE = path.join(_RUN_BASE, "cancel")
+NODES_FILE = path.join(STATE_BASE, "nodes.json")
+WARM_BASE = path.join(_RUN_BASE, "warm")
+CASE_CACHE_BASE = os.environ.get("CASE_CACHE_BASE", "/dev/shm/ejudge/cases")
+LIB_BASE = path.join(PROJECT_BASE, 'lib')
 TOKEN_FILE = path.join(_CONFIG_BASE, 'token.yaml')
 NSJAIL_PATH = path.join(PROJECT_BASE, "nsjail", "nsjail")
 
@@ -60,3 +75,40 @@ TRACEBACK_LIMIT = int(os.environ.get("TRACEBACK_LIMIT", 5))
 COMPILE_MAX_TIME_FOR_TRUSTED = int(os.environ.get("COMPILE_MAX_TIME_FOR_TRUSTED", 30))
 OUTPUT_LIMIT = int(os.environ.get("OUTPUT_LIMIT", 256))
 DEBUG = os.environ.get("DEBUG", 0)
+COMPILE_CACHE_SIZE = int(os.environ.get("COMPILE_CACHE_SIZE", 512)) * 1024 * 1024
+CASE_CACHE_SIZE = int(os.environ.get("CASE_CACHE_SIZE", 0)) * 1024 * 1024
+INTERACTION_RECORD = os.environ.get("INTERACTION_RECORD", "report")
+DEFAULT_CHECKER = os.environ.get("DEFAULT_CHECKER", "defaultspj")
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL", 1))
+STATUS_FLUSH_CASES = int(os.environ.get("STATUS_FLUSH_CASES", 32))
+STATUS_POLL_INTERVAL = float(os.environ.get("STATUS_POLL_INTERVAL", 0.2))
+# streams end after STREAM_TIMEOUT seconds, and clients reconnect, so that streams nobody reads do not pile up
+STREAM_TIMEOUT = int(os.environ.get("STREAM_TIMEOUT", 540))
+REPORT_MAX_AGE = int(os.environ.get("REPORT_MAX_AGE", 1800))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 2))
+CANCEL_POLL_INTERVAL = float(os.environ.get("CANCEL_POLL_INTERVAL", 0.05))
+ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", 4))
+CHECKER_DAEMON = int(os.environ.get("CHECKER_DAEMON", 0))
+FAIL_FAST = int(os.environ.get("FAIL_FAST", 0))
+WARM_START = int(os.environ.get("WARM_START", 1))
+COMPILE_CONCURRENCY = int(os.environ.get("COMPILE_CONCURRENCY", max(cpu_count() // 2, 1)))
+COMPILE_CPUS = os.environ.get("COMPILE_CPUS", "")
+EXECUTE_CPUS = os.environ.get("EXECUTE_CPUS", "")
+ADMISSION_MEMORY = int(os.environ.get("ADMISSION_MEMORY", 0))
+ADMISSION_CPUS = int(os.environ.get("ADMISSION_CPUS", 0))
+SANDBOX_BACKEND = os.environ.get("SANDBOX_BACKEND", "nsjail")
+FAKE_SANDBOX_LATENCY = float(os.environ.get("FAKE_SANDBOX_LATENCY", 0.01))
+FAKE_SANDBOX_VERDICT = os.environ.get("FAKE_SANDBOX_VERDICT", "ACCEPTED")
+JUDGE_CONCURRENCY = int(os.environ.get("JUDGE_CONCURRENCY", 1))
+JUDGE_WORKERS = int(os.environ.get("JUDGE_WORKERS", cpu_count()))
+QUEUE_SIZE = int(os.environ.get("QUEUE_SIZE", 256))
+PORT = int(os.environ.get("PORT", 5000))
+STREAM_PORT = int(os.environ.get("STREAM_PORT", 5001))
+COORDINATOR_NODES = [url for url in os.environ.get("COORDINATOR_NODES", "").split(",") if url]
+COORDINATOR_URL = os.environ.get("COORDINATOR_URL", "")
+NODE_URL = os.environ.get("NODE_URL", "")
+NODE_TOKEN = os.environ.get("NODE_TOKEN", "")
+NODE_TIMEOUT = int(os.environ.get("NODE_TIMEOUT", 60))
+NODE_REPLICAS = int(os.environ.get("NODE_REPLICAS", 0))
+NODE_JUDGE_TIMEOUT = int(os.environ.get("NODE_JUDGE_TIMEOUT", 3600))
+COORDINATOR_WORKERS = int(os.environ.get("COORDINATOR_WORKERS", 16))
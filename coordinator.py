@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+    Coordinator of several judge nodes: a judge is split into shards, each run by a node (as a judge of its own,
+    with the fingerprint <fingerprint>_<shard>), and their results are merged into one response, the same as a
+    single node would have given. The API is that of flask_server.py.
+
+    Cases are sent to the nodes that have their data, if possible: a case is copied to the node it goes to from
+    one that has it otherwise. When there are groups, a group (a contiguous run of cases of the same group) is
+    never split. The source is sent to every node of the judge and compiled there. Shards go through the queues
+    of the nodes, and are given up after NODE_JUDGE_TIMEOUT seconds.
+    Uploads are forwarded: special judges to every node, cases to NODE_REPLICAS nodes (every node if 0).
+
+    Nodes are listed in COORDINATOR_NODES, or register themselves when started with COORDINATOR_URL and
+    NODE_URL. Several nodes can run on one host, each with a RUN_BASE and a PORT of its own, e.g.
+
+      RUN_BASE=/tmp/node1 PORT=5001 COORDINATOR_URL=http://localhost:4999 NODE_URL=http://localhost:5001 \\
+        python3 flask_server.py
+      PORT=4999 python3 coordinator.py
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import request, Response, jsonify, Flask
+
+from api import auth_required, response_ok, request_data, with_traceback_on_err
+from config.config import PORT, NODE_REPLICAS, NODE_JUDGE_TIMEOUT, COORDINATOR_WORKERS, QUEUE_SIZE, Verdict
+from core.cluster import NodeRegistry, node_auth, rendezvous
+from core.util import check_fingerprint
+from handler import reject_with_traceback, trace_group_dependencies, cache, JudgeStatus
+
+coordinator_app = Flask(__name__)
+node_registry = NodeRegistry()
+# judges that are not held run in a pool, with at most QUEUE_SIZE of them waiting for it
+judge_executor = ThreadPoolExecutor(max_workers=COORDINATOR_WORKERS)
+judge_slots = threading.BoundedSemaphore(COORDINATOR_WORKERS + QUEUE_SIZE)
+REQUEST_TIMEOUT = 60
+NODE_POLL_INTERVAL = 1
+
+
+def node_call(node, method, api, timeout=REQUEST_TIMEOUT, **kwargs):
+  """
+  :return: the JSON response of a node, raising on anything else than a received status
+  """
+  response = requests.request(method, node + api, auth=node_auth(), timeout=timeout, **kwargs)
+  response.raise_for_status()
+  data = response.json()
+  if data.get('status') == 'reject':
+    raise RuntimeError("%s%s: %s" % (node, api, data.get('message')))
+  return data
+
+
+def on_nodes(nodes, f):
+  """
+  :return: f(node) for every node, called concurrently, by node
+  """
+  if not nodes:
+    return {}
+  with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+    return dict(zip(nodes, executor.map(f, nodes)))
+
+
+def shards_key(fingerprint):
+  return '%s_shards' % fingerprint
+
+
+def split_units(case_count, group_list=None):
+  """
+  :return: lists of case indices that go to a node together, contiguous runs of a group or single cases
+  """
+  units = []
+  for case_idx in range(case_count):
+    if units and group_list is not None and group_list[case_idx] == group_list[units[-1][0]]:
+      units[-1].append(case_idx)
+    else:
+      units.append([case_idx])
+  return units
+
+
+def assign_units(case_list, units, holders):
+  """
+  :param holders: {node: set of case fingerprints it has}
+  :return: {node: list of case indices}, every unit going to the node that has the most of its cases, the least
+           loaded of them if there are several
+  """
+  if not holders:
+    raise ValueError("no judge node is available")
+  assignment = {node: [] for node in holders}
+  for unit in units:
+    unit_cases = {case_list[case_idx] for case_idx in unit}
+    node = max(holders, key=lambda node: (len(unit_cases & holders[node]), -len(assignment[node])))
+    assignment[node].extend(unit)
+  return {node: sorted(case_indices) for node, case_indices in assignment.items() if case_indices}
+
+
+def missing_cases(case_list, assignment, holders):
+  """
+  :return: a list of (case fingerprint, node that has it, node that needs it); a case no node has is left out,
+           for the node to reject the judge
+  """
+  copies = []
+  for node, case_indices in sorted(assignment.items()):
+    for fingerprint in sorted({case_list[case_idx] for case_idx in case_indices} - holders[node]):
+      sources = sorted(source for source in holders if fingerprint in holders[source])
+      if sources:
+        copies.append((fingerprint, sources[0], node))
+  return copies
+
+
+def copy_case(fingerprint, source, target):
+  for io in ('input', 'output'):
+    response = requests.get('%s/download/case/%s/%s' % (source, fingerprint, io), auth=node_auth(),
+                            timeout=REQUEST_TIMEOUT, stream=True)
+    response.raise_for_status()
+    if response.headers.get('Content-Type') != 'application/octet-stream':
+      raise RuntimeError("%s: case %s cannot be downloaded: %s" % (source, fingerprint, response.text))
+    node_call(target, 'POST', '/upload/case/%s/%s' % (fingerprint, io), data=response.iter_content(1 << 20))
+
+
+def run_shard(node, payload):
+  """
+  Judge a shard through the queue of a node, waiting while it is full, and poll its status until it is finished
+
+  :return: the final status of the shard
+  """
+  deadline = time.time() + NODE_JUDGE_TIMEOUT
+  while True:
+    try:
+      node_call(node, 'POST', '/judge', json=dict(payload, hold=False))
+      break
+    except requests.HTTPError as e:
+      if e.response is None or e.response.status_code != 503 or time.time() > deadline:
+        raise
+    time.sleep(NODE_POLL_INTERVAL)
+  while time.time() < deadline:
+    status = node_call(node, 'GET', '/query', params={'fingerprint': payload['fingerprint']})
+    if status.get('cancelled') or status.get('verdict') not in (Verdict.WAITING.value, Verdict.JUDGING.value):
+      return status
+    time.sleep(NODE_POLL_INTERVAL)
+  try:
+    node_call(node, 'POST', '/cancel', json={'fingerprint': payload['fingerprint']})
+  except RuntimeError:
+    pass  # finished in the meantime
+  raise RuntimeError("%s: shard %s is not finished after %d seconds" % (node, payload['fingerprint'],
+                                                                         NODE_JUDGE_TIMEOUT))
+
+
+def merge_results(case_count, shards, group_list=None, group_dependencies=None, run_until_complete=False):
+  """
+  Merge the responses of the shards of a judge, the way judge_handler goes through the cases.
+
+  :param shards: a list of (case indices, response of the node)
+  """
+  responses = [response for _, response in shards]
+  for response in responses:
+    if response.get('status') == 'reject':
+      return response
+  for response in responses:
+    if response.get('verdict') == Verdict.COMPILE_ERROR.value:
+      return {'status': 'received', 'verdict': Verdict.COMPILE_ERROR.value, 'message': response.get('message', '')}
+
+  results = dict()
+  for case_indices, response in shards:
+    results.update(zip(case_indices, response.get('detail', [])))
+  group_dependencies = trace_group_dependencies(group_dependencies)
+
+  def waiting_result(case_idx):
+    if group_list is not None:
+      return {'group': group_list[case_idx], 'verdict': Verdict.WAITING.value}
+    return {'verdict': Verdict.WAITING.value}
+
+  detail = []
+  skipped_groups = set()
+  sum_verdict_value = Verdict.ACCEPTED.value
+  time_verdict = -1
+  memory_verdict = -1
+  for case_idx in range(case_count):
+    if group_list is not None and not run_until_complete and group_list[case_idx] in skipped_groups:
+      # the case might have been run by another node before its group is skipped there
+      detail.append(waiting_result(case_idx))
+      continue
+    case_result = results.get(case_idx) or waiting_result(case_idx)
+    detail.append(case_result)
+    if case_result['verdict'] == Verdict.WAITING.value:
+      continue
+    if case_result.get('time'):
+      time_verdict = max(time_verdict, case_result['time'])
+    if case_result.get('memory'):
+      memory_verdict = max(memory_verdict, case_result['memory'])
+    if case_result['verdict'] != Verdict.ACCEPTED.value:
+      if sum_verdict_value == Verdict.ACCEPTED.value:
+        sum_verdict_value = case_result['verdict']
+      if 'group' in case_result:
+        skipped_groups |= group_dependencies.get(case_result['group'], {case_result['group']})
+      if not run_until_complete and group_list is None:
+        break
+
+  response = {'status': 'received', 'verdict': sum_verdict_value, 'detail': detail}
+  if any(response.get('cancelled') for response in responses):
+    detail.extend(waiting_result(case_idx) for case_idx in range(len(detail), case_count))
+    response.update(verdict=Verdict.WAITING.value, cancelled=True)
+  if time_verdict >= 0:
+    response.update(time=time_verdict)
+  if memory_verdict >= 0:
+    response.update(memory=memory_verdict)
+  return response
+
+
+def judge_sharded(data):
+  fingerprint = data['fingerprint']
+  case_list, group_list = data['cases'], data.get('group_list')
+  try:
+    nodes = node_registry.nodes()
+    if not nodes:
+      raise ValueError("no judge node is available")
+
+    def present_cases(node):
+      try:
+        return set(node_call(node, 'POST', '/query/cases', json={'cases': sorted(set(case_list))})['present'])
+      except (requests.RequestException, RuntimeError, ValueError):
+        return None  # the node is down, it is left out
+
+    holders = {node: cases for node, cases in on_nodes(nodes, present_cases).items() if cases is not None}
+    assignment = assign_units(case_list, split_units(len(case_list), group_list), holders)
+    copies = missing_cases(case_list, assignment, holders)
+    if copies:
+      with ThreadPoolExecutor(max_workers=min(len(copies), 8)) as executor:
+        list(executor.map(lambda copy: copy_case(*copy), copies))
+    shards = [{'node': node, 'fingerprint': '%s_%d' % (fingerprint, shard_idx), 'cases': case_indices}
+              for shard_idx, (node, case_indices) in enumerate(sorted(assignment.items()))]
+    cache.set(shards_key(fingerprint), shards, timeout=3600)
+
+    def judge_shard(shard):
+      payload = dict(data, fingerprint=shard['fingerprint'],
+                     cases=[case_list[case_idx] for case_idx in shard['cases']])
+      if group_list is not None:
+        payload['group_list'] = [group_list[case_idx] for case_idx in shard['cases']]
+      else:
+        # cases of a node must be run in order, for its first failure to be the first of its cases
+        payload['fail_fast'] = False
+      try:
+        return shard['cases'], run_shard(shard['node'], payload)
+      except:
+        return shard['cases'], reject_with_traceback()
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+      responses = list(executor.map(judge_shard, shards))
+    return merge_results(len(case_list), responses, group_list, data.get('group_dependencies'),
+                         data.get('run_until_complete', False))
+  except:
+    return reject_with_traceback()
+
+
+@coordinator_app.route('/ping')
+def ping():
+  return Response("pong")
+
+
+@coordinator_app.route('/node/register', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def register_node():
+  node_registry.register(request.get_json()['url'])
+  return response_ok()
+
+
+@coordinator_app.route('/list/node', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def list_node():
+  return response_ok(nodes=node_registry.nodes())
+
+
+@coordinator_app.route('/upload/case/<fid>/<io>', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def upload_case(fid, io):
+  body = request.get_data()
+  responses = on_nodes(rendezvous(fid, node_registry.nodes(), NODE_REPLICAS),
+                       lambda node: node_call(node, 'POST', '/upload/case/%s/%s' % (fid, io), data=body))
+  return response_ok(**{k: v for response in responses.values() for k, v in response.items() if k != 'status'})
+
+
+@coordinator_app.route('/upload/cases', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def upload_cases():
+  """
+  The archive is sent to every node that should have some of its cases, with a manifest of these cases only
+  """
+  manifest = json.loads(request.form['manifest'])
+  archive = request.files['archive'].read()
+  nodes = node_registry.nodes()
+  manifests = {}
+  for entry in manifest:
+    for node in rendezvous(entry['fingerprint'], nodes, NODE_REPLICAS):
+      manifests.setdefault(node, []).append(entry)
+
+  def upload(node):
+    return node_call(node, 'POST', '/upload/cases', data={'manifest': json.dumps(manifests[node])},
+                     files={'archive': ('archive', archive)})['cases']
+
+  cases = dict()
+  for node_cases in on_nodes(list(manifests), upload).values():
+    cases.update(node_cases)
+  return response_ok(cases=cases)
+
+
+@coordinator_app.route('/upload/spj', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def upload_spj():
+  data = request.get_json()
+  on_nodes(node_registry.nodes(), lambda node: node_call(node, 'POST', '/upload/spj', json=data))
+  return response_ok()
+
+
+@coordinator_app.route('/list/spj', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def list_spj():
+  """
+  The special judges that every node has
+  """
+  lists = on_nodes(node_registry.nodes(), lambda node: node_call(node, 'GET', '/list/spj')['spj'])
+  common = set.intersection(*(set(spj) for spj in lists.values())) if lists else set()
+  return jsonify({
+    "status": "received",
+    "spj": sorted(common)
+  })
+
+
+@coordinator_app.route('/judge', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def judge():
+  data = request.get_json()
+  fingerprint = check_fingerprint(data['fingerprint'])
+  hold = data.get('hold', True)
+  if not hold and not judge_slots.acquire(blocking=False):
+    return jsonify({'status': 'busy', 'message': 'the coordinator has too many judges'}), 503
+  cache.set(fingerprint, {'verdict': Verdict.WAITING.value}, timeout=3600)
+  cache.delete(shards_key(fingerprint))
+  if hold:
+    response = judge_sharded(data)
+    JudgeStatus(fingerprint).write(response, force=True)
+    return jsonify(response)
+
+  def judge_async():
+    try:
+      JudgeStatus(fingerprint).write(judge_sharded(data), force=True)
+    finally:
+      judge_slots.release()
+
+  cache.set(fingerprint, {'status': 'received', 'verdict': Verdict.JUDGING.value}, timeout=3600)
+  judge_executor.submit(judge_async)
+  return response_ok()
+
+
+@coordinator_app.route('/cancel', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def cancel():
+  fingerprint = request_data()['fingerprint']
+  shards = cache.get(shards_key(fingerprint))
+  if shards is None:
+    return jsonify({'status': 'reject', 'message': 'fingerprint not found'})
+
+  def cancel_shard(shard):
+    try:
+      node_call(shard['node'], 'POST', '/cancel', json={'fingerprint': shard['fingerprint']})
+    except RuntimeError:
+      pass  # the shard is finished already
+
+  with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as executor:
+    list(executor.map(cancel_shard, shards))
+  return response_ok()
+
+
+@coordinator_app.route('/query', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def query():
+  status = JudgeStatus.read(request_data()['fingerprint'])
+  if status is None:
+    return jsonify({'status': 'reject', 'message': 'fingerprint not found'})
+  status.setdefault('status', 'received')
+  return jsonify(status)
+
+
+@coordinator_app.route('/query/report', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def query_result():
+  """
+  The same as that of a node: the reports of the shards are gathered, by index in the whole case list
+  """
+  data = request_data()
+  shards = cache.get(shards_key(data.get('fingerprint', ''))) or []
+  if 'case' in data:
+    start = int(data['case'])
+    end = start + 1
+  else:
+    start = int(data.get('start', 0))
+    end = int(data['end']) if 'end' in data else None
+
+  def shard_reports(shard):
+    reports = node_call(shard['node'], 'GET', '/query/report', params={'fingerprint': shard['fingerprint'],
+                                                                       'start': 0})['report']
+    return [(shard['cases'][report['case']], report['report']) for report in reports]
+
+  with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as executor:
+    reports = sorted(report for shard_reports in executor.map(shard_reports, shards) for report in shard_reports
+                     if report[0] >= start and (end is None or report[0] < end))
+  if 'case' in data or 'start' in data or 'end' in data:
+    return response_ok(report=[{'case': case_idx, 'report': text} for case_idx, text in reports])
+  return ''.join(text for _, text in reports)
+
+
+if __name__ == '__main__':
+  coordinator_app.run(host='0.0.0.0', port=PORT)
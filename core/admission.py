@@ -0,0 +1,174 @@
+"""
+    Admission of sandboxes: the memory limits and the CPUs of the sandboxes running on a node at the same time
+    stay within a budget, ADMISSION_MEMORY MB and ADMISSION_CPUS (by default, 80% of the physical memory and the
+    CPUs of EXECUTE_CPUS, or all of them), so that the node never swaps. A run that does not fit waits until
+    others are done; a run is always admitted when nothing else runs, however large it is. Waiting runs are
+    admitted in the order they came, so that a large one is not passed over forever by smaller ones.
+
+    Reservations are kept in a ledger shared by the processes of the node (a JSON file under an flock), by pid,
+    so that those of a process that died are dropped; the ledger is only written when it changes. Compiles are
+    not admitted here, as they are bounded by compile slots (see core/compile_pool.py) and run on CPUs of their own.
+"""
+import fcntl
+import json
+import os
+import time
+from os import path, cpu_count
+
+from config.config import ADMISSION_FILE, ADMISSION_MEMORY, ADMISSION_CPUS
+from core import metrics
+from core.compile_pool import EXECUTE_CPU_SET
+from core.metrics import ADMISSION_WAIT_SECONDS
+from core.util import random_string
+
+WAIT_INTERVAL = 0.05
+
+
+def memory_budget():
+  if ADMISSION_MEMORY > 0:
+    return ADMISSION_MEMORY
+  return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.8 / 1024 / 1024)
+
+
+def cpu_budget():
+  if ADMISSION_CPUS > 0:
+    return ADMISSION_CPUS
+  return len(EXECUTE_CPU_SET) or cpu_count()
+
+
+def _alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+class Ledger(object):
+  """
+  The ledger, locked for as long as it is used as a context manager
+  """
+
+  def __init__(self, ledger_file=ADMISSION_FILE):
+    self.ledger_file = ledger_file
+    self.lock_fd = None
+    self.entries = None
+    self.loaded = None
+
+  def __enter__(self):
+    os.makedirs(path.dirname(self.ledger_file), exist_ok=True)
+    self.lock_fd = os.open(self.ledger_file + ".lock", os.O_RDWR | os.O_CREAT, 0o0600)
+    fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+    try:
+      with open(self.ledger_file) as fs:
+        entries = json.load(fs)
+    except (OSError, ValueError):
+      entries = {}
+    self.loaded = entries
+    alive = {}
+    self.entries = {}
+    for state in ("running", "waiting"):
+      self.entries[state] = {}
+      for key, entry in entries.get(state, {}).items():
+        pid = int(key.split(":")[0])
+        if pid not in alive:
+          alive[pid] = _alive(pid)
+        if alive[pid]:
+          self.entries[state][key] = entry
+    return self
+
+  def __exit__(self, *exc_info):
+    try:
+      if exc_info[0] is None and self.entries != self.loaded:
+        with open(self.ledger_file + ".tmp", "w") as fs:
+          json.dump(self.entries, fs)
+        os.replace(self.ledger_file + ".tmp", self.ledger_file)
+    finally:
+      os.close(self.lock_fd)
+      self.lock_fd = None
+
+  def used(self):
+    running = self.entries["running"].values()
+    return sum(entry[0] for entry in running), sum(entry[1] for entry in running)
+
+  def wait(self, key, memory, cpus):
+    """
+    Put key at the end of the waiting runs, if it is not waiting yet
+
+    :return: whether key is the first of the waiting runs
+    """
+    waiting = self.entries["waiting"]
+    if key not in waiting:
+      waiting[key] = [memory, cpus, max((_ticket(entry) for entry in waiting.values()), default=0) + 1]
+    return min(waiting, key=lambda k: (_ticket(waiting[k]), k)) == key
+
+
+def _ticket(waiting_entry):
+  """
+  :return: the place of a waiting run in the order of arrival
+  """
+  return waiting_entry[2] if len(waiting_entry) > 2 else 0
+
+
+class Reservation(object):
+
+  def __init__(self, key, ledger_file):
+    self.key = key
+    self.ledger_file = ledger_file
+
+  def release(self):
+    if self.key is None:
+      return
+    with Ledger(self.ledger_file) as ledger:
+      ledger.entries["running"].pop(self.key, None)
+    self.key = None
+
+
+def admit(memory, cpus=1, cancel_token=None, ledger_file=ADMISSION_FILE):
+  """
+  Wait until a sandbox limited to memory MB and using cpus CPUs fits in the budget.
+
+  :return: a Reservation, to be released when the sandbox is done
+  """
+  key = "%d:%s" % (os.getpid(), random_string(8))
+  start = time.perf_counter()
+  try:
+    while True:
+      with Ledger(ledger_file) as ledger:
+        used_memory, used_cpus = ledger.used()
+        if ledger.wait(key, memory, cpus) and (not ledger.entries["running"] or (
+            used_memory + memory <= memory_budget() and used_cpus + cpus <= cpu_budget())):
+          ledger.entries["waiting"].pop(key)
+          ledger.entries["running"][key] = [memory, cpus]
+          ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+          return Reservation(key, ledger_file)
+      if cancel_token is not None:
+        cancel_token.check()
+      time.sleep(WAIT_INTERVAL)
+  except:
+    with Ledger(ledger_file) as ledger:
+      ledger.entries["waiting"].pop(key, None)
+    raise
+
+
+def status(ledger_file=ADMISSION_FILE):
+  with Ledger(ledger_file) as ledger:
+    used_memory, used_cpus = ledger.used()
+    return {"memory_budget": memory_budget(), "memory_used": used_memory,
+            "cpu_budget": cpu_budget(), "cpu_used": used_cpus,
+            "running": len(ledger.entries["running"]), "waiting": len(ledger.entries["waiting"])}
+
+
+def _admission_metrics():
+  current = status()
+  return [("ejudge_admission_memory_mb", "gauge", "Memory of the sandboxes admitted, and the budget",
+           [({"state": "used"}, current["memory_used"]), ({"state": "budget"}, current["memory_budget"])]),
+          ("ejudge_admission_cpus", "gauge", "CPUs of the sandboxes admitted, and the budget",
+           [({"state": "used"}, current["cpu_used"]), ({"state": "budget"}, current["cpu_budget"])]),
+          ("ejudge_admission_sandboxes", "gauge", "Sandboxes admitted and waiting",
+           [({"state": "running"}, current["running"]), ({"state": "waiting"}, current["waiting"])])]
+
+
+metrics.register_collector(_admission_metrics)
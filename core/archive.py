@@ -0,0 +1,74 @@
+"""
+    Bulk import of cases from an archive (tar, tar.gz and alike, or zip) and a manifest, which is a list of
+    {"fingerprint": ..., "input": member name, "output": member name}, either member being optional.
+
+    Members of a zip are extracted in parallel, each worker reading the archive with a handle of its own;
+    a tar, compressed or not, can only be read from the beginning, so it is streamed through once.
+    Nothing else of the archive is extracted.
+"""
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from config.config import ARCHIVE_WORKERS
+from core.case import Case
+from core.util import check_fingerprint
+
+
+def _normalize(name):
+  while name.startswith("./"):
+    name = name[2:]
+  return name
+
+
+def _write_member(stream, fingerprint, io):
+  case = Case(fingerprint)
+  if io == "input":
+    return case.write_input_stream(stream)
+  return case.write_output_stream(stream)
+
+
+def _extract_zip_member(archive_file, member, fingerprint, io):
+  with zipfile.ZipFile(archive_file) as archive, archive.open(member) as stream:
+    return _write_member(stream, fingerprint, io)
+
+
+def extract_cases(archive_file, manifest, workers=ARCHIVE_WORKERS):
+  """
+  :return: {fingerprint: {"input": sha256, "output": sha256}}
+  """
+  # the whole manifest is checked before anything is written, so that a bad entry rejects the upload as a whole
+  for entry in manifest:
+    check_fingerprint(entry["fingerprint"])
+  targets = {}
+  for entry in manifest:
+    for io in ("input", "output"):
+      if entry.get(io):
+        targets.setdefault(_normalize(entry[io]), []).append((entry["fingerprint"], io))
+  checksums = {entry["fingerprint"]: {} for entry in manifest}
+
+  if zipfile.is_zipfile(archive_file):
+    with zipfile.ZipFile(archive_file) as archive:
+      members = {_normalize(name): name for name in archive.namelist()}
+    missing = set(targets) - set(members)
+    if missing:
+      raise KeyError("members not found in archive: %s" % sorted(missing))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      futures = [(fingerprint, io, executor.submit(_extract_zip_member, archive_file, members[name], fingerprint, io))
+                 for name, cases in targets.items() for fingerprint, io in cases]
+      for fingerprint, io, future in futures:
+        checksums[fingerprint][io] = future.result()
+  else:
+    found = set()
+    with tarfile.open(archive_file, "r:*") as archive:
+      for member in archive:
+        name = _normalize(member.name)
+        if name not in targets or not member.isfile():
+          continue
+        found.add(name)
+        for fingerprint, io in targets[name]:
+          checksums[fingerprint][io] = _write_member(archive.extractfile(member), fingerprint, io)
+    missing = set(targets) - found
+    if missing:
+      raise KeyError("members not found in archive: %s" % sorted(missing))
+  return checksums
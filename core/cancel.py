@@ -0,0 +1,125 @@
+"""
+    Cooperative cancellation of judging.
+
+    A CancelToken is shared by everything working for one judge. Sandboxes register their nsjail process
+    (which leads a process group of its own) while they run, and cancelling the token kills them right away:
+    SIGTERM first, so that nsjail tears down the jail and its cgroups, then SIGKILL if it is still there after
+    KILL_GRACE seconds. Work that has not started yet is refused with JudgeCancelled.
+
+    A token can have children, cancelled with it or on their own (e.g. the interactor of a case).
+
+    Across processes, a judge is cancelled by creating the marker file CANCEL_BASE/<fingerprint>, which
+    a watcher thread of the judging process polls every CANCEL_POLL_INTERVAL seconds.
+"""
+import os
+import signal
+import threading
+from os import path
+
+from config.config import CANCEL_BASE, CANCEL_POLL_INTERVAL
+from core.exception import JudgeCancelled
+
+KILL_GRACE = 1
+
+
+class CancelToken(object):
+
+  def __init__(self, parent=None):
+    self.cancelled = False
+    self.lock = threading.Lock()
+    self.pids = set()
+    self.children = set()
+    self.parent = parent
+    if parent is not None:
+      parent.add_child(self)
+
+  def add_child(self, child):
+    with self.lock:
+      if not self.cancelled:
+        self.children.add(child)
+        return
+    child.cancel()
+
+  def close(self):
+    """
+    Detach from the parent, once the work of this token is done
+    """
+    if self.parent is not None:
+      with self.parent.lock:
+        self.parent.children.discard(self)
+
+  def check(self):
+    if self.cancelled:
+      raise JudgeCancelled
+
+  def register(self, pid):
+    with self.lock:
+      self.pids.add(pid)
+      if not self.cancelled:
+        return
+    self._kill(pid)
+
+  def unregister(self, pid):
+    with self.lock:
+      self.pids.discard(pid)
+
+  def cancel(self):
+    with self.lock:
+      if self.cancelled:
+        return
+      self.cancelled = True
+      pids, children = list(self.pids), list(self.children)
+    for pid in pids:
+      self._kill(pid)
+    for child in children:
+      child.cancel()
+
+  def _kill(self, pid):
+    def kill(sig):
+      with self.lock:
+        if pid not in self.pids:
+          return  # already reaped, the pid might be reused
+        try:
+          os.killpg(pid, sig)
+        except (ProcessLookupError, PermissionError):
+          pass
+
+    kill(signal.SIGTERM)
+    timer = threading.Timer(KILL_GRACE, kill, args=(signal.SIGKILL,))
+    timer.daemon = True
+    timer.start()
+
+
+def cancel_marker(fingerprint):
+  return path.join(CANCEL_BASE, fingerprint)
+
+
+def request_cancel(fingerprint):
+  os.makedirs(CANCEL_BASE, exist_ok=True)
+  open(cancel_marker(fingerprint), "w").close()
+
+
+def clear_cancel(fingerprint):
+  try:
+    os.remove(cancel_marker(fingerprint))
+  except FileNotFoundError:
+    pass
+
+
+def watch_cancel(fingerprint, token, interval=CANCEL_POLL_INTERVAL):
+  """
+  Cancel the token as soon as the marker of fingerprint shows up.
+
+  :return: a function stopping the watch
+  """
+  stopped = threading.Event()
+  marker = cancel_marker(fingerprint)
+
+  def watch():
+    while not stopped.wait(interval):
+      if path.exists(marker):
+        token.cancel()
+        return
+
+  threading.Thread(target=watch, daemon=True).start()
+  return stopped.set
@@ -1,14 +1,39 @@
+"""
+    Case data is content-addressed: the content is stored once as a blob under DATA_BASE/blob, named by its sha256,
+    and the input and output files of a fingerprint are hard links to blobs. Identical files uploaded under
+    different fingerprints thus share one blob, and a case file is never written in place.
+
+    Files are read from the hot case cache (see core/case_cache.py) when it is enabled: resolve sets input_file
+    and output_file to the cached copies, if there are, once per run; data_input_file and data_output_file are
+    the files in DATA_BASE.
+"""
+import hashlib
+import os
+import shutil
 from os import path, makedirs
+
 from config.config import DATA_BASE
+from core.case_cache import case_cache
+from core.util import random_string
+
+CHUNK_SIZE = 1 << 20
 
 
 class Case(object):
 
   def __init__(self, fingerprint):
     self.fingerprint = fingerprint
-    self.input_file = self._get_data_path("in", fingerprint)
-    self.output_file = self._get_data_path("out", fingerprint)
-    self.input_file_stream = self.output_file_stream = None
+    self.data_input_file = self._get_data_path("in", fingerprint)
+    self.data_output_file = self._get_data_path("out", fingerprint)
+    self.input_file = self.data_input_file
+    self.output_file = self.data_output_file
+
+  def resolve(self):
+    self.input_file = case_cache.lookup(self.data_input_file)
+    self.output_file = case_cache.lookup(self.data_output_file)
+
+  def prefetch(self):
+    case_cache.prefetch([self.data_input_file, self.data_output_file])
 
   def _get_data_path(self, category, hash):
     parts = [DATA_BASE, category]
@@ -25,18 +50,61 @@ class Case(object):
     parts.append(hash)
     return path.join(*parts)
 
+  def _write_blob(self, target, chunks):
+    """
+    Write chunks to a blob, hashing on the fly, and link target to the blob.
+
+    :return: sha256 of the content
+    """
+    tmp_directory = path.join(DATA_BASE, "blob", "tmp")
+    makedirs(tmp_directory, exist_ok=True)
+    tmp_file = path.join(tmp_directory, random_string())
+    digest = hashlib.sha256()
+    try:
+      with open(tmp_file, "wb") as fs:
+        for chunk in chunks:
+          digest.update(chunk)
+          fs.write(chunk)
+      blob = self._get_data_path("blob", digest.hexdigest())
+      if path.exists(blob):
+        os.remove(tmp_file)
+      else:
+        os.replace(tmp_file, blob)
+    finally:
+      if path.exists(tmp_file):
+        os.remove(tmp_file)
+    tmp_link = target + "." + random_string(8)
+    try:
+      os.link(blob, tmp_link)
+    except OSError:
+      shutil.copyfile(blob, tmp_link)  # not on the same file system
+    os.replace(tmp_link, target)
+    return digest.hexdigest()
+
+  @staticmethod
+  def _read_chunks(stream):
+    return iter(lambda: stream.read(CHUNK_SIZE), b"")
+
   def write_input_binary(self, buf):
-    if not self.input_file_stream:
-      self.input_file_stream = open(self.input_file, 'wb')
-    self.input_file_stream.write(buf)
-    self.input_file_stream.close()
+    return self._write_blob(self.data_input_file, [buf])
 
   def write_output_binary(self, buf):
-    if not self.output_file_stream:
-      self.output_file_stream = open(self.output_file, 'wb')
-    self.output_file_stream.write(buf)
-    self.output_file_stream.close()
+    return self._write_blob(self.data_output_file, [buf])
+
+  def write_input_stream(self, stream):
+    return self._write_blob(self.data_input_file, self._read_chunks(stream))
+
+  def write_output_stream(self, stream):
+    return self._write_blob(self.data_output_file, self._read_chunks(stream))
+
+  def exists(self):
+    return path.exists(self.data_input_file) and path.exists(self.data_output_file)
 
   def check_validity(self):
-    assert path.exists(self.input_file)
-    assert path.exists(self.output_file)
+    assert self.exists()
+
+  def input_size(self):
+    try:
+      return path.getsize(self.data_input_file)
+    except OSError:
+      return 0
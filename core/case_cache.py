@@ -0,0 +1,151 @@
+"""
+    Hot case cache: copies of case files in memory (a tmpfs, CASE_CACHE_BASE), bounded by CASE_CACHE_SIZE.
+
+    A copy is named after the inode of the data file (with its size and mtime), so that files sharing a blob
+    share a copy, and a case uploaded again under the same fingerprint is a miss. Access time is refreshed on
+    every hit, and the least recently used copies are evicted to make room, except those used within
+    EVICTION_GRACE seconds, which might be about to be mounted into a sandbox.
+
+    Copies are only made by the prefetcher: when a judge starts, the files of its cases are fetched in the
+    background, in the order of the case list, and files that do not fit are read ahead into the page cache
+    instead. A run looks its files up once, and reads the data files on a miss.
+"""
+import fcntl
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+from config.config import CASE_CACHE_BASE, CASE_CACHE_SIZE
+from core.metrics import CASE_CACHE_LOOKUPS
+from core.util import random_string
+
+EVICTION_GRACE = 60
+MAX_FILE_SHARE = 4  # a file larger than a quarter of the cache is never cached
+
+
+class CaseCache(object):
+
+  def __init__(self, directory, max_size):
+    self.directory = directory
+    self.max_size = max_size
+    self.prefetcher = None
+    self.prefetcher_pid = None
+
+  @property
+  def enabled(self):
+    return self.max_size > 0
+
+  def _entry_path(self, st):
+    return path.join(self.directory, "%d-%d-%d" % (st.st_ino, st.st_size, st.st_mtime_ns))
+
+  def lookup(self, file):
+    """
+    :return: the cached copy of file, or file itself if it is not cached
+    """
+    if not self.enabled:
+      return file
+    try:
+      entry = self._entry_path(os.stat(file))
+      os.utime(entry)
+    except OSError:
+      CASE_CACHE_LOOKUPS.inc(result="miss")
+      return file
+    CASE_CACHE_LOOKUPS.inc(result="hit")
+    return entry
+
+  def fetch(self, file):
+    """
+    Cache file if it is not cached yet and fits
+
+    :return: whether file is cached
+    """
+    if not self.enabled:
+      return False
+    try:
+      st = os.stat(file)
+    except OSError:
+      return False
+    entry = self._entry_path(st)
+    try:
+      os.utime(entry)
+      return True
+    except OSError:
+      return self._admit(file, st, entry)
+
+  def _admit(self, file, st, entry):
+    if st.st_size * MAX_FILE_SHARE > self.max_size:
+      return False
+    os.makedirs(self.directory, exist_ok=True)
+    lock_fd = os.open(path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o0644)
+    try:
+      fcntl.flock(lock_fd, fcntl.LOCK_EX)
+      if path.exists(entry):
+        return True  # made by another process meanwhile
+      if not self._make_room(st.st_size):
+        return False
+      tmp = path.join(self.directory, ".tmp" + random_string(8))
+      try:
+        shutil.copyfile(file, tmp)
+        os.chmod(tmp, 0o0644)
+        os.replace(tmp, entry)
+      except OSError:
+        return False  # the tmpfs is full after all
+      finally:
+        if path.exists(tmp):
+          os.remove(tmp)
+      return True
+    finally:
+      os.close(lock_fd)
+
+  def _make_room(self, size):
+    entries, total = [], 0
+    for file in os.listdir(self.directory):
+      if file.startswith("."):
+        continue
+      try:
+        st = os.stat(path.join(self.directory, file))
+      except OSError:
+        continue
+      entries.append((st.st_atime, st.st_size, path.join(self.directory, file)))
+      total += st.st_size
+    entries.sort()
+    deadline = time.time() - EVICTION_GRACE
+    for atime, entry_size, file in entries:
+      if total + size <= self.max_size or atime > deadline:
+        break
+      try:
+        os.remove(file)
+      except OSError:
+        pass
+      total -= entry_size
+    return total + size <= self.max_size
+
+  @staticmethod
+  def read_ahead(file):
+    try:
+      fd = os.open(file, os.O_RDONLY)
+    except OSError:
+      return
+    try:
+      os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+      os.close(fd)
+
+  def prefetch(self, files):
+    """
+    Cache files (or read them ahead) in the background, one judge after another
+    """
+    def fetch():
+      for file in files:
+        if not self.fetch(file):
+          self.read_ahead(file)
+
+    if self.prefetcher_pid != os.getpid():  # the thread of a parent is not there after a fork
+      self.prefetcher = ThreadPoolExecutor(max_workers=1)
+      self.prefetcher_pid = os.getpid()
+    self.prefetcher.submit(fetch)
+
+
+case_cache = CaseCache(CASE_CACHE_BASE, CASE_CACHE_SIZE)
@@ -0,0 +1,87 @@
+"""
+    Judge nodes as seen by the coordinator (see coordinator.py).
+
+    Nodes are those of COORDINATOR_NODES, and those that have registered within NODE_TIMEOUT seconds.
+    A node started with COORDINATOR_URL and NODE_URL registers itself periodically (heartbeat).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from os import path
+
+import requests
+import yaml
+
+from config.config import NODES_FILE, COORDINATOR_NODES, NODE_TIMEOUT, NODE_TOKEN, TOKEN_FILE
+
+HEARTBEAT_INTERVAL = 10
+
+
+def node_auth():
+  """
+  :return: (username, password) used between the coordinator and the nodes, NODE_TOKEN or that of token.yaml
+  """
+  if NODE_TOKEN:
+    return tuple(NODE_TOKEN.split(":", 1))
+  with open(TOKEN_FILE) as token_fs:
+    tokens = yaml.safe_load(token_fs.read())
+  return tokens['username'], tokens['password']
+
+
+class NodeRegistry(object):
+
+  def __init__(self, nodes_file=NODES_FILE, static_nodes=COORDINATOR_NODES):
+    self.nodes_file = nodes_file
+    self.static_nodes = [url.rstrip("/") for url in static_nodes]
+
+  def _load(self):
+    try:
+      with open(self.nodes_file) as fs:
+        return json.load(fs)
+    except (OSError, ValueError):
+      return {}
+
+  def register(self, url):
+    os.makedirs(path.dirname(self.nodes_file), exist_ok=True)
+    lock_fd = os.open(self.nodes_file + ".lock", os.O_RDWR | os.O_CREAT, 0o0644)
+    try:
+      fcntl.flock(lock_fd, fcntl.LOCK_EX)
+      nodes = self._load()
+      now = time.time()
+      nodes = {node: seen for node, seen in nodes.items() if now - seen < NODE_TIMEOUT}
+      nodes[url.rstrip("/")] = now
+      with open(self.nodes_file + ".tmp", "w") as fs:
+        json.dump(nodes, fs)
+      os.replace(self.nodes_file + ".tmp", self.nodes_file)
+    finally:
+      os.close(lock_fd)
+
+  def nodes(self):
+    now = time.time()
+    registered = sorted(node for node, seen in self._load().items() if now - seen < NODE_TIMEOUT)
+    return self.static_nodes + [node for node in registered if node not in self.static_nodes]
+
+
+def start_heartbeat(coordinator_url, node_url, interval=HEARTBEAT_INTERVAL):
+  def heartbeat():
+    while True:
+      try:
+        requests.post(coordinator_url.rstrip("/") + "/node/register", json={"url": node_url},
+                      auth=node_auth(), timeout=interval)
+      except requests.RequestException:
+        pass  # the coordinator might not be up yet
+      time.sleep(interval)
+
+  threading.Thread(target=heartbeat, daemon=True).start()
+
+
+def rendezvous(key, nodes, count):
+  """
+  :return: count nodes (all if count <= 0) chosen for key by highest random weight hashing, so that a key
+           stays on the same nodes when other nodes come and go
+  """
+  ranked = sorted(nodes, key=lambda node: hashlib.sha256((node + "/" + key).encode()).digest(), reverse=True)
+  return ranked if count <= 0 else ranked[:count]
@@ -0,0 +1,160 @@
+"""
+    In-process port of lib/defaultspj.cpp.
+
+    Output and answer are compared character by character, except that trailing white spaces of a line and
+    trailing blank lines are ignored and "\r" is tolerated (with a warning). Verdicts and messages are
+    the same as defaultspj, including the context around a difference, which defaultspj takes from its
+    100000-byte read buffer.
+
+    Both files are memory-mapped, and equal stretches are skipped block by block, so the per-character work
+    only happens around differences.
+"""
+import mmap
+
+ACCEPTED_EXIT_CODE = 0
+WA_EXIT_CODE = 1
+FAIL_EXIT_CODE = 3
+
+BUFFER_SIZE = 100000
+BLOCK_SIZE = 1 << 20
+LINE_ENDINGS = b"\r\n"
+WHITE_SPACES = b" \t\n\v\f\r"
+
+
+def _is_valid_char(c):
+  return c != 0 and c not in WHITE_SPACES
+
+
+def _is_compress_char(c):
+  return c != 0 and c not in LINE_ENDINGS
+
+
+def _common_prefix_length(a, i, b, j):
+  n = min(len(a) - i, len(b) - j)
+  k, block = 0, BLOCK_SIZE
+  while k < n:
+    step = min(block, n - k)
+    if a[i + k:i + k + step] == b[j + k:j + k + step]:
+      k += step
+    elif step == 1:
+      break
+    else:
+      block = step // 2
+  return k
+
+
+def _count_lines(buf, end):
+  count = 1
+  for start in range(0, end, BLOCK_SIZE):
+    count += buf[start:min(start + BLOCK_SIZE, end)].count(b"\n")
+  return count
+
+
+def _compress(buf, pos):
+  """
+  Context around the character just read, where pos is the position of the next character
+  """
+  start = (pos - 1) // BUFFER_SIZE * BUFFER_SIZE
+  end = min(start + BUFFER_SIZE, len(buf))
+  left = pos
+  while left > start and pos - left < 16 and _is_compress_char(buf[left - 1]):
+    left -= 1
+  right = pos
+  while right < end and right - pos < 15 and _is_compress_char(buf[right]):
+    right += 1
+  context = buf[left:right]
+  if pos - left == 16:
+    context = b"..." + context
+  if right - pos == 15:
+    context += b"..."
+  return context
+
+
+def compare(out, ans):
+  """
+  :param out: output of the submission, bytes-like
+  :param ans: answer, bytes-like
+  :return: a tuple (exit code, message in bytes), the same as defaultspj
+  """
+  i = j = 0  # next position in ans and out
+  na, no = len(ans), len(out)
+
+  def finish(exit_code, message):
+    if ans.find(b"\r", 0, i) != -1 or out.find(b"\r", 0, j) != -1:
+      message = b"warning: \\r detected\n" + message
+    return exit_code, message
+
+  while True:
+    k = _common_prefix_length(ans, i, out, j)
+    i, j = i + k, j + k
+    ans_ok, ouf_ok = i < na, j < no
+    if ans_ok and ouf_ok:
+      a, b = ans[i], out[j]
+      i, j = i + 1, j + 1
+      if a == 10:
+        # ans is at eol but ouf is not
+        while True:
+          if _is_valid_char(b):
+            return finish(WA_EXIT_CODE, b"wrong answer: unexpected character at the end of line %d\n" %
+                          _count_lines(out, j))
+          if j >= no:
+            break
+          b, j = out[j], j + 1
+          if b == 10:
+            break
+      elif b == 10:
+        # ouf is at eol but ans is not
+        while True:
+          if _is_valid_char(a):
+            return finish(WA_EXIT_CODE, b"wrong answer: character missing at the end of line %d\n" %
+                          (_count_lines(out, j) - 1))
+          if i >= na:
+            break
+          a, i = ans[i], i + 1
+          if a == 10:
+            break
+      else:
+        return finish(WA_EXIT_CODE, b"wrong answer: line %d differ - expected: '%s', found: '%s'\n" %
+                      (_count_lines(out, j), _compress(ans, i), _compress(out, j)))
+    elif not ans_ok and not ouf_ok:
+      return finish(ACCEPTED_EXIT_CODE, b"ok\n")
+    elif not ans_ok:
+      # ouf is still not eof
+      while j < no:
+        j += 1
+        if _is_valid_char(out[j - 1]):
+          return finish(WA_EXIT_CODE, b"wrong answer: unexpected output at eof\n")
+    else:
+      # ans is still not eof but ouf is eof now
+      while i < na:
+        i += 1
+        if _is_valid_char(ans[i - 1]):
+          return finish(WA_EXIT_CODE, b"wrong answer: output missing at eof\n")
+
+
+class _MappedFile(object):
+
+  def __init__(self, file):
+    self.file = file
+    self.fs = self.buffer = None
+
+  def __enter__(self):
+    self.fs = open(self.file, "rb")
+    try:
+      self.buffer = mmap.mmap(self.fs.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      self.buffer = b""  # empty file cannot be mapped
+    return self.buffer
+
+  def __exit__(self, *args):
+    if isinstance(self.buffer, mmap.mmap):
+      self.buffer.close()
+    self.fs.close()
+
+
+def compare_files(output_file, answer_file):
+  try:
+    with _MappedFile(output_file) as out, _MappedFile(answer_file) as ans:
+      return compare(out, ans)
+  except OSError:
+    return FAIL_EXIT_CODE, b""
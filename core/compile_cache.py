@@ -0,0 +1,154 @@
+"""
+    Content-addressed cache of compiled artifacts.
+
+    An entry is keyed by the source code, the language, the compile commands in lang.yaml and the identity of
+    the compiler binaries, so a change to any of them is a miss. Both executables and compile error messages
+    are kept, under a size-bounded LRU in SUB_BASE. Access time is kept in mtime, which is refreshed on hit.
+
+    The cache is walked to evict entries when what a process has stored since its last walk might take it over
+    the bound, or EVICT_INTERVAL seconds after that walk, for the entries stored by the other processes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from os import path
+
+from config.config import COMPILE_CACHE_BASE, COMPILE_CACHE_SIZE
+from core.metrics import COMPILE_CACHE_LOOKUPS
+from core.util import random_string
+
+ERROR_EXT = "err"
+EVICT_INTERVAL = 60
+
+
+class CompileCache(object):
+
+  def __init__(self, directory, max_size):
+    self.directory = directory
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    self.size = None  # the size found by the last walk, and what was stored since
+    self.walk_time = 0
+
+  @property
+  def enabled(self):
+    return self.max_size > 0
+
+  @staticmethod
+  def binary_identity(binary):
+    try:
+      st = os.stat(path.realpath(binary))
+      return [binary, st.st_ino, st.st_size, st.st_mtime_ns]
+    except OSError:
+      return [binary]
+
+  def make_key(self, code, lang, language_config):
+    commands = language_config["compile"]
+    identity = json.dumps([lang, commands, language_config["code_file"],
+                           [self.binary_identity(command.split()[0]) for command in commands]])
+    digest = hashlib.sha256(identity.encode())
+    digest.update(b"\0")
+    digest.update(code.encode())
+    return digest.hexdigest()
+
+  def _entry_path(self, key, ext):
+    return path.join(self.directory, key[:2], key + "." + ext)
+
+  def lookup(self, key, exe_ext, exe_file):
+    """
+    :return: a tuple (kind, value); kind is "exe" with exe_file, to which the cached executable is copied,
+             "error" with the cached compile error message, or None on miss
+    """
+    if not self.enabled:
+      return None, None
+    for kind, ext in (("exe", exe_ext), ("error", ERROR_EXT)):
+      entry = self._entry_path(key, ext)
+      try:
+        os.utime(entry)
+        if kind == "error":
+          with open(entry, "r") as fs:
+            value = fs.read()
+        else:
+          self.copy_to(entry, exe_file)
+          value = exe_file
+      except OSError:
+        continue  # not cached, or evicted in the meantime
+      self.hits += 1
+      COMPILE_CACHE_LOOKUPS.inc(result="hit")
+      return kind, value
+    self.misses += 1
+    COMPILE_CACHE_LOOKUPS.inc(result="miss")
+    return None, None
+
+  def _store(self, key, ext, write):
+    entry = self._entry_path(key, ext)
+    os.makedirs(path.dirname(entry), exist_ok=True)
+    tmp = entry + ".tmp" + random_string(8)
+    try:
+      write(tmp)
+      size = os.stat(tmp).st_size
+      os.replace(tmp, entry)
+    finally:
+      if path.exists(tmp):
+        os.remove(tmp)
+    if self.size is None or self.size + size > self.max_size or time.time() - self.walk_time > EVICT_INTERVAL:
+      self.evict()
+    else:
+      self.size += size
+
+  def store_executable(self, key, exe_ext, exe_file):
+    def write(tmp):
+      shutil.copyfile(exe_file, tmp)
+      os.chmod(tmp, 0o0775)
+
+    if self.enabled:
+      self._store(key, exe_ext, write)
+
+  def store_error(self, key, message):
+    def write(tmp):
+      with open(tmp, "w") as fs:
+        fs.write(message)
+
+    if self.enabled:
+      self._store(key, ERROR_EXT, write)
+
+  def evict(self):
+    self.walk_time = time.time()
+    entries, total = [], 0
+    for root, _, files in os.walk(self.directory):
+      for file in files:
+        try:
+          st = os.stat(path.join(root, file))
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, path.join(root, file)))
+        total += st.st_size
+    entries.sort()
+    for _, size, file in entries:
+      if total <= self.max_size:
+        break
+      try:
+        os.remove(file)
+      except OSError:
+        pass
+      total -= size
+    self.size = total
+
+  @staticmethod
+  def copy_to(entry, target):
+    """
+    Hard link when possible (same file system), copy otherwise.
+    """
+    try:
+      if path.exists(target):
+        os.remove(target)
+      os.link(entry, target)
+    except OSError:
+      shutil.copyfile(entry, target)
+      os.chmod(target, 0o0775)
+
+
+compile_cache = CompileCache(COMPILE_CACHE_BASE, COMPILE_CACHE_SIZE)
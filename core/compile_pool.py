@@ -0,0 +1,75 @@
+"""
+    Compile slots: the compiles of a node, whatever process they come from, run at most COMPILE_CONCURRENCY at a
+    time and on the CPUs of COMPILE_CPUS, so that a burst of compiles does not slow down the timed runs of other
+    judges, which are on EXECUTE_CPUS. A judge waits for its slot while the rest of it is set up.
+
+    A slot is an flock on COMPILE_SLOT_BASE/<index>.lock, as sandbox slots are (see core/slot.py). Compiles of the
+    same cache key are serialized by a lock of their own, taken with the slot, so that the second one finds the
+    result of the first in the compile cache instead of compiling again. Neither lock is held while waiting for
+    the other: a compile that finds its key locked gives its slot back until the key is free.
+"""
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+from os import path
+
+from config.config import COMPILE_SLOT_BASE, COMPILE_CONCURRENCY, COMPILE_CPUS, EXECUTE_CPUS
+from core.metrics import COMPILE_WAIT_SECONDS
+from core.util import parse_cpu_list
+
+COMPILE_CPU_SET = parse_cpu_list(COMPILE_CPUS)
+EXECUTE_CPU_SET = parse_cpu_list(EXECUTE_CPUS)
+KEY_LOCKS = 256  # keys share locks, but two compiles at the same time rarely do
+WAIT_INTERVAL = 0.05
+
+
+def _try_lock(lock_file):
+  lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o0600)
+  try:
+    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except BlockingIOError:
+    os.close(lock_fd)
+    return None
+  return lock_fd
+
+
+def _unlock(lock_fd):
+  fcntl.flock(lock_fd, fcntl.LOCK_UN)
+  os.close(lock_fd)
+
+
+def _wait_for_lock(lock_files, cancel_token=None):
+  """
+  :return: the fd of the first of lock_files that could be locked
+  """
+  while True:
+    for lock_file in lock_files:
+      lock_fd = _try_lock(lock_file)
+      if lock_fd is not None:
+        return lock_fd
+    if cancel_token is not None:
+      cancel_token.check()
+    time.sleep(WAIT_INTERVAL)
+
+
+@contextmanager
+def compile_slot(cache_key, cancel_token=None):
+  os.makedirs(COMPILE_SLOT_BASE, exist_ok=True)
+  key_file = path.join(COMPILE_SLOT_BASE, "key%d.lock" % (int(cache_key[:8], 16) % KEY_LOCKS))
+  slot_files = [path.join(COMPILE_SLOT_BASE, "%d.lock" % index) for index in range(max(COMPILE_CONCURRENCY, 1))]
+  start = time.perf_counter()
+  while True:
+    slot_fd = _wait_for_lock(slot_files, cancel_token)
+    key_fd = _try_lock(key_file)
+    if key_fd is not None:
+      break
+    # the key is being compiled: its end is waited for without holding a slot, then the slot is taken again
+    _unlock(slot_fd)
+    _unlock(_wait_for_lock([key_file], cancel_token))
+  COMPILE_WAIT_SECONDS.observe(time.perf_counter() - start)
+  try:
+    yield
+  finally:
+    _unlock(key_fd)
+    _unlock(slot_fd)
@@ -0,0 +1,151 @@
+"""
+    Checker daemon: one sandbox per case runner, in which lib/helpers/checker_daemon.py runs the checker for every
+    case it is asked to, instead of one sandbox per check.
+
+    Only the trusted workspace of the runner (where outputs and result files are) is mounted, read-write. For
+    every check, the input and answer of the case are hard-linked (or copied, from another file system) into a
+    directory of their own in the workspace, removed afterwards, so that the checker sees the files of its case
+    and of no other, as in a sandbox of its own. The result of a check is a Sandbox.Result, with the same limits
+    and verdicts as a checker run in a sandbox of its own, so that SpecialJudge.get_verdict_from_test_result
+    applies as is.
+
+    Any failure of the daemon raises CheckerDaemonError; the caller is expected to fall back to running
+    the checker in a sandbox of its own.
+"""
+import json
+import os
+import select
+import shutil
+from os import path
+from threading import Thread
+
+from config.config import LIB_BASE, Verdict
+from core.cancel import CancelToken
+from core.exception import CheckerDaemonError
+from core.submission import Result
+from core.timing import timed
+from core.util import make_temp_dir, random_string
+
+DAEMON_SCRIPT = path.join(LIB_BASE, "helpers", "checker_daemon.py")
+DAEMON_LIFETIME = 3600
+PYTHON_PATH = "/usr/bin/python3"
+
+
+class CheckerDaemon(object):
+
+  def __init__(self, checker, max_time, max_memory, workspace, cancel_token=None):
+    self.checker = checker
+    self.max_time = max_time
+    self.max_memory = max_memory
+    self.mounts = [(workspace, "/app/workspace")]
+    self.workspace = workspace
+    self.token = CancelToken(parent=cancel_token)
+    self.working_directory = None
+    self.request_fd = self.response_fd = None
+    self.response_buffer = b""
+    self.thread = None
+    self.result = None
+
+  def sandbox_path(self, file):
+    for host_directory, sandbox_directory in self.mounts:
+      if file.startswith(host_directory + "/"):
+        return sandbox_directory + file[len(host_directory):]
+    raise CheckerDaemonError("%s is not visible to the checker daemon" % file)
+
+  def start(self):
+    self.working_directory = make_temp_dir()
+    exe_name = path.basename(self.checker.exe_file)
+    command = self.checker.format_compile_command(self.checker.language_config["execute"], exe_name,
+                                                  self.working_directory)
+    daemon_in, self.request_fd = os.pipe()
+    self.response_fd, daemon_out = os.pipe()
+
+    def run_daemon():
+      try:
+        # the whole life of the daemon is a phase of its own, not an execution
+        with timed("checker_daemon"):
+          self.result = self.checker.run(
+            max_time=DAEMON_LIFETIME, max_memory=self.max_memory, working_directory=self.working_directory,
+            stdin_fd=daemon_in, stdout_fd=daemon_out, stderr_file="/dev/null",
+            exe_file=PYTHON_PATH, extra_arguments=["checker_daemon.py", "--"] + command,
+            extra_files=[(DAEMON_SCRIPT, "checker_daemon.py", "R"), (self.checker.exe_file, exe_name, "R")] +
+                        [(host, path.basename(sandbox), "B") for host, sandbox in self.mounts],
+            admitted=True, cancel_token=self.token)
+      except Exception as e:
+        self.result = e
+
+    self.thread = Thread(target=run_daemon, daemon=True)
+    self.thread.start()
+
+  def link_case_files(self, files):
+    """
+    :param files: a list of (file, name)
+    :return: the directory in the workspace where files are linked, by name
+    """
+    directory = path.join(self.workspace, "case_" + random_string(8))
+    os.makedirs(directory)
+    for file, name in files:
+      try:
+        os.link(file, path.join(directory, name))
+      except OSError:
+        shutil.copyfile(file, path.join(directory, name))  # e.g. from the hot case cache, on a tmpfs
+    return directory
+
+  def check(self, input_file, output_file, answer_file, result_file):
+    """
+    :return: a Sandbox.Result of the checker on a case
+    """
+    if self.thread is None:
+      self.start()
+    case_directory = None
+    try:
+      case_directory = self.link_case_files([(input_file, "in"), (answer_file, "ans")])
+      request = {"args": [self.sandbox_path(file) for file in (path.join(case_directory, "in"), output_file,
+                                                               path.join(case_directory, "ans"), result_file)],
+                 "time_limit": self.max_time}
+      os.write(self.request_fd, (json.dumps(request) + "\n").encode())
+      response = json.loads(self.read_line(timeout=self.max_time * 2 + 5).decode())
+    except (OSError, ValueError) as e:
+      self.stop()
+      raise CheckerDaemonError("checker daemon failed: %r, %r" % (e, self.result))
+    finally:
+      if case_directory is not None:
+        shutil.rmtree(case_directory, ignore_errors=True)
+
+    result = Result(response["time"], round(response["memory"] / 1024, 3), response["exit_code"], response["signal"])
+    if result.exit_code != 0:
+      result.verdict = Verdict.RUNTIME_ERROR
+    if result.memory > self.max_memory > 0:
+      result.verdict = Verdict.MEMORY_LIMIT_EXCEEDED
+    elif result.time > self.max_time > 0:
+      result.verdict = Verdict.TIME_LIMIT_EXCEEDED
+    elif response["wall_time"] > self.max_time * 2 > 0:
+      result.verdict = Verdict.IDLENESS_LIMIT_EXCEEDED
+    elif result.signal != 0:
+      result.verdict = Verdict.RUNTIME_ERROR
+    return result
+
+  def read_line(self, timeout):
+    while b"\n" not in self.response_buffer:
+      ready, _, _ = select.select([self.response_fd], [], [], timeout)
+      if not ready:
+        raise OSError("no response in %s seconds" % timeout)
+      data = os.read(self.response_fd, 4096)
+      if not data:
+        raise OSError("checker daemon exited")
+      self.response_buffer += data
+    line, self.response_buffer = self.response_buffer.split(b"\n", 1)
+    return line
+
+  def stop(self):
+    if self.thread is None:
+      return
+    os.close(self.request_fd)  # end of input, the daemon exits
+    self.thread.join(timeout=1)
+    if self.thread.is_alive():
+      self.token.cancel()
+      self.thread.join()
+    self.token.close()
+    os.close(self.response_fd)
+    self.thread = None
+    shutil.rmtree(self.working_directory, ignore_errors=True)
@@ -5,3 +5,15 @@ class CompileError(Exception):
 
   def __repr__(self):
     return 'CompileError: %s' % self.detail
+
+
+class QueueFullError(Exception):
+  pass
+
+
+class JudgeCancelled(Exception):
+  pass
+
+
+class CheckerDaemonError(Exception):
+  pass
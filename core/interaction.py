@@ -1,29 +1,143 @@
 import os
+import selectors
 from os import pipe
 from threading import Thread
 
-from config.config import Verdict
+from config.config import Verdict, INTERACTION_RECORD, USUAL_READ_SIZE
+from core.admission import admit
+from core.cancel import CancelToken
+from core.exception import JudgeCancelled
 from core.runner import CaseRunner
-
-
-def stream_proxy_run(record_file_name, input_fd, output_fd):
-  with open(record_file_name, "wb") as stream:
-    buffer_size = 65536
-    while True:
-      buffer = os.read(input_fd, buffer_size)
-      if not buffer:
-        break
-      stream.write(buffer)
-      os.write(output_fd, buffer)
-  os.close(input_fd)
-  os.close(output_fd)
+from core.timing import timed
+
+BUFFER_SIZE = 65536
+# what read_output_as_b64 might read from a record: USUAL_READ_SIZE characters and one more, in utf-8
+REPORT_RECORD_SIZE = (USUAL_READ_SIZE + 2) * 4
+
+
+class ProxyChannel(object):
+  """
+  One direction of the interaction: bytes read from input_fd are written to output_fd,
+  and the first record_limit bytes of them (all if negative) are recorded as well.
+
+  Both fds are non-blocking. Once nothing has to be recorded any more, the bytes are moved by splice(2),
+  without being copied through user space, if the platform supports it.
+  """
+
+  def __init__(self, input_fd, output_fd, record_file_name, record_limit=-1):
+    self.input_fd = input_fd
+    self.output_fd = output_fd
+    self.record = open(record_file_name, "wb") if record_limit != 0 else None
+    self.record_remaining = record_limit
+    self.pending = b""
+    self.output_full = False
+    self.output_closed = False
+    os.set_blocking(input_fd, False)
+    os.set_blocking(output_fd, False)
+
+  @property
+  def splicing(self):
+    return hasattr(os, "splice") and self.record_remaining == 0 and not self.output_closed
+
+  def waiting_for(self):
+    if self.pending or self.output_full:
+      return self.output_fd, selectors.EVENT_WRITE
+    return self.input_fd, selectors.EVENT_READ
+
+  def forward(self):
+    """
+    Move as many bytes as possible without blocking.
+
+    :return: False when the channel is closed
+    """
+    try:
+      if self.pending:
+        self.pending = self.pending[os.write(self.output_fd, self.pending):]
+        self.output_full = bool(self.pending)
+      elif self.splicing:
+        self.output_full = False
+        if not os.splice(self.input_fd, self.output_fd, BUFFER_SIZE,
+                         flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK):
+          return self.close()
+      else:
+        buffer = os.read(self.input_fd, BUFFER_SIZE)
+        if not buffer:
+          return self.close()
+        if not self.output_closed:
+          self.write_record(buffer)
+          try:
+            self.pending = buffer[os.write(self.output_fd, buffer):]
+          except BlockingIOError:
+            # the output is full: what was read (and recorded) is written once it is writable again
+            self.pending = buffer
+            self.output_full = True
+    except BlockingIOError:
+      # input is known to be readable, so splice can only be blocked by a full output
+      self.output_full = self.splicing
+    except BrokenPipeError:
+      # the reader is gone: whatever the writer still has to say is drained and dropped,
+      # so that it is not killed by SIGPIPE for writing to a program that has already finished
+      self.output_closed = True
+      self.output_full = False
+      self.pending = b""
+      os.close(self.output_fd)
+    return True
+
+  def write_record(self, buffer):
+    if self.record_remaining < 0:
+      self.record.write(buffer)
+    elif self.record_remaining > 0:
+      self.record.write(buffer[:self.record_remaining])
+      self.record_remaining -= min(len(buffer), self.record_remaining)
+      if not self.record_remaining:
+        self.record.close()
+
+  def close(self):
+    os.close(self.input_fd)
+    if not self.output_closed:
+      os.close(self.output_fd)
+    if self.record is not None:
+      self.record.close()
+    return False
+
+
+def stream_proxy_run(channels):
+  """
+  Run all channels in one event loop, until every one of them is closed.
+  """
+  selector = selectors.DefaultSelector()
+  for channel in channels:
+    selector.register(*channel.waiting_for(), data=channel)
+  running = len(channels)
+  while running:
+    for key, _ in selector.select():
+      selector.unregister(key.fd)
+      if key.data.forward():
+        selector.register(*key.data.waiting_for(), data=key.data)
+      else:
+        running -= 1
+  selector.close()
 
 
 class InteractiveRunner(CaseRunner):
 
-  def __init__(self, submission, interactor, checker, max_time, max_memory, report_file=None):
-    super().__init__(submission, checker, max_time, max_memory, report_file=report_file)
+  def __init__(self, submission, interactor, checker, max_time, max_memory, report_file=None,
+               record=INTERACTION_RECORD, cancel_token=None, checker_daemon=False):
+    """
+    :param record: "full" to record the whole interaction, "report" to record only what is shown in the
+                   report, "off" not to record at all; nothing is recorded if there is no report
+    """
+    super().__init__(submission, checker, max_time, max_memory, report_file=report_file,
+                     cancel_token=cancel_token, checker_daemon=checker_daemon)
     self.interactor = interactor
+    self.record = record
+
+  def get_record_limit(self):
+    if self.report_file is None or self.record == "off":
+      return 0
+    if self.record == "report":
+      return REPORT_RECORD_SIZE
+    return -1
 
   def initiate_case(self, case):
     super().initiate_case(case)
@@ -42,35 +156,52 @@ class InteractiveRunner(CaseRunner):
     proxy2_rd, int_wr = pipe()
     sub_rd, proxy2_wr = pipe()
     results = [None, None]
+    # the interactor is killed as soon as the submission fails, as its result does not matter any more
+    interactor_token = CancelToken(parent=self.cancel_token)
 
     def run_submission_helper():
-      results[0] = self.submission.run(max_time=self.max_time, max_memory=self.max_memory,
-                                       stdin_fd=sub_rd, stdout_fd=sub_wr,
-                                       stderr_file=running_stderr, working_directory=self.workspace)
+      try:
+        results[0] = self.submission.run(max_time=self.max_time, max_memory=self.max_memory,
+                                         stdin_fd=sub_rd, stdout_fd=sub_wr,
+                                         stderr_file=running_stderr, working_directory=self.workspace,
+                                         admitted=True, cancel_token=self.cancel_token)
+      except JudgeCancelled:
+        return
+      if results[0].verdict != Verdict.ACCEPTED:
+        interactor_token.cancel()
 
     def run_interaction_helper():
-      results[1] = self.interactor.run(
-        stdin_fd=int_rd, stdout_fd=int_wr, stderr_file="/dev/null",
-        max_time=self.max_time, max_memory=self.max_memory, working_directory=self.trusted_workspace,
-        extra_files=[(self.case.input_file, "in", "R"), (running_output, "out", "B"),
-                     (self.case.output_file, "ans", "R"), (interactor_result_file, "result", "B")],
-        extra_arguments=["in", "out", "ans", "result"]
-      )
-
+      try:
+        results[1] = self.interactor.run(
+          stdin_fd=int_rd, stdout_fd=int_wr, stderr_file="/dev/null",
+          max_time=self.max_time, max_memory=self.max_memory, working_directory=self.trusted_workspace,
+          extra_files=[(self.case.input_file, "in", "R"), (running_output, "out", "B"),
+                       (self.case.output_file, "ans", "R"), (interactor_result_file, "result", "B")],
+          extra_arguments=["in", "out", "ans", "result"], admitted=True, cancel_token=interactor_token
+        )
+      except JudgeCancelled:
+        pass
+
+    record_limit = self.get_record_limit()
+    channels = [ProxyChannel(proxy1_rd, proxy1_wr, record_out, record_limit),
+                ProxyChannel(proxy2_rd, proxy2_wr, record_in, record_limit)]
     process1 = Thread(target=run_submission_helper)
     process2 = Thread(target=run_interaction_helper)
-    proxy1 = Thread(target=stream_proxy_run, args=(record_out, proxy1_rd, proxy1_wr))
-    proxy2 = Thread(target=stream_proxy_run, args=(record_in, proxy2_rd, proxy2_wr))
-
-    process1.start()
-    process2.start()
-    proxy1.start()
-    proxy2.start()
 
-    process1.join()
-    process2.join()
-    proxy1.join()
-    proxy2.join()
+    # both halves are admitted at once, as neither can go on without the other
+    reservation = admit(2 * (self.max_memory + 32), 2, self.cancel_token)
+    try:
+      process1.start()
+      process2.start()
+      stream_proxy_run(channels)
+
+      process1.join()
+      process2.join()
+    finally:
+      reservation.release()
+    interactor_token.close()
+    if self.cancel_token is not None:
+      self.cancel_token.check()
 
     running_result, interactor_result = results
     if running_result.verdict != Verdict.ACCEPTED:
@@ -80,9 +211,11 @@ class InteractiveRunner(CaseRunner):
       result = {"verdict": interactor_result.verdict, "time": running_result.time, "memory": running_result.memory}
       checker_message = ""
     else:
-      result = self.do_check(running_output, running_result)
+      with timed("check"):
+        result = self.do_check(running_output, running_result)
       checker_message = result.pop('message', '')
     if self.report_file:
-      self.write_report(running_output, running_stderr, running_result, result, checker_message,
-                        interacts=[record_in, record_out])
+      with timed("report"):
+        self.write_report(running_output, running_stderr, running_result, result, checker_message,
+                          interacts=[record_in, record_out])
     return result
@@ -0,0 +1,129 @@
+"""
+    A crash-safe judge job queue on SQLite.
+
+    Jobs are pushed by the web workers and popped by the judge worker processes (see worker.py).
+    A popped job stays in the table, marked with the worker that took it, until it is finished.
+    Jobs of a worker that died are requeued, unless they have been tried too many times already.
+"""
+import json
+import os
+import sqlite3
+import time
+from os import path
+
+from config.config import QUEUE_FILE, QUEUE_SIZE
+from core.exception import QueueFullError
+
+MAX_ATTEMPTS = 3
+
+
+class JobQueue(object):
+
+  def __init__(self, db_file=QUEUE_FILE, max_size=QUEUE_SIZE):
+    self.db_file = db_file
+    self.max_size = max_size
+    os.makedirs(path.dirname(db_file), exist_ok=True)
+    db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+    try:
+      db.execute("PRAGMA journal_mode=WAL")
+    finally:
+      db.close()
+    with self.connect() as db:
+      db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "fingerprint TEXT NOT NULL, payload TEXT NOT NULL, worker INTEGER, "
+                 "attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL)")
+      db.execute("CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint)")
+
+  def connect(self):
+    return _Transaction(sqlite3.connect(self.db_file, timeout=30, isolation_level=None))
+
+  def push(self, fingerprint, args, kwargs):
+    with self.connect() as db:
+      waiting, = db.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NULL").fetchone()
+      if waiting >= self.max_size:
+        raise QueueFullError("judge queue is full (%d jobs waiting)" % waiting)
+      db.execute("INSERT INTO jobs (fingerprint, payload, created) VALUES (?, ?, ?)",
+                 (fingerprint, json.dumps([args, kwargs]), time.time()))
+
+  def pop(self, worker):
+    """
+    :return: a tuple (job id, fingerprint, args, kwargs), or None if there is no job waiting
+    """
+    with self.connect() as db:
+      row = db.execute("SELECT id, fingerprint, payload FROM jobs WHERE worker IS NULL "
+                       "ORDER BY id LIMIT 1").fetchone()
+      if row is None:
+        return None
+      job_id, fingerprint, payload = row
+      db.execute("UPDATE jobs SET worker = ?, attempts = attempts + 1 WHERE id = ?", (worker, job_id))
+    args, kwargs = json.loads(payload)
+    return job_id, fingerprint, args, kwargs
+
+  def finish(self, job_id):
+    with self.connect() as db:
+      db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+  def remove(self, fingerprint):
+    """
+    Remove the waiting jobs of a fingerprint
+
+    :return: whether there was any
+    """
+    with self.connect() as db:
+      removed = db.execute("DELETE FROM jobs WHERE fingerprint = ? AND worker IS NULL", (fingerprint,)).rowcount
+    return removed > 0
+
+  def requeue(self, worker=None):
+    """
+    Put the jobs taken by a worker (every worker if None) back to the queue.
+
+    :return: fingerprints of the jobs that are dropped because they have been tried too many times
+    """
+    condition, params = ("worker IS NOT NULL", ()) if worker is None else ("worker = ?", (worker,))
+    with self.connect() as db:
+      dropped = [fingerprint for fingerprint, in db.execute(
+        "SELECT fingerprint FROM jobs WHERE %s AND attempts >= ?" % condition, params + (MAX_ATTEMPTS,))]
+      db.execute("DELETE FROM jobs WHERE %s AND attempts >= ?" % condition, params + (MAX_ATTEMPTS,))
+      db.execute("UPDATE jobs SET worker = NULL WHERE %s" % condition, params)
+    return dropped
+
+  def position(self, fingerprint):
+    """
+    :return: number of jobs ahead of a waiting job, or None if it is not waiting
+    """
+    with self.connect() as db:
+      row = db.execute("SELECT id FROM jobs WHERE fingerprint = ? AND worker IS NULL "
+                       "ORDER BY id DESC LIMIT 1", (fingerprint,)).fetchone()
+      if row is None:
+        return None
+      ahead, = db.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NULL AND id < ?", row).fetchone()
+    return ahead
+
+  def waiting_count(self):
+    with self.connect() as db:
+      count, = db.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NULL").fetchone()
+    return count
+
+  def running_count(self):
+    with self.connect() as db:
+      count, = db.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NOT NULL").fetchone()
+    return count
+
+
+class _Transaction(object):
+  """
+  An immediate transaction, committed on success and rolled back on error, closing the connection afterwards
+  """
+
+  def __init__(self, db):
+    self.db = db
+
+  def __enter__(self):
+    self.db.execute("BEGIN IMMEDIATE")
+    return self.db
+
+  def __exit__(self, exc_type, *args):
+    try:
+      self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+    finally:
+      self.db.close()
@@ -34,10 +34,12 @@
     - message: compile error message and, most importantly, result file content (first 512 bytes)
 
 """
-from os import path, listdir
+from os import path
 
-from config.config import Verdict, SPJ_BASE, LANGUAGE_CONFIG, LIB_BASE
-from core.submission import Submission
+from config.config import Verdict, SPJ_BASE, LANGUAGE_CONFIG, USUAL_READ_SIZE
+from core.compare import compare_files
+from core.registry import spj_registry
+from core.submission import Submission, Result
 
 
 class SpecialJudge(Submission):
@@ -55,23 +57,14 @@ class SpecialJudge(Submission):
 
   @classmethod
   def fromExistingFingerprint(cls, fingerprint):
-    exe_file, lang = None, None
-    for directory in [SPJ_BASE, LIB_BASE]:
-      # search lib base for more
-      for file in listdir(directory):
-        if file.startswith(fingerprint + "."):
-          exe_file = path.join(directory, file)
-          file_ext = exe_file.split(".")[-1]
-          for candidate_lang in LANGUAGE_CONFIG:
-            if LANGUAGE_CONFIG[candidate_lang]["exe_ext"] == file_ext:
-              lang = candidate_lang
-              break
-          if lang:
-            break
-      if exe_file and lang:
-        break
-    if not exe_file or not lang:
+    if fingerprint in BUILTIN_CHECKERS:
+      return BUILTIN_CHECKERS[fingerprint]()
+    entry = spj_registry.get(fingerprint)
+    if entry is None:
       raise FileNotFoundError("SPJ fingerprint does not exist")
+    exe_file, lang = entry["path"], entry["lang"]
+    if not path.isfile(exe_file):
+      raise FileNotFoundError("SPJ executable is missing: %s" % exe_file)
     return cls(lang, exe_file=exe_file)
 
   def get_verdict_from_test_result(self, checker_result):
@@ -89,3 +82,32 @@ class SpecialJudge(Submission):
         return checker_result.verdict
       return Verdict.WRONG_ANSWER
     return Verdict.ACCEPTED
+
+
+class BuiltinChecker(SpecialJudge):
+  """
+  A checker that runs inside the judge process, without exe file or sandbox.
+  """
+
+  def __init__(self, compare):
+    self.lang = None
+    self.language_config = None
+    self.exe_file = None
+    self.compare = compare
+
+  def check(self, input_file, output_file, answer_file):
+    """
+    :return: a tuple (Sandbox.Result, message), the same as running the checker and reading its result file
+    """
+    exit_code, message = self.compare(output_file, answer_file)
+    try:
+      message = message.decode()[:USUAL_READ_SIZE]
+    except UnicodeDecodeError:
+      message = ''
+    return Result(0, 0, exit_code, 0, Verdict.RUNTIME_ERROR if exit_code else Verdict.ACCEPTED), message
+
+
+BUILTIN_CHECKERS = {
+  # same as lib/defaultspj.cpp
+  'builtin': lambda: BuiltinChecker(compare_files),
+}
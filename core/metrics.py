@@ -0,0 +1,342 @@
+"""
+    Metrics in the Prometheus text format, aggregated across processes.
+
+    Every process (gunicorn workers, judge workers) keeps its metrics in memory, and a background thread
+    writes them to METRICS_BASE/<pid>-<start time>.json every METRICS_FLUSH_INTERVAL seconds, the start time
+    telling a process from another one that got its pid later. render() adds up the snapshots of all
+    processes: counters and histograms are summed, including those of processes that have exited, which are
+    folded into METRICS_BASE/retired.json (and their snapshots removed), while gauges are only taken from
+    processes that are alive. Values that are only meaningful when scraped (queue depth, disk usage) come
+    from collectors, called by the process rendering.
+"""
+import atexit
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from os import path
+
+from config.config import METRICS_BASE, METRICS_FLUSH_INTERVAL, TMP_BASE, SLOT_BASE
+from core import timing
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+RETIRED_FILE = "retired.json"
+DISK_USAGE_MAX_AGE = 60
+
+
+def _start_time(pid):
+  """
+  :return: when process pid started, in clock ticks since boot, or None if there is no such process
+  """
+  try:
+    with open("/proc/%d/stat" % pid) as fs:
+      return int(fs.read().rsplit(")", 1)[1].split()[19])
+  except (OSError, ValueError, IndexError):
+    return None
+
+
+class _Registry(object):
+
+  def __init__(self):
+    self.metrics = []
+    self.collectors = []
+    self.pid = None
+    self.snapshot_name = None
+    self.lock = threading.Lock()
+
+  def ensure_started(self):
+    """
+    Start the flushing thread of this process; values inherited from a parent process are dropped
+    """
+    if self.pid == os.getpid():
+      return
+    with self.lock:
+      if self.pid == os.getpid():
+        return
+      for metric in self.metrics:
+        metric.values = {}
+        metric.lock = threading.Lock()
+      self.pid = os.getpid()
+      self.snapshot_name = "%d-%d.json" % (self.pid, _start_time(self.pid))
+      threading.Thread(target=self.flush_forever, daemon=True).start()
+
+  def flush_forever(self):
+    pid = self.pid
+    while pid == os.getpid():
+      time.sleep(METRICS_FLUSH_INTERVAL)
+      try:
+        self.flush()
+      except OSError:
+        pass
+
+  def snapshot(self):
+    return {metric.name: metric.snapshot() for metric in self.metrics}
+
+  def flush(self):
+    if self.pid != os.getpid():
+      return
+    os.makedirs(METRICS_BASE, exist_ok=True)
+    snapshot_file = path.join(METRICS_BASE, self.snapshot_name)
+    with open(snapshot_file + ".tmp", "w") as fs:
+      json.dump(self.snapshot(), fs)
+    os.replace(snapshot_file + ".tmp", snapshot_file)
+
+
+_registry = _Registry()
+atexit.register(_registry.flush)
+
+
+class _Metric(object):
+  kind = None
+
+  def __init__(self, name, documentation, labels=()):
+    self.name = name
+    self.documentation = documentation
+    self.labels = tuple(labels)
+    self.values = {}
+    self.lock = threading.Lock()
+    _registry.metrics.append(self)
+
+  def key(self, labels):
+    _registry.ensure_started()
+    return tuple(str(labels[label]) for label in self.labels)
+
+  def snapshot(self):
+    with self.lock:
+      return {"kind": self.kind, "documentation": self.documentation, "labels": self.labels,
+              "values": [[list(key), value] for key, value in self.values.items()]}
+
+
+class Counter(_Metric):
+  kind = "counter"
+
+  def inc(self, amount=1, **labels):
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+  kind = "gauge"
+
+  def inc(self, amount=1, **labels):
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0) + amount
+
+  def dec(self, amount=1, **labels):
+    self.inc(-amount, **labels)
+
+  def set(self, value, **labels):
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = value
+
+
+class Histogram(_Metric):
+  """
+  Values are kept as [count of every bucket (not cumulative)..., count above the last bucket, sum]
+  """
+  kind = "histogram"
+
+  def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labels)
+    self.buckets = tuple(buckets)
+
+  def observe(self, value, **labels):
+    key = self.key(labels)
+    with self.lock:
+      counts = self.values.get(key)
+      if counts is None:
+        counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+      counts[bisect_left(self.buckets, value)] += 1
+      counts[-1] += value
+
+  @contextmanager
+  def time(self, **labels):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, **labels)
+
+  def snapshot(self):
+    snapshot = super().snapshot()
+    snapshot["buckets"] = self.buckets
+    return snapshot
+
+
+def register_collector(collector):
+  """
+  :param collector: a function returning a list of (name, kind, documentation, [(labels dict, value)]),
+                    called whenever the metrics are rendered
+  """
+  _registry.collectors.append(collector)
+
+
+def _format_labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ""
+  escape = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+  return "{%s}" % ",".join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+def _format_value(value):
+  if isinstance(value, float) and value.is_integer():
+    return repr(int(value)) if abs(value) < 1e15 else repr(value)
+  return repr(value)
+
+
+def _read_snapshot(file):
+  try:
+    with open(file) as fs:
+      return json.load(fs)
+  except (OSError, ValueError):
+    return None
+
+
+def _add_snapshot(merged, snapshot, gauges=True):
+  for name, metric in snapshot.items():
+    if metric["kind"] == "gauge" and not gauges:
+      continue
+    target = merged.setdefault(name, dict(metric, values={}))
+    for key, value in metric["values"]:
+      key = tuple(key)
+      if metric["kind"] == "histogram":
+        counts = target["values"].setdefault(key, [0] * len(value))
+        target["values"][key] = [a + b for a, b in zip(counts, value)]
+      else:
+        target["values"][key] = target["values"].get(key, 0) + value
+
+
+def _retire(base, files):
+  """
+  Fold the counters and histograms of snapshots of processes that have exited into the retired snapshot,
+  and remove them
+  """
+  lock_fd = os.open(path.join(base, ".lock"), os.O_RDWR | os.O_CREAT, 0o0644)
+  try:
+    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+    retired = {}
+    _add_snapshot(retired, _read_snapshot(path.join(base, RETIRED_FILE)) or {}, gauges=False)
+    files = [file for file in files if path.exists(path.join(base, file))]  # or retired by another process
+    for file in files:
+      _add_snapshot(retired, _read_snapshot(path.join(base, file)) or {}, gauges=False)
+    for metric in retired.values():
+      metric["values"] = [[list(key), value] for key, value in metric["values"].items()]
+    with open(path.join(base, RETIRED_FILE + ".tmp"), "w") as fs:
+      json.dump(retired, fs)
+    os.replace(path.join(base, RETIRED_FILE + ".tmp"), path.join(base, RETIRED_FILE))
+    for file in files:
+      os.remove(path.join(base, file))
+  finally:
+    os.close(lock_fd)
+
+
+def _merge_snapshots(base=METRICS_BASE):
+  merged = {}
+  if not path.isdir(base):
+    return merged
+  dead = []
+  for file in os.listdir(base):
+    if not file.endswith(".json") or file == RETIRED_FILE:
+      continue
+    try:
+      pid, start_time = map(int, file[:-len(".json")].split("-"))
+    except ValueError:
+      continue
+    if _start_time(pid) != start_time:
+      dead.append(file)
+  if dead:
+    _retire(base, dead)
+  for file in os.listdir(base):
+    if file.endswith(".json"):
+      _add_snapshot(merged, _read_snapshot(path.join(base, file)) or {})
+  return merged
+
+
+def render():
+  """
+  :return: metrics of every process, in Prometheus text format
+  """
+  _registry.ensure_started()
+  _registry.flush()
+  lines = []
+  for name, metric in sorted(_merge_snapshots().items()):
+    lines.append("# HELP %s %s" % (name, metric["documentation"]))
+    lines.append("# TYPE %s %s" % (name, metric["kind"]))
+    for key, value in sorted(metric["values"].items()):
+      if metric["kind"] != "histogram":
+        lines.append("%s%s %s" % (name, _format_labels(metric["labels"], key), _format_value(value)))
+        continue
+      cumulative = 0
+      for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value[:-1]):
+        cumulative += count
+        le = bound if bound == "+Inf" else _format_value(float(bound))
+        lines.append("%s_bucket%s %d" % (name, _format_labels(metric["labels"], key, [("le", le)]), cumulative))
+      lines.append("%s_sum%s %s" % (name, _format_labels(metric["labels"], key), _format_value(value[-1])))
+      lines.append("%s_count%s %d" % (name, _format_labels(metric["labels"], key), cumulative))
+  for collector in _registry.collectors:
+    for name, kind, documentation, samples in collector():
+      lines.append("# HELP %s %s" % (name, documentation))
+      lines.append("# TYPE %s %s" % (name, kind))
+      for labels, value in samples:
+        lines.append("%s%s %s" % (name, _format_labels(labels.keys(), labels.values()), _format_value(value)))
+  return "\n".join(lines) + "\n"
+
+
+_tmp_bytes = [0, 0]  # the size of the temporary directories, and when it was measured
+
+
+def _disk_usage():
+  tmp_dirs = 0
+  # walking every workspace is costly: it is done at most once per DISK_USAGE_MAX_AGE
+  walk = not _tmp_bytes[1] or time.monotonic() - _tmp_bytes[1] > DISK_USAGE_MAX_AGE
+  tmp_bytes = 0
+  if path.isdir(TMP_BASE):
+    for entry in os.scandir(TMP_BASE):
+      if entry.path == SLOT_BASE:
+        continue
+      tmp_dirs += 1
+      if not walk:
+        continue
+      for root, _, files in os.walk(entry.path):
+        for file in files:
+          try:
+            tmp_bytes += os.lstat(path.join(root, file)).st_size
+          except OSError:
+            pass
+  if walk:
+    _tmp_bytes[:] = [tmp_bytes, time.monotonic()]
+  samples = [("ejudge_tmp_dirs", "gauge", "Temporary directories (workspaces, compile directories) in use",
+              [({}, tmp_dirs)]),
+             ("ejudge_tmp_bytes", "gauge", "Size of the files in temporary directories, measured at most once "
+                                           "per minute", [({}, _tmp_bytes[0])])]
+  try:
+    usage = shutil.disk_usage(path.dirname(TMP_BASE))
+    samples.append(("ejudge_disk_bytes", "gauge", "Disk space of the file system of the run directory",
+                    [({"state": "used"}, usage.used), ({"state": "free"}, usage.free)]))
+  except OSError:
+    pass
+  return samples
+
+
+register_collector(_disk_usage)
+
+PHASE_SECONDS = Histogram("ejudge_phase_seconds", "Time spent in each phase of judging", ["phase"])
+CASE_SECONDS = Histogram("ejudge_case_seconds", "Time to run, check and report a case", ["runner"])
+SUBMISSIONS = Counter("ejudge_submissions_total", "Submissions judged", ["lang", "verdict"])
+CASES = Counter("ejudge_cases_total", "Cases judged", ["lang", "verdict"])
+SANDBOXES_IN_FLIGHT = Gauge("ejudge_sandboxes_in_flight", "Sandboxed processes running")
+CACHE_WRITE_SECONDS = Histogram("ejudge_cache_write_seconds", "Latency of judge status writes to memcached")
+COMPILE_CACHE_LOOKUPS = Counter("ejudge_compile_cache_lookups_total", "Compile cache lookups", ["result"])
+ADMISSION_WAIT_SECONDS = Histogram("ejudge_admission_wait_seconds", "Time waiting for sandbox admission")
+COMPILE_WAIT_SECONDS = Histogram("ejudge_compile_wait_seconds", "Time waiting for a compile slot")
+CASE_CACHE_LOOKUPS = Counter("ejudge_case_cache_lookups_total", "Hot case cache lookups", ["result"])
+
+timing.add_listener(lambda phase, seconds: PHASE_SECONDS.observe(seconds, phase=phase))
@@ -0,0 +1,86 @@
+"""
+    A pool of case runners, each owning its own workspace.
+
+    Cases are handed out to at most `size` runners at the same time, and their results are yielded back
+    in the order the cases were given, so that the caller can keep the sequential semantics
+    (stopping at the first failure, skipping groups) while several cases are in flight.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from queue import Queue
+
+from core.metrics import CASE_SECONDS
+
+
+class CaseRunnerPool(object):
+
+  def __init__(self, make_runner, size=1):
+    self.size = max(int(size), 1)
+    self.runners = []
+    self.idle_runners = Queue()
+    self.pending = deque()
+    self.executor = ThreadPoolExecutor(max_workers=self.size) if self.size > 1 else None
+    for _ in range(self.size):
+      runner = make_runner()
+      self.runners.append(runner)
+      self.idle_runners.put(runner)
+
+  def run_case(self, case):
+    """
+    :return: a tuple (result, report), where report is the report text of this case only
+    """
+    runner = self.idle_runners.get()
+    try:
+      if runner.report_file is not None:
+        runner.report_file = StringIO()
+      with CASE_SECONDS.time(runner=type(runner).__name__):
+        result = runner.run(case)
+      report = runner.report_file.getvalue() if runner.report_file is not None else ''
+      return result, report
+    finally:
+      self.idle_runners.put(runner)
+
+  def imap(self, cases, skip=None):
+    """
+    Run cases with at most `size` of them in flight, and yield (result, report) in the original order.
+
+    :param cases: an iterable of cases, consumed lazily
+    :param skip: a function taking the index of a case, evaluated right before the case is scheduled;
+                 skipped cases are not run and yield (None, '')
+    """
+    for case_idx, case in enumerate(cases):
+      if skip is not None and skip(case_idx):
+        self.pending.append(None)
+      elif self.executor is None:
+        self.pending.append(self.run_case(case))
+      else:
+        self.pending.append(self.executor.submit(self.run_case, case))
+      while len(self.pending) >= self.size:
+        yield self._pop_result()
+    while self.pending:
+      yield self._pop_result()
+
+  def _pop_result(self):
+    head = self.pending.popleft()
+    if head is None:
+      return None, ''
+    if isinstance(head, tuple):
+      return head
+    return head.result()
+
+  def shutdown(self):
+    """
+    Cancel the cases that are not started yet, and wait for those that are running.
+    """
+    while self.pending:
+      head = self.pending.popleft()
+      if head is not None and not isinstance(head, tuple):
+        head.cancel()
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
+
+  def clean(self):
+    self.shutdown()
+    for runner in self.runners:
+      runner.clean()
@@ -0,0 +1,162 @@
+"""
+    A persistent index of compiled checkers and interactors: fingerprint -> path, language and checksum.
+
+    Checkers are looked up by fingerprint in SPJ_BASE, then in LIB_BASE. Instead of listing both directories
+    on every lookup, the index remembers the mtimes of the directories it was built from: as long as neither
+    directory is modified, a lookup is a dict access after two stats. When one is, the index is reloaded from
+    the index file if another process has brought it up to date already, and rebuilt otherwise.
+    Checksums of files that are not modified are carried over when the index is rebuilt.
+
+    Only the files right in the directories are checkers, those whose extension is the exe_ext of a language:
+    LIB_BASE keeps what is not a checker (headers, the checker daemon) in subdirectories.
+"""
+import fcntl
+import hashlib
+import json
+import os
+from os import path
+
+from config.config import SPJ_BASE, LIB_BASE, LANGUAGE_CONFIG, SPJ_INDEX_FILE
+
+CHUNK_SIZE = 1 << 20
+
+
+def _file_checksum(file):
+  sha256 = hashlib.sha256()
+  with open(file, "rb") as fs:
+    for chunk in iter(lambda: fs.read(CHUNK_SIZE), b""):
+      sha256.update(chunk)
+  return sha256.hexdigest()
+
+
+def _language_of(file):
+  file_ext = file.split(".")[-1]
+  for lang in LANGUAGE_CONFIG:
+    if LANGUAGE_CONFIG[lang]["exe_ext"] == file_ext:
+      return lang
+  return None
+
+
+class SpjRegistry(object):
+
+  def __init__(self, directories=(SPJ_BASE, LIB_BASE), index_file=SPJ_INDEX_FILE):
+    self.directories = list(directories)   # in the order of preference
+    self.index_file = index_file
+    self.lock_file = index_file + ".lock"
+    self.mtimes = None
+    self.entries = {}
+
+  def _directory_mtimes(self):
+    mtimes = []
+    for directory in self.directories:
+      try:
+        mtimes.append(os.stat(directory).st_mtime_ns)
+      except FileNotFoundError:
+        mtimes.append(None)
+    return mtimes
+
+  def _lock(self):
+    os.makedirs(path.dirname(self.index_file), exist_ok=True)
+    lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o0644)
+    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+    return lock_fd
+
+  def _unlock(self, lock_fd):
+    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    os.close(lock_fd)
+
+  def _load(self):
+    try:
+      with open(self.index_file) as fs:
+        index = json.load(fs)
+      return index["mtimes"], index["entries"]
+    except (OSError, ValueError, KeyError):
+      return None, {}
+
+  def _save(self):
+    tmp_file = "%s.%d.tmp" % (self.index_file, os.getpid())
+    with open(tmp_file, "w") as fs:
+      json.dump({"mtimes": self.mtimes, "entries": self.entries}, fs)
+    os.replace(tmp_file, self.index_file)
+
+  def _rebuild(self, old_entries):
+    # the mtimes are taken before listing, so that a change during the scan triggers another one
+    mtimes = self._directory_mtimes()
+    entries = {}
+    for directory in reversed(self.directories):
+      if not path.isdir(directory):
+        continue
+      for file in os.listdir(directory):
+        fingerprint, _, _ = file.rpartition(".")
+        lang = _language_of(file)
+        if not fingerprint or lang is None:
+          continue
+        exe_file = path.join(directory, file)
+        entry = self._make_entry(exe_file, lang, old_entries.get(fingerprint))
+        if entry is not None:
+          entries[fingerprint] = entry
+    self.mtimes, self.entries = mtimes, entries
+
+  def _make_entry(self, exe_file, lang, old_entry=None):
+    try:
+      mtime = os.stat(exe_file).st_mtime_ns
+      if old_entry and old_entry["path"] == exe_file and old_entry["mtime"] == mtime:
+        checksum = old_entry["checksum"]
+      else:
+        checksum = _file_checksum(exe_file)
+    except FileNotFoundError:
+      return None
+    return {"path": exe_file, "lang": lang, "checksum": checksum, "mtime": mtime}
+
+  def refresh(self):
+    """
+    Make sure the index reflects the directories
+    """
+    mtimes = self._directory_mtimes()
+    if mtimes == self.mtimes:
+      return
+    lock_fd = self._lock()
+    try:
+      saved_mtimes, saved_entries = self._load()
+      if saved_mtimes == mtimes:
+        self.mtimes, self.entries = saved_mtimes, saved_entries
+      else:
+        self._rebuild(saved_entries)
+        self._save()
+    finally:
+      self._unlock(lock_fd)
+
+  def add(self, fingerprint, lang, exe_file):
+    """
+    Record a checker just compiled into exe_file, so that the next lookups do not have to rebuild the index
+    """
+    lock_fd = self._lock()
+    try:
+      _, saved_entries = self._load()
+      entry = self._make_entry(exe_file, lang)
+      if entry is not None:
+        saved_entries[fingerprint] = entry
+      # the directory is listed again anyway, as it might have been changed by others as well,
+      # but the checksums of all unchanged files are reused
+      self._rebuild(saved_entries)
+      self._save()
+    finally:
+      self._unlock(lock_fd)
+
+  def get(self, fingerprint):
+    """
+    :return: a dict with path, lang and checksum, or None if the fingerprint does not exist
+    """
+    self.refresh()
+    return self.entries.get(fingerprint)
+
+  def list(self, directory=SPJ_BASE):
+    """
+    :return: file names of the checkers in a directory
+    """
+    self.refresh()
+    return [path.basename(entry["path"]) for entry in self.entries.values()
+            if path.dirname(entry["path"]) == directory]
+
+
+spj_registry = SpjRegistry()
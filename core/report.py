@@ -0,0 +1,110 @@
+"""
+    Reports of a submission are stored on disk, case by case, as they are written.
+
+    In the directory of a submission, "data" holds the report lines in the order cases finish, and "index"
+    holds a fixed-size (offset, length) record for every case, at the position of the case in the case list,
+    so that one case or a range of cases can be read without touching the rest. Cases that are not run
+    (skipped) have a zero record. Reports older than REPORT_MAX_AGE seconds are evicted.
+"""
+import os
+import shutil
+import struct
+import time
+from os import path
+
+from config.config import REPORT_BASE, REPORT_MAX_AGE
+from core.util import check_fingerprint
+
+RECORD = struct.Struct("<QQ")
+SWEEP_INTERVAL = 60
+
+_last_sweep = 0
+
+
+class ReportStore(object):
+
+  def __init__(self, fingerprint, base=REPORT_BASE):
+    self.directory = path.join(base, check_fingerprint(fingerprint)[:2], fingerprint)
+    # create() removes the directory: it must never be anything but a report
+    assert path.realpath(self.directory).startswith(path.realpath(base) + os.sep)
+    self.data_file = path.join(self.directory, "data")
+    self.index_file = path.join(self.directory, "index")
+    self.data_stream = None
+    self.index_fd = None
+
+  def create(self):
+    """
+    Start a new report, replacing the old one of the same fingerprint if any
+    """
+    evict_reports()
+    shutil.rmtree(self.directory, ignore_errors=True)
+    os.makedirs(self.directory)
+    self.data_stream = open(self.data_file, "wb")
+    self.index_fd = os.open(self.index_file, os.O_RDWR | os.O_CREAT, 0o0644)
+
+  def write(self, case_idx, text):
+    if not text:
+      return
+    buffer = text.encode()
+    offset = self.data_stream.tell()
+    self.data_stream.write(buffer)
+    self.data_stream.flush()
+    # the record is written only after the data it points to
+    os.pwrite(self.index_fd, RECORD.pack(offset, len(buffer)), case_idx * RECORD.size)
+
+  def close(self):
+    if self.data_stream is not None:
+      self.data_stream.close()
+      self.data_stream = None
+    if self.index_fd is not None:
+      os.close(self.index_fd)
+      self.index_fd = None
+
+  def read(self, start=0, end=None):
+    """
+    :return: a list of (case index, report), for cases in [start, end) that have a report
+    """
+    try:
+      with open(self.index_file, "rb") as index_stream, open(self.data_file, "rb") as data_stream:
+        index_stream.seek(start * RECORD.size)
+        index = index_stream.read(-1 if end is None else max(end - start, 0) * RECORD.size)
+        reports = []
+        for i in range(len(index) // RECORD.size):
+          offset, length = RECORD.unpack_from(index, i * RECORD.size)
+          if length:
+            data_stream.seek(offset)
+            reports.append((start + i, data_stream.read(length).decode()))
+        return reports
+    except FileNotFoundError:
+      return []
+
+  def read_all(self):
+    """
+    :return: the whole report, one line per case that is run, in the order of the case list
+    """
+    return ''.join(text for _, text in self.read())
+
+
+def evict_reports(max_age=REPORT_MAX_AGE, base=REPORT_BASE):
+  """
+  Remove reports not written for max_age seconds; done at most once per SWEEP_INTERVAL in a process
+  """
+  global _last_sweep
+  now = time.time()
+  if now - _last_sweep < SWEEP_INTERVAL:
+    return
+  _last_sweep = now
+  if not path.exists(base):
+    return
+  for prefix in os.listdir(base):
+    for fingerprint in os.listdir(path.join(base, prefix)):
+      directory = path.join(base, prefix, fingerprint)
+      try:
+        mtime = os.stat(path.join(directory, "index")).st_mtime
+      except OSError:
+        try:
+          mtime = os.stat(directory).st_mtime
+        except OSError:
+          continue  # removed by the sweep of another process
+      if now - mtime > max_age:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -13,32 +13,50 @@ from os import path, chown, makedirs
 import base64
 
 from config.config import Verdict, USUAL_READ_SIZE, TMP_BASE, COMPILER_USER_UID, COMPILER_GROUP_GID, LIB_BASE
+from core.daemon import CheckerDaemon
+from core.exception import CheckerDaemonError
+from core.judge import BuiltinChecker
+from core.timing import timed
 from core.util import get_signal_name, random_string, make_temp_dir
 
 
 class CaseRunner(object):
 
-  def __init__(self, submission, checker, max_time, max_memory, report_file=None):
+  def __init__(self, submission, checker, max_time, max_memory, report_file=None, cancel_token=None,
+               checker_daemon=False):
+    """
+    :param checker_daemon: to run an uploaded checker in a long-lived sandbox, shared by the cases of this runner
+    """
     self.submission = submission
     self.checker = checker
     self.max_time = max_time
     self.max_memory = max_memory
     self.report_file = report_file
+    self.cancel_token = cancel_token
     self.trusted_workspace = make_temp_dir()
     self.workspace = make_temp_dir()
+    self.checker_daemon = None
+    # the daemon is handed files by their paths in the sandbox
+    if checker_daemon and not isinstance(checker, BuiltinChecker) and not checker.exe_file.startswith(LIB_BASE) \
+        and checker.sandbox.isolated:
+      self.checker_daemon = CheckerDaemon(checker, max_time, max_memory, self.trusted_workspace, cancel_token)
 
   def clean(self):
+    if self.checker_daemon is not None:
+      self.checker_daemon.stop()
     shutil.rmtree(self.workspace)
     shutil.rmtree(self.trusted_workspace)
 
   def initiate_case(self, case):
     self.case = case
     self.case.check_validity()
+    self.case.resolve()
 
   def make_a_file_to_write(self):
     mpath = path.join(self.trusted_workspace, "tmpfile_" + random_string())
     open(mpath, 'w').close()
-    chown(mpath, COMPILER_USER_UID, COMPILER_GROUP_GID)
+    if self.submission.sandbox.isolated:
+      chown(mpath, COMPILER_USER_UID, COMPILER_GROUP_GID)
     return mpath
 
   def run(self, case):
@@ -48,17 +66,20 @@ class CaseRunner(object):
     running_stderr = self.make_a_file_to_write()
     running_result = self.submission.run(max_time=self.max_time, max_memory=self.max_memory,
                                          stdin_file=self.case.input_file, stdout_file=running_output,
-                                         stderr_file=running_stderr, working_directory=self.workspace)
+                                         stderr_file=running_stderr, working_directory=self.workspace,
+                                         cancel_token=self.cancel_token)
 
     if running_result.verdict != Verdict.ACCEPTED:
       # If sub fails to run, the result is final
       result = self.running_fail_result(running_result)
       checker_message = result.get('message', '')  # message is kept
     else:
-      result = self.do_check(running_output, running_result)
+      with timed("check"):
+        result = self.do_check(running_output, running_result)
       checker_message = result.pop('message', '')  # message is popped
     if self.report_file:
-      self.write_report(running_output, running_stderr, running_result, result, checker_message)
+      with timed("report"):
+        self.write_report(running_output, running_stderr, running_result, result, checker_message)
     return result
 
   def read_output_as_b64(self, file):
@@ -86,6 +107,10 @@ class CaseRunner(object):
 
   def do_check(self, running_output, running_result):
     result = dict()
+    if isinstance(self.checker, BuiltinChecker):
+      checker_result, result["message"] = self.checker.check(self.case.input_file, running_output,
+                                                             self.case.output_file)
+      return self.make_check_result(result, checker_result, running_result)
     result_file = self.make_a_file_to_write()
     if self.checker.exe_file.startswith(LIB_BASE):
       # trusted checker in LIB_BASE
@@ -96,14 +121,27 @@ class CaseRunner(object):
         extra_arguments=[self.case.input_file, running_output, self.case.output_file, result_file]
       )
     else:
+      checker_result = None
+      if self.checker_daemon is not None:
+        try:
+          checker_result = self.checker_daemon.check(self.case.input_file, running_output, self.case.output_file,
+                                                     result_file)
+        except CheckerDaemonError:
+          # a checker in a sandbox of its own for this case and the following
+          self.checker_daemon.stop()
+          self.checker_daemon = None
+    if checker_result is None:
       checker_result = self.checker.run(
         stdin_file="/dev/null", stdout_file="/dev/null", stderr_file="/dev/null",
         max_time=self.max_time, max_memory=self.max_memory, working_directory=self.trusted_workspace,
         extra_files=[(self.case.input_file, "in", "R"), (running_output, "out", "R"),
                      (self.case.output_file, "ans", "R"), (result_file, "result", "B")],
-        extra_arguments=["in", "out", "ans", "result"]
+        extra_arguments=["in", "out", "ans", "result"], cancel_token=self.cancel_token
       )
     result["message"] = self.checker.get_message_from_file(result_file, cleanup=True)
+    return self.make_check_result(result, checker_result, running_result)
+
+  def make_check_result(self, result, checker_result, running_result):
     result["verdict"] = self.checker.get_verdict_from_test_result(checker_result)
     if result["verdict"] == Verdict.POINT:
       try:
@@ -0,0 +1,244 @@
+"""
+    Sandbox backends: what runs a program for Submission.run, chosen with SANDBOX_BACKEND.
+
+    - nsjail: the jail of a sandbox slot (see core/slot.py), as root. The only backend to judge with.
+    - local: a plain subprocess with rlimits, as the user of the judge, in the working directory, for profiling
+      the judge where there is no root. Mounts under /app are symbolic links in the working directory, others
+      are the host paths themselves. Nothing is isolated and memory is measured, not limited: Linux counts the
+      resident memory of the judge at fork in the peak of the program, so a peak no higher than that is 0.
+    - fake: no program at all, but a run taking FAKE_SANDBOX_LATENCY seconds and ending with one of the verdicts
+      of FAKE_SANDBOX_VERDICT (comma-separated, picked at random), for load tests of the judge. Trusted runs
+      (compilers, checkers, interactors) are local ones; a fake run writes no output.
+
+    A backend runs args with the working directory mounted at /app, and mounts given as
+    (host path, sandbox path, mode), mode being "R" (read-only) or "B" (read-write). It closes the stdin, stdout
+    and stderr fds once the program has them, and returns the usage of the run the way nsjail reports it:
+    user (CPU time) and pass (wall time) in ms, memory in KB, exit and signal.
+"""
+import os
+import random
+import re
+import resource
+import signal
+import sys
+import threading
+import time
+import traceback
+from os import path
+
+from config.config import COMPILER_GROUP_GID, COMPILER_USER_UID, RUN_GROUP_GID, RUN_USER_UID, NSJAIL_PATH, OUTPUT_LIMIT
+from config.config import ENV, SANDBOX_BACKEND, FAKE_SANDBOX_LATENCY, FAKE_SANDBOX_VERDICT, Verdict
+from core.slot import acquire_slot
+
+NSJAIL_MOUNT_ARGS = ["-R", "/bin", "-R", "/lib", "-R", "/lib64", "-R", "/usr", "-R", "/sbin", "-R", "/dev", "-R", "/etc"]
+NSJAIL_ENV_ARGS = [arg for k, v in ENV.items() for arg in ("-E", "%s=%s" % (k, v))]
+FAKE_POLL_INTERVAL = 0.05
+FORK_MEMORY_SLACK = 1024  # KB
+
+
+def _kill_group(pid):
+  try:
+    os.killpg(pid, signal.SIGKILL)
+  except (ProcessLookupError, PermissionError):
+    pass
+
+
+def close_fds(fds):
+  """
+  Close the fds of a list, which are then None, so that it can be called again
+  """
+  for index, fd in enumerate(fds):
+    if fd is not None:
+      os.close(fd)
+      fds[index] = None
+
+
+def _run_process(file, args, env, fds, error_path, cpus, cancel_token, cwd=None, limits=None, wall_limit=None):
+  """
+  :return: the status and the resource usage of file run as a process group of its own
+  """
+  try:
+    pid = os.fork()
+  except:
+    close_fds(fds)
+    raise
+  if pid == 0:
+    try:
+      for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+      os.setpgid(0, 0)  # so that the sandbox can be killed as a whole
+      if cpus:
+        os.sched_setaffinity(0, cpus)
+      if cwd is not None:
+        os.chdir(cwd)
+      for limit, value in limits or []:
+        _, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+          value = min(value, hard)
+        resource.setrlimit(limit, (value, value))
+      os.execve(file, args, env)
+    except:
+      with open(error_path, "w") as p:
+        traceback.print_exc(file=p)
+    sys.exit(0)
+
+  close_fds(fds)
+  if cancel_token is not None:
+    try:
+      os.setpgid(pid, pid)
+    except OSError:
+      pass  # already done by the child
+    cancel_token.register(pid)
+  timer = None
+  if wall_limit is not None:
+    timer = threading.Timer(wall_limit, _kill_group, args=(pid,))
+    timer.daemon = True
+    timer.start()
+  try:
+    _, status, rusage = os.wait4(pid, 0)
+  finally:
+    if timer is not None:
+      timer.cancel()
+    if cancel_token is not None:
+      cancel_token.unregister(pid)
+  if cancel_token is not None:
+    cancel_token.check()
+  if path.exists(error_path):
+    with open(error_path) as p:
+      raise RuntimeError(p.read())
+  return status, rusage
+
+
+class NsjailSandbox(object):
+  isolated = True  # programs run as other users and see the mounts at their sandbox paths
+
+  def execute(self, args, working_directory, mounts, trusted, max_time, max_memory, fds, cpus, cancel_token=None):
+    uid = COMPILER_USER_UID if trusted else RUN_USER_UID
+    gid = COMPILER_GROUP_GID if trusted else RUN_GROUP_GID
+    real_time_limit = max_time * 2
+    slot = acquire_slot()
+    try:
+      nsjail_args = [NSJAIL_PATH, "-Mo"] + slot.nsjail_args + ["--user", str(uid), "--group", str(gid)] + \
+                    NSJAIL_MOUNT_ARGS + ["-B" if trusted else "-R", working_directory + ":/app"]
+      for host_path, sandbox_path, mode in mounts:
+        nsjail_args.extend(["-" + mode, host_path + ":" + sandbox_path])
+      nsjail_args += [
+        "-D", "/app",
+        "--cgroup_pids_max", "64", "--cgroup_cpu_ms_per_sec", "1000",
+        "--cgroup_mem_max", str(int((max_memory + 32) * 1024 * 1024)),
+        "--time_limit", str(int(real_time_limit + 1)),
+        "--rlimit_cpu", str(int(max_time + 1)),
+        "--rlimit_as", "inf",
+        "--rlimit_stack", str(max(int(max_memory + 32), 256)),
+        "--rlimit_fsize", str(int(OUTPUT_LIMIT)),
+      ]
+      nsjail_args.extend(NSJAIL_ENV_ARGS)
+      nsjail_args.append("--")
+      nsjail_args.extend(args)
+
+      status, _ = _run_process(NSJAIL_PATH, nsjail_args, dict(), fds, slot.error_path, cpus, cancel_token)
+      if os.WEXITSTATUS(status) == 0xff:
+        if path.exists(slot.log_path):
+          with open(slot.log_path) as p:
+            log_content = p.read()
+          if log_content.find("Couldn't launch the child process") != -1:
+            raise RuntimeError(log_content)
+
+      with open(slot.usage_path) as usage_file:
+        usage = {}
+        for line in usage_file:
+          tag, num = line.strip().split()
+          usage[tag] = int(num)
+      return usage
+    finally:
+      close_fds(fds)
+      slot.release()
+
+
+class LocalSandbox(object):
+  isolated = False
+
+  @staticmethod
+  def _host_arg(arg, paths):
+    for sandbox_path, host_path in paths:
+      arg = re.sub(re.escape(sandbox_path) + "(?=/|$)", lambda _: host_path, arg)
+    return arg
+
+  def execute(self, args, working_directory, mounts, trusted, max_time, max_memory, fds, cpus, cancel_token=None):
+    links, paths = [], []
+    slot = acquire_slot()
+    try:
+      for host_path, sandbox_path, _ in mounts:
+        if sandbox_path.startswith("/app/"):
+          link = path.join(working_directory, sandbox_path[len("/app/"):])
+          if not path.lexists(link):
+            os.symlink(host_path, link)
+            links.append(link)
+        else:
+          paths.append((sandbox_path, host_path))
+      paths.append(("/app", working_directory))
+      args = [self._host_arg(arg, paths) for arg in args]
+      limits = [(resource.RLIMIT_CPU, int(max_time + 1)),
+                (resource.RLIMIT_STACK, max(int(max_memory + 32), 256) * 1024 * 1024),
+                (resource.RLIMIT_FSIZE, int(OUTPUT_LIMIT) * 1024 * 1024)]
+      with open("/proc/self/statm") as statm:
+        fork_memory = int(statm.read().split()[1]) * resource.getpagesize() // 1024
+      start_time = time.perf_counter()
+      status, rusage = _run_process(args[0], args, ENV, fds, slot.error_path, cpus, cancel_token,
+                                    cwd=working_directory, limits=limits, wall_limit=int(max_time * 2 + 1))
+      return {"user": int(rusage.ru_utime * 1000), "pass": int((time.perf_counter() - start_time) * 1000),
+              "memory": rusage.ru_maxrss if rusage.ru_maxrss > fork_memory + FORK_MEMORY_SLACK else 0,
+              "exit": os.WEXITSTATUS(status) if os.WIFEXITED(status) else 0,
+              "signal": os.WTERMSIG(status) if os.WIFSIGNALED(status) else 0}
+    finally:
+      close_fds(fds)
+      for link in links:
+        os.remove(link)
+      slot.release()
+
+
+class FakeSandbox(object):
+  isolated = False
+
+  def __init__(self, latency=FAKE_SANDBOX_LATENCY, verdicts=FAKE_SANDBOX_VERDICT):
+    self.latency = latency
+    # using [] to throw KeyError in case of bad configuration
+    self.verdicts = [Verdict[verdict.strip()] for verdict in verdicts.split(",")]
+    self.local = LocalSandbox()
+
+  def usage(self, verdict, max_time, max_memory):
+    usage = {"user": int(self.latency * 1000), "pass": int(self.latency * 1000), "memory": 1024,
+             "exit": 0, "signal": 0}
+    if verdict == Verdict.RUNTIME_ERROR:
+      usage["exit"] = 1
+    elif verdict == Verdict.TIME_LIMIT_EXCEEDED:
+      usage.update(user=int(max_time * 1000) + 1, signal=int(signal.SIGKILL))
+    elif verdict == Verdict.IDLENESS_LIMIT_EXCEEDED:
+      usage.update(signal=int(signal.SIGKILL), **{"pass": int(max_time * 2000) + 1})
+    elif verdict == Verdict.MEMORY_LIMIT_EXCEEDED:
+      usage.update(memory=int(max_memory * 1024) + 1024, signal=int(signal.SIGKILL))
+    return usage
+
+  def execute(self, args, working_directory, mounts, trusted, max_time, max_memory, fds, cpus, cancel_token=None):
+    if trusted:
+      return self.local.execute(args, working_directory, mounts, trusted, max_time, max_memory, fds, cpus,
+                                cancel_token)
+    close_fds(fds)
+    deadline = time.perf_counter() + self.latency
+    while True:
+      if cancel_token is not None:
+        cancel_token.check()
+      remaining = deadline - time.perf_counter()
+      if remaining <= 0:
+        break
+      time.sleep(min(remaining, FAKE_POLL_INTERVAL))
+    return self.usage(random.choice(self.verdicts), max_time, max_memory)
+
+
+SANDBOX_BACKENDS = {
+  "nsjail": NsjailSandbox,
+  "local": LocalSandbox,
+  "fake": FakeSandbox,
+}
+
+sandbox = SANDBOX_BACKENDS[SANDBOX_BACKEND]()
@@ -0,0 +1,61 @@
+"""
+    Sandbox slots are pre-provisioned chroot and info directories reused across sandboxed runs.
+
+    A slot is checked out by taking an exclusive flock on its lock file, so that concurrent judges
+    (threads or gunicorn workers) on one node never share a slot, and a slot of a dead process is free again.
+    The slot is reset when checked out, so in DEBUG mode the info of the last run stays around for inspection.
+"""
+import fcntl
+import os
+import shutil
+from os import path
+
+from config.config import SLOT_BASE
+
+
+class SandboxSlot(object):
+
+  def __init__(self, index, lock_fd):
+    self.index = index
+    self.lock_fd = lock_fd
+    self.root_dir = path.join(SLOT_BASE, str(index), "root")
+    self.info_dir = path.join(SLOT_BASE, str(index), "info")
+    self.log_path = path.join(self.info_dir, "log")
+    self.usage_path = path.join(self.info_dir, "usage")
+    self.error_path = path.join(self.info_dir, "err")
+    self.nsjail_args = ["--chroot", self.root_dir, "--log", self.log_path, "--usage", self.usage_path]
+
+  def reset(self):
+    os.makedirs(self.info_dir, exist_ok=True)
+    for file in os.listdir(self.info_dir):
+      os.remove(path.join(self.info_dir, file))
+    # the chroot is only a mount point and should always be empty
+    if path.exists(self.root_dir) and os.listdir(self.root_dir):
+      shutil.rmtree(self.root_dir)
+    os.makedirs(self.root_dir, exist_ok=True)
+
+  def release(self):
+    if self.lock_fd is not None:
+      fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+      os.close(self.lock_fd)
+      self.lock_fd = None
+
+
+def acquire_slot():
+  os.makedirs(SLOT_BASE, exist_ok=True)
+  index = 0
+  while True:
+    lock_fd = os.open(path.join(SLOT_BASE, "%d.lock" % index), os.O_RDWR | os.O_CREAT, 0o0600)
+    try:
+      fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      os.close(lock_fd)
+      index += 1
+      continue
+    slot = SandboxSlot(index, lock_fd)
+    try:
+      slot.reset()
+    except:
+      slot.release()
+      raise
+    return slot
@@ -0,0 +1,99 @@
+"""
+    Statistics of cases, by case fingerprint: how many times a case is run, how many times it rejects the
+    submission, its typical running time (exponentially weighted) and its input size.
+
+    They are used to run first the cases that are the most likely to fail, and the cheapest, so that a
+    wrong submission is rejected as early as possible when judging stops at the first failure.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+from os import path
+
+from config.config import CASE_STATS_FILE
+
+TIME_WEIGHT = 0.2
+COST_FLOOR = 0.01
+
+
+class CaseStats(object):
+
+  def __init__(self, db_file=CASE_STATS_FILE):
+    self.db_file = db_file
+    os.makedirs(path.dirname(db_file), exist_ok=True)
+    with closing(self.connect()) as db, db:
+      db.execute("CREATE TABLE IF NOT EXISTS case_stats (fingerprint TEXT PRIMARY KEY, "
+                 "runs INTEGER NOT NULL, failures INTEGER NOT NULL, mean_time REAL NOT NULL, "
+                 "input_size INTEGER NOT NULL, updated REAL NOT NULL)")
+
+  def connect(self):
+    return sqlite3.connect(self.db_file, timeout=30)
+
+  def load(self, fingerprints):
+    """
+    :return: {fingerprint: (runs, failures, mean time, input size)} of the fingerprints that have statistics
+    """
+    fingerprints = list(set(fingerprints))
+    stats = {}
+    with closing(self.connect()) as db:
+      # stay well below the limit of host parameters in a statement
+      for start in range(0, len(fingerprints), 500):
+        chunk = fingerprints[start:start + 500]
+        for row in db.execute("SELECT fingerprint, runs, failures, mean_time, input_size FROM case_stats "
+                              "WHERE fingerprint IN (%s)" % ",".join("?" * len(chunk)), chunk):
+          stats[row[0]] = row[1:]
+    return stats
+
+  def record(self, results):
+    """
+    :param results: a list of (fingerprint, failed, time, input size) of the cases run by a judge
+    """
+    if not results:
+      return
+    now = time.time()
+    try:
+      with closing(self.connect()) as db, db:
+        for fingerprint, failed, run_time, input_size in results:
+          db.execute("INSERT OR IGNORE INTO case_stats VALUES (?, 0, 0, ?, ?, ?)",
+                     (fingerprint, run_time, input_size, now))
+          db.execute("UPDATE case_stats SET runs = runs + 1, failures = failures + ?, "
+                     "mean_time = mean_time + (? - mean_time) * ?, input_size = ?, updated = ? "
+                     "WHERE fingerprint = ?",
+                     (int(failed), run_time, TIME_WEIGHT, input_size, now, fingerprint))
+    except sqlite3.OperationalError:
+      pass  # statistics are not worth failing a judge, e.g. when the database is locked for too long
+
+  def fail_fast_order(self, case_list, group_list=None, input_sizes=None):
+    """
+    The order in which cases should be run, as a list of indices of case_list. Cases are only moved
+    within a contiguous run of the same group, so that groups (and their dependencies) keep their order.
+
+    A case comes first if it is likely to fail (the failure rate is smoothed, so that a case without
+    statistics counts as failing half of the times) and cheap to run. The cost of a case that is never run
+    is estimated from its input size, with the average time per byte of the other cases.
+    """
+    stats = self.load(case_list)
+    known = [stat for stat in stats.values() if stat[0] > 0]
+    default_cost = sum(stat[2] for stat in known) / len(known) if known else 1.0
+    known_bytes = sum(stat[3] for stat in known)
+    time_per_byte = sum(stat[2] for stat in known) / known_bytes if known_bytes else None
+
+    def score(case_idx):
+      runs, failures, mean_time, input_size = stats.get(case_list[case_idx], (0, 0, 0.0, 0))
+      if runs:
+        cost = mean_time
+      elif time_per_byte is not None and input_sizes is not None:
+        cost = time_per_byte * input_sizes[case_idx]
+      else:
+        cost = default_cost
+      return (failures + 1) / (runs + 2) / (cost + COST_FLOOR)
+
+    order, block = [], []
+    for case_idx in range(len(case_list)):
+      if block and group_list is not None and group_list[case_idx] != group_list[block[0]]:
+        order.extend(sorted(block, key=score, reverse=True))
+        block = []
+      block.append(case_idx)
+    order.extend(sorted(block, key=score, reverse=True))
+    return order
@@ -3,16 +3,21 @@ import os
 import shutil
 import stat
 import subprocess
-import sys
+import time
 import traceback
 from os import path, remove
 
-from config.config import COMPILER_GROUP_GID, COMPILER_USER_UID, RUN_GROUP_GID, RUN_USER_UID, NSJAIL_PATH, OUTPUT_LIMIT, \
-  DEBUG
-from config.config import LANGUAGE_CONFIG, SUB_BASE, USUAL_READ_SIZE, ENV
-from config.config import Verdict
+from config.config import LANGUAGE_CONFIG, SUB_BASE, USUAL_READ_SIZE
+from config.config import Verdict, WARM_START
+from core.admission import admit
+from core.compile_cache import compile_cache
+from core.compile_pool import compile_slot, COMPILE_CPU_SET, EXECUTE_CPU_SET
 from core.exception import *
+from core.metrics import SANDBOXES_IN_FLIGHT
+from core.sandbox import sandbox, close_fds
+from core.timing import record
 from core.util import random_string, make_temp_dir
+from core.warmup import WARM_MOUNT, compile_commands, execute_command, pch_failed
 
 
 class Result:
@@ -38,6 +43,8 @@ class Submission(object):
       self.exe_file = exe_file
     else:
       self.exe_file = path.join(SUB_BASE, random_string() + "." + self.language_config["exe_ext"])
+    self.warm_start = WARM_START
+    self.sandbox = sandbox
 
   def clean(self):
     """
@@ -50,7 +57,7 @@ class Submission(object):
 
   def format_compile_command(self, command, exe_file, working_directory):
     command = command.format(code_file=self.language_config["code_file"],
-                             exe_file=exe_file)
+                             exe_file=exe_file, warm_dir=WARM_MOUNT)
     args_list = []
     for token in command.split():
       if "*" in token:
@@ -60,23 +67,56 @@ class Submission(object):
         args_list.append(token)
     return args_list
 
-  def compile(self, code, max_time):
+  def use_compile_cache(self, cache_key):
+    """
+    :return: True if the executable is taken from the compile cache; a cached compile error is raised
+    """
+    cache_kind, cached = compile_cache.lookup(cache_key, self.language_config["exe_ext"], self.exe_file)
+    if cache_kind == "error":
+      raise CompileError(cached)
+    return cache_kind == "exe"
+
+  def compile(self, code, max_time, cancel_token=None):
+    cache_key = compile_cache.make_key(code, self.lang, self.language_config)
+    if self.use_compile_cache(cache_key):
+      return
+    with compile_slot(cache_key, cancel_token):
+      # the same source might have been compiled while waiting for the slot
+      if not self.use_compile_cache(cache_key):
+        self.compile_in_sandbox(code, max_time, cache_key, cancel_token, self.warm_start)
+
+  def compile_in_sandbox(self, code, max_time, cache_key, cancel_token=None, warm_start=True):
+    """
+    :param warm_start: to compile with the warm start artifacts of the language, if any
+    """
     compile_dir = make_temp_dir()
     tmp_compile_out = "compile.out"
     error_path = path.join(compile_dir, "compiler.err")
     with open(path.join(compile_dir, self.language_config["code_file"]), "w") as fs:
       fs.write(code)
-    for command in self.language_config["compile"]:
+    commands, warm_mounts = compile_commands(self.lang, warm_start)
+    for command in commands:
       args_list = self.format_compile_command(command, tmp_compile_out, compile_dir)
       if not os.path.exists(args_list[0]):
         raise CompileError("Compiler not found")
-      result = self.run(max_time=max_time, max_memory=1024,
-                        stdin_file="/dev/null", stdout_file=error_path, stderr_file=error_path,
-                        working_directory=compile_dir, trusted=True,
-                        exe_file=args_list[0], extra_arguments=args_list[1:])
+      try:
+        result = self.run(max_time=max_time, max_memory=1024,
+                          stdin_file="/dev/null", stdout_file=error_path, stderr_file=error_path,
+                          working_directory=compile_dir, trusted=True,
+                          exe_file=args_list[0], extra_arguments=args_list[1:], extra_mounts=warm_mounts,
+                          cpus=COMPILE_CPU_SET, admitted=True, cancel_token=cancel_token)
+      except JudgeCancelled:
+        shutil.rmtree(compile_dir)
+        raise
       if result.verdict != Verdict.ACCEPTED:
         error_message = self.get_message_from_file(error_path, read_size=-1)
         shutil.rmtree(compile_dir)
+        if pch_failed(error_message, warm_mounts):
+          # a precompiled header gcc could not cope with, without warm start then
+          return self.compile_in_sandbox(code, max_time, cache_key, cancel_token, warm_start=False)
+        if error_message and result.verdict == Verdict.RUNTIME_ERROR and result.signal == 0:
+          # rejected by the compiler itself, which is as reproducible as an executable
+          compile_cache.store_error(cache_key, error_message)
         if not error_message:
           if result.verdict == Verdict.TIME_LIMIT_EXCEEDED:
             error_message = 'Time limit exceeded when compiling'
@@ -85,9 +125,12 @@ class Submission(object):
           else:
             error_message = 'Something is wrong, but, em, nothing is reported'
         raise CompileError(error_message)
+    if path.exists(self.exe_file):
+      remove(self.exe_file)  # it might be a hard link into the compile cache
     shutil.copyfile(path.join(compile_dir, tmp_compile_out), self.exe_file)
     os.chmod(self.exe_file, 0o0775)
     shutil.rmtree(compile_dir)
+    compile_cache.store_executable(cache_key, self.language_config["exe_ext"], self.exe_file)
 
   def get_message_from_file(self, result_file, read_size=USUAL_READ_SIZE, cleanup=False):
     try:
@@ -116,111 +159,75 @@ class Submission(object):
   def run(self, max_time, max_memory, working_directory: str,
           stdin_file: str=None, stdout_file: str=None, stderr_file: str=None,
           stdin_fd: int=None, stdout_fd: int=None, stderr_fd: int=None,
-          exe_file: str=None, trusted=False, extra_arguments: list=None, extra_files: list=None):
+          exe_file: str=None, trusted=False, extra_arguments: list=None, extra_files: list=None,
+          extra_mounts: list=None, cpus=None, admitted=False, cancel_token=None):
+    """
+    :param admitted: the sandbox is admitted by the caller already, or needs no admission (see core/admission.py)
+    :param extra_mounts: other mounts, as (host path, sandbox path, mode), e.g. [("/host/dir", "/dir", "R")]
+    :param cpus: the CPUs the sandbox runs on, EXECUTE_CPUS by default (all of them if empty)
+    :param cancel_token: a CancelToken; the sandbox is killed when it is cancelled, and JudgeCancelled is raised
+    """
+    if cancel_token is not None:
+      cancel_token.check()
     if extra_files is None:
       extra_files = list()
     if extra_arguments is None:
       extra_arguments = list()
-    root_dir = make_temp_dir()
-    info_dir = make_temp_dir()
-    error_path = path.join(info_dir, "err")
+    if cpus is None:
+      cpus = EXECUTE_CPU_SET
     real_time_limit = max_time * 2
-    uid = COMPILER_USER_UID if trusted else RUN_USER_UID
-    gid = COMPILER_GROUP_GID if trusted else RUN_GROUP_GID
-    extra_file_bindings = []
+    mounts = []
 
     if exe_file is None:
       exe_file = path.basename(self.exe_file)
-      extra_file_bindings.append("-R")
-      extra_file_bindings.append(self.exe_file + ":/app/" + exe_file)
-      args = self.format_compile_command(self.language_config["execute"], exe_file, working_directory)
+      mounts.append((self.exe_file, "/app/" + exe_file, "R"))
+      execute, warm_mounts = execute_command(self.lang, self.warm_start)
+      mounts.extend(warm_mounts)
+      args = self.format_compile_command(execute, exe_file, working_directory)
       exe_args = args + extra_arguments
     else:
       # exe file is provided, we don't care about mounting any more.
       exe_args = [exe_file] + extra_arguments
 
+    if extra_mounts is not None:
+      mounts.extend(extra_mounts)
     for k, v, mode in extra_files:
-      extra_file_bindings.append("-" + mode)
-      extra_file_bindings.append(k + ":/app/" + v)
-    nsjail_args = [
-                    NSJAIL_PATH, "-Mo", "--chroot", root_dir, "--user", str(uid), "--group", str(gid), "--log",
-                    path.join(info_dir, "log"), "--usage", path.join(info_dir, "usage"),
-                    "-R", "/bin", "-R", "/lib", "-R", "/lib64", "-R", "/usr", "-R", "/sbin", "-R", "/dev",
-                    "-R", "/etc", "-B" if trusted else "-R", working_directory + ":/app"] + extra_file_bindings + [
-                    "-D", "/app",
-                    "--cgroup_pids_max", "64", "--cgroup_cpu_ms_per_sec", "1000",
-                    "--cgroup_mem_max", str(int((max_memory + 32) * 1024 * 1024)),
-                    "--time_limit", str(int(real_time_limit + 1)),
-                    "--rlimit_cpu", str(int(max_time + 1)),
-                    "--rlimit_as", "inf",
-                    "--rlimit_stack", str(max(int(max_memory + 32), 256)),
-                    "--rlimit_fsize", str(int(OUTPUT_LIMIT)),
-                  ]
-    for k, v in ENV.items():
-      nsjail_args.append("-E")
-      nsjail_args.append("%s=%s" % (k, v))
-    nsjail_args.append("--")
-    nsjail_args.extend(exe_args)
-
-    pid = os.fork()
-    if pid == 0:
-      try:
-        if stdin_fd is None:
-          stdin_fd = os.open(stdin_file, os.O_RDONLY, stat.S_IRUSR | stat.S_IRGRP)
-        if stdout_fd is None:
-          stdout_fd = os.open(stdout_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
-        if stderr_fd is None:
-          stderr_fd = os.open(stderr_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
-        os.dup2(stdin_fd, 0)
-        os.dup2(stdout_fd, 1)
-        os.dup2(stderr_fd, 2)
-        os.execve(NSJAIL_PATH, nsjail_args, dict())
-      except:
-        with open(error_path, "w") as p:
-          traceback.print_exc(file=p)
-      sys.exit(0)
-    else:
-      try:
-        if stdin_fd is not None:
-          os.close(stdin_fd)
-        if stdout_fd is not None:
-          os.close(stdout_fd)
-        if stderr_fd is not None:
-          os.close(stderr_fd)
-        _, status = os.waitpid(pid, 0)
-        if os.path.exists(error_path):
-          with open(error_path) as p:
-            raise RuntimeError(p.read())
-
-        if os.WEXITSTATUS(status) == 0xff:
-          log_path = path.join(info_dir, "log")
-          if path.exists(log_path):
-            with open(log_path) as p:
-              log_content = p.read()
-            if log_content.find("Couldn't launch the child process") != -1:
-              raise RuntimeError(log_content)
-
-        with open(path.join(info_dir, "usage")) as usage_file:
-          usage = {}
-          for line in usage_file:
-            tag, num = line.strip().split()
-            usage[tag] = int(num)
-
-        result = Result(round(usage["user"] / 1000, 3), round(usage["memory"] / 1024, 3), usage["exit"], usage["signal"])
-        if result.exit_code != 0:
-          result.verdict = Verdict.RUNTIME_ERROR
-        if result.memory > max_memory > 0:
-          result.verdict = Verdict.MEMORY_LIMIT_EXCEEDED
-        elif result.time > max_time > 0:
-          result.verdict = Verdict.TIME_LIMIT_EXCEEDED
-        elif usage["pass"] / 1000 > real_time_limit > 0:
-          result.verdict = Verdict.IDLENESS_LIMIT_EXCEEDED
-        elif result.signal != 0:
-          result.verdict = Verdict.RUNTIME_ERROR
-        return result
-      except:
-        raise RuntimeError(traceback.format_exc())
-      finally:
-        if not DEBUG:
-          shutil.rmtree(info_dir)
-        shutil.rmtree(root_dir)
+      mounts.append((k, "/app/" + v, mode))
+    reservation = None if admitted else admit(max_memory + 32, 1, cancel_token)
+    start_time = time.perf_counter()
+    fds = [stdin_fd, stdout_fd, stderr_fd]
+    SANDBOXES_IN_FLIGHT.inc()
+    try:
+      if stdin_fd is None:
+        fds[0] = os.open(stdin_file, os.O_RDONLY)
+      if stdout_fd is None:
+        fds[1] = os.open(stdout_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
+      if stderr_fd is None:
+        fds[2] = os.open(stderr_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
+      usage = self.sandbox.execute(exe_args, working_directory, mounts, trusted, max_time, max_memory, fds, cpus,
+                                   cancel_token)
+      # what is not spent running the program is spent setting up and tearing down the sandbox
+      record("execution", usage["pass"] / 1000)
+      record("sandbox_setup", max(time.perf_counter() - start_time - usage["pass"] / 1000, 0))
+
+      result = Result(round(usage["user"] / 1000, 3), round(usage["memory"] / 1024, 3), usage["exit"], usage["signal"])
+      if result.exit_code != 0:
+        result.verdict = Verdict.RUNTIME_ERROR
+      if result.memory > max_memory > 0:
+        result.verdict = Verdict.MEMORY_LIMIT_EXCEEDED
+      elif result.time > max_time > 0:
+        result.verdict = Verdict.TIME_LIMIT_EXCEEDED
+      elif usage["pass"] / 1000 > real_time_limit > 0:
+        result.verdict = Verdict.IDLENESS_LIMIT_EXCEEDED
+      elif result.signal != 0:
+        result.verdict = Verdict.RUNTIME_ERROR
+      return result
+    except JudgeCancelled:
+      raise
+    except:
+      raise RuntimeError(traceback.format_exc())
+    finally:
+      close_fds(fds)
+      SANDBOXES_IN_FLIGHT.dec()
+      if reservation is not None:
+        reservation.release()
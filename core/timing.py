@@ -0,0 +1,46 @@
+"""
+    Timing of the phases of judging: compile, sandbox_setup, execution, check and report.
+
+    The judging code reports how long each phase takes with record() or timed(), and listeners added with
+    add_listener() are called with (phase, seconds) on every record, in the thread doing the work.
+    When a phase is timed inside another one in the same thread (e.g. the sandboxed runs of a compiler or
+    a checker), it is accounted to the outer phase only. Nothing is done when there is no listener.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ("compile", "sandbox_setup", "execution", "check", "report")
+
+_listeners = []
+_local = threading.local()
+
+
+def add_listener(listener):
+  _listeners.append(listener)
+
+
+def remove_listener(listener):
+  _listeners.remove(listener)
+
+
+def record(phase, seconds):
+  if not _listeners or getattr(_local, "phase", None) is not None:
+    return
+  for listener in list(_listeners):
+    listener(phase, seconds)
+
+
+@contextmanager
+def timed(phase):
+  outer = getattr(_local, "phase", None)
+  if not _listeners or outer is not None:
+    yield
+    return
+  _local.phase = phase
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    _local.phase = None
+    record(phase, time.perf_counter() - start)
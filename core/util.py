@@ -1,4 +1,5 @@
 import random
+import re
 import signal
 from os import path, makedirs
 
@@ -9,6 +10,20 @@ def random_string(length=32):
   return ''.join(list(random.choice("0123456789abcdef") for _ in range(length)))
 
 
+FINGERPRINT_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def check_fingerprint(fingerprint):
+  """
+  A fingerprint names files and directories, and is never anything but letters, digits, "_" and "-"
+
+  :return: fingerprint, if it is one
+  """
+  if not isinstance(fingerprint, str) or not FINGERPRINT_PATTERN.fullmatch(fingerprint):
+    raise ValueError("Invalid fingerprint: %r" % (fingerprint,))
+  return fingerprint
+
+
 def get_signal_name(signal_num):
   try:
     return signal.Signals(signal_num).name
@@ -16,6 +31,21 @@ def get_signal_name(signal_num):
     return 'SIG%03d' % signal_num
 
 
+def parse_cpu_list(cpu_list):
+  """
+  :param cpu_list: CPUs as in /sys/devices/system/cpu/online, e.g. "0-3,8"
+  :return: a set of CPU numbers, empty if cpu_list is
+  """
+  cpus = set()
+  for part in cpu_list.split(","):
+    if "-" in part:
+      first, last = part.split("-")
+      cpus.update(range(int(first), int(last) + 1))
+    elif part.strip():
+      cpus.add(int(part))
+  return cpus
+
+
 def make_temp_dir():
   while True:
     directory = path.join(TMP_BASE, random_string())
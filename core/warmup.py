@@ -0,0 +1,146 @@
+"""
+    Warm start of languages: artifacts built once per node, in WARM_BASE/<lang>, and used by every compile or
+    run of the language, e.g. a class data sharing archive of the JDK, which saves the JVM from loading and
+    verifying its core classes on every start, or precompiled headers, which save g++ from parsing
+    bits/stdc++.h or testlib.h on every compile.
+
+    A language of lang.yaml has a warm start with:
+    - warmup: commands building the artifacts, run in the directory of the artifacts ({warm_dir}),
+      {lib_dir} being LIB_BASE
+    - warm_execute: the execute command using them, {warm_dir} being where they are mounted in the sandbox
+    - warm_compile: the same for the compile commands
+
+    Artifacts are built with `python3 -m core.warmup` (run.sh does it at startup), and built again when the
+    warmup commands or the binaries they run change. As long as they are not built, a language is run with
+    its plain commands. Artifacts that cannot be used should be ignored by the tools using them, as a
+    precompiled header of another compiler version is by gcc; a compile that fails on a precompiled header all
+    the same (see pch_failed) is run again without warm start.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from os import path
+
+from config.config import LANGUAGE_CONFIG, WARM_BASE, LIB_BASE
+from core.compile_cache import CompileCache
+from core.util import random_string
+
+WARM_MOUNT = "/warm"
+STAMP_FILE = ".stamp"
+WARMUP_TIMEOUT = 300
+# what gcc says when it fails on a precompiled header, rather than on the code, {warm} being the warm paths
+PCH_ERROR = r"^(\S+: )?(fatal )?error: (while reading precompiled header|had to relocate PCH|can.t read PCH file|" \
+            r"(cannot|can.t) read ({warm})/\S+\.gch)"
+
+_stamps = {}
+_ready = set()
+
+
+def warm_dir(lang):
+  return path.join(WARM_BASE, lang)
+
+
+def has_warmup(lang):
+  config = LANGUAGE_CONFIG[lang]
+  return "warmup" in config and ("warm_execute" in config or "warm_compile" in config)
+
+
+def stamp(lang):
+  """
+  :return: what the artifacts of lang are built from, as a string
+  """
+  if lang not in _stamps:
+    commands = LANGUAGE_CONFIG[lang]["warmup"]
+    _stamps[lang] = json.dumps([commands, [CompileCache.binary_identity(command.split()[0]) for command in commands]])
+  return _stamps[lang]
+
+
+def is_ready(lang):
+  if lang in _ready:
+    return True
+  if not has_warmup(lang):
+    return False
+  try:
+    with open(path.join(warm_dir(lang), STAMP_FILE)) as fs:
+      if fs.read() != stamp(lang):
+        return False
+  except OSError:
+    return False
+  _ready.add(lang)
+  return True
+
+
+def build(lang):
+  """
+  :return: True if the artifacts of lang are ready
+  """
+  if is_ready(lang):
+    return True
+  os.makedirs(WARM_BASE, exist_ok=True)
+  build_directory = path.join(WARM_BASE, ".%s.%s" % (lang, random_string(8)))
+  os.makedirs(build_directory)
+  try:
+    for command in LANGUAGE_CONFIG[lang]["warmup"]:
+      subprocess.run(command.format(warm_dir=build_directory, lib_dir=LIB_BASE).split(), cwd=build_directory,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     timeout=WARMUP_TIMEOUT, check=True)
+    with open(path.join(build_directory, STAMP_FILE), "w") as fs:
+      fs.write(stamp(lang))
+    for root, directories, _ in os.walk(build_directory):
+      for directory in [root] + [path.join(root, d) for d in directories]:
+        os.chmod(directory, 0o0755)
+    shutil.rmtree(warm_dir(lang), ignore_errors=True)
+    os.rename(build_directory, warm_dir(lang))
+  except (OSError, subprocess.SubprocessError):
+    return False
+  finally:
+    shutil.rmtree(build_directory, ignore_errors=True)
+  return is_ready(lang)
+
+
+def _warm_mounts(lang):
+  return [(warm_dir(lang), WARM_MOUNT, "R")]
+
+
+def execute_command(lang, warm_start=True):
+  """
+  :return: the execute command of lang, and the mounts it needs (see core/sandbox.py)
+  """
+  if warm_start and "warm_execute" in LANGUAGE_CONFIG[lang] and is_ready(lang):
+    return LANGUAGE_CONFIG[lang]["warm_execute"], _warm_mounts(lang)
+  return LANGUAGE_CONFIG[lang]["execute"], []
+
+
+def pch_failed(error_message, mounts):
+  """
+  :param mounts: the warm start mounts of the compile
+  :return: whether the compile failed on a precompiled header of the warm start, and should be run again without
+           warm start; an #error of the code does not pass for it, as gcc puts "#error" before its message
+  """
+  if not mounts:
+    return False
+  warm = "|".join(re.escape(directory) for host_path, sandbox_path, _ in mounts
+                  for directory in (host_path, sandbox_path))
+  return re.search(PCH_ERROR.format(warm=warm), error_message, re.MULTILINE) is not None
+
+
+def compile_commands(lang, warm_start=True):
+  """
+  :return: the compile commands of lang, and the mounts they need (see core/sandbox.py)
+  """
+  if warm_start and "warm_compile" in LANGUAGE_CONFIG[lang] and is_ready(lang):
+    return LANGUAGE_CONFIG[lang]["warm_compile"], _warm_mounts(lang)
+  return LANGUAGE_CONFIG[lang]["compile"], []
+
+
+if __name__ == "__main__":
+  failed = False
+  for lang in sorted(LANGUAGE_CONFIG):
+    if has_warmup(lang):
+      ready = build(lang)
+      failed = failed or not ready
+      print("%s: %s" % (lang, "ready" if ready else "failed, running without warm start"))
+  sys.exit(1 if failed else 0)
@@ -1,60 +1,64 @@
 #!/usr/bin/env python3
-import os
-import threading
-from functools import wraps
+import shutil
+from os import path
 
-import yaml
-from flask import request, Response, jsonify, Flask
+import json
 
-from config.config import TOKEN_FILE, Verdict, SPJ_BASE
+from flask import request, Response, jsonify, Flask, send_file
+
+from api import auth_required, response_ok, request_data, with_traceback_on_err
+from config.config import PORT, COORDINATOR_URL, NODE_URL, Verdict
+from core import admission
+from core.archive import extract_cases
+from core.cancel import request_cancel, clear_cancel
 from core.case import Case
+from core.cluster import start_heartbeat
+from core.exception import QueueFullError
+from core.jobs import JobQueue
+from core import metrics
 from core.judge import SpecialJudge
+from core.registry import spj_registry
+from core.report import ReportStore
+from core.util import make_temp_dir, check_fingerprint
 from handler import judge_handler
-from handler import reject_with_traceback, cache
+from handler import cache, JudgeStatus
 
 flask_app = Flask(__name__)
+job_queue = JobQueue()
 
 
-@flask_app.route('/ping')
-def ping():
-  return Response("pong")
-
-
-def check_auth(username, password):
-  with open(TOKEN_FILE) as token_fs:
-    tokens = yaml.safe_load(token_fs.read())
-  return username == tokens['username'] and password == tokens['password']
-
+def queue_metrics():
+  return [("ejudge_queue_jobs", "gauge", "Jobs in the judge queue",
+           [({"state": "waiting"}, job_queue.waiting_count()), ({"state": "running"}, job_queue.running_count())])]
 
-def authorization_failed():
-  return jsonify({'status': 'reject', 'message': 'authorization failed'})
 
+metrics.register_collector(queue_metrics)
 
-def auth_required(f):
-  @wraps(f)
-  def decorated(*args, **kwargs):
-    auth = request.authorization
-    if not auth or not check_auth(auth.username, auth.password):
-      return authorization_failed()
-    return f(*args, **kwargs)
+if COORDINATOR_URL and NODE_URL:
+  start_heartbeat(COORDINATOR_URL, NODE_URL)
 
-  return decorated
 
+@flask_app.route('/ping')
+def ping():
+  return Response("pong")
 
-def response_ok(**kwargs):
-  kwargs.update(status='received')
-  return jsonify(kwargs)
 
+@flask_app.route('/metrics')
+@auth_required
+@with_traceback_on_err
+def metrics_endpoint():
+  return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-def with_traceback_on_err(f):
-  @wraps(f)
-  def decorated(*args, **kwargs):
-    try:
-      return f(*args, **kwargs)
-    except:
-      return jsonify(reject_with_traceback())
 
-  return decorated
+@flask_app.route('/admission', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def admission_status():
+  """
+  The memory (in MB) and CPUs of the sandboxes running on this node, the budget of each, and how many sandboxes
+  are running and waiting to be admitted
+  """
+  return response_ok(**admission.status())
 
 
 @flask_app.route('/upload/case/<fid>/<io>', methods=['POST'])
@@ -64,15 +68,63 @@ def upload_case(fid, io):
   """
   This API is only used for testing purposes, and is likely to fail in production
   You need to do something like /upload/case/f3758/input and bind binary data to request.data
+  The body is streamed to disk, and the sha256 of the content is returned.
   """
-  case = Case(fid)
+  case = Case(check_fingerprint(fid))
   if io == 'input':
-    case.write_input_binary(request.data)
+    return response_ok(sha256=case.write_input_stream(request.stream))
   elif io == 'output':
-    case.write_output_binary(request.data)
+    return response_ok(sha256=case.write_output_stream(request.stream))
   return response_ok()
 
 
+@flask_app.route('/download/case/<fid>/<io>', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def download_case(fid, io):
+  """
+  The input or output of a case, for the coordinator to copy it to a node that does not have it
+  """
+  case = Case(check_fingerprint(fid))
+  if io not in ('input', 'output'):
+    raise ValueError("Invalid case file: %r" % (io,))
+  return send_file(case.data_input_file if io == 'input' else case.data_output_file,
+                   mimetype='application/octet-stream')
+
+
+@flask_app.route('/upload/cases', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def upload_cases():
+  """
+  Upload many cases at once, as a multipart form with:
+  - archive: a tar (possibly compressed) or zip file
+  - manifest: a JSON list of {"fingerprint": ..., "input": member name, "output": member name}
+  The sha256 of every file extracted is returned, by fingerprint.
+  """
+  manifest = json.loads(request.form['manifest'])
+  archive_directory = make_temp_dir()
+  try:
+    archive_file = path.join(archive_directory, 'archive')
+    request.files['archive'].save(archive_file)
+    return response_ok(cases=extract_cases(archive_file, manifest))
+  finally:
+    shutil.rmtree(archive_directory)
+
+
+@flask_app.route('/query/cases', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def query_cases():
+  """
+  Which of the cases (a list of fingerprints) have both their input and output on this node
+  """
+  fingerprints = [check_fingerprint(fingerprint) for fingerprint in request.get_json()['cases']]
+  return response_ok(present=[fingerprint for fingerprint in fingerprints
+                              if path.exists(Case(fingerprint).data_input_file) and
+                              path.exists(Case(fingerprint).data_output_file)])
+
+
 @flask_app.route('/upload/spj', methods=['POST'])
 @auth_required
 @with_traceback_on_err
@@ -80,6 +132,7 @@ def upload_spj():
   data = request.get_json()
   program = SpecialJudge(data['lang'], data['fingerprint'])
   program.compile(data['code'], 30)
+  spj_registry.add(data['fingerprint'], data['lang'], program.exe_file)
   return response_ok()
 
 
@@ -89,7 +142,7 @@ def upload_spj():
 def list_spj():
   return jsonify({
     "status": "received",
-    "spj": list(os.listdir(SPJ_BASE))
+    "spj": spj_registry.list()
   })
 
 
@@ -99,8 +152,9 @@ def list_spj():
 def judge():
   data = request.get_json()
   hold = data.get('hold', True)
-  fingerprint = data['fingerprint']
+  fingerprint = check_fingerprint(data['fingerprint'])
 
+  clear_cancel(fingerprint)  # left over by a cancel that came too late
   cache.set(fingerprint, {'verdict': Verdict.WAITING.value}, timeout=3600)
   args = (fingerprint, data['code'], data['lang'], data['cases'],
           data['max_time'], data['max_memory'],)
@@ -108,22 +162,57 @@ def judge():
                 interactor_fingerprint=data.get('interactor'),
                 run_until_complete=data.get('run_until_complete', False),
                 group_list=data.get('group_list'),
-                group_dependencies=data.get('group_dependencies'))
+                group_dependencies=data.get('group_dependencies'),
+                concurrency=data.get('concurrency'),
+                fail_fast=data.get('fail_fast'),
+                checker_daemon=data.get('checker_daemon'))
   if hold:
     return jsonify(judge_handler(*args, **kwargs))
   else:
-    threading.Thread(target=judge_handler, args=args, kwargs=kwargs).start()
+    try:
+      job_queue.push(fingerprint, args, kwargs)
+    except QueueFullError as e:
+      cache.delete(fingerprint)
+      return jsonify({'status': 'busy', 'message': str(e)}), 503
     return response_ok()
 
 
+@flask_app.route('/cancel', methods=['POST'])
+@auth_required
+@with_traceback_on_err
+def cancel():
+  """
+  Cancel a judge that is waiting or running: a waiting job is removed from the queue, a running judge stops
+  its sandboxes. Cases not judged are reported as WAITING, and the status gets "cancelled": true.
+  """
+  data = request_data()
+  fingerprint = check_fingerprint(data['fingerprint'])
+  status = cache.get(fingerprint)
+  if status is None:
+    return jsonify({'status': 'reject', 'message': 'fingerprint not found'})
+  if status.get('cancelled') or status.get('status') == 'reject' or \
+      status.get('verdict') not in (Verdict.WAITING.value, Verdict.JUDGING.value):
+    return jsonify({'status': 'reject', 'message': 'judge is already finished'})
+  if job_queue.remove(fingerprint):
+    cache.set(fingerprint, {'status': 'received', 'verdict': Verdict.WAITING.value, 'cancelled': True},
+              timeout=3600)
+  else:
+    request_cancel(fingerprint)
+  return response_ok()
+
+
 @flask_app.route('/query', methods=['GET'])
 @auth_required
 @with_traceback_on_err
 def query():
-  data = request.get_json()
+  data = request_data()
   fingerprint = data['fingerprint']
-  status = cache.get(fingerprint)
+  status = JudgeStatus.read(fingerprint)
   status.setdefault('status', 'received')
+  if status.get('verdict') == Verdict.WAITING.value:
+    position = job_queue.position(fingerprint)
+    if position is not None:
+      status['queue_position'] = position
   return jsonify(status)
 
 
@@ -131,13 +220,22 @@ def query():
 @auth_required
 @with_traceback_on_err
 def query_result():
-  data = request.get_json()
-  fingerprint = data.get('fingerprint', '')
-  status = cache.get('report_%s' % fingerprint)
-  if status is None:
-    status = ''
-  return status
+  """
+  The whole report as text, or with "case" (a single case) or "start" and "end" (a range of cases, end excluded),
+  the reports of these cases as JSON, cases without report being left out.
+  """
+  data = request_data()
+  store = ReportStore(data.get('fingerprint', ''))
+  if 'case' in data:
+    start = int(data['case'])
+    end = start + 1
+  elif 'start' in data or 'end' in data:
+    start = int(data.get('start', 0))
+    end = int(data['end']) if 'end' in data else None
+  else:
+    return store.read_all()
+  return response_ok(report=[{'case': case_idx, 'report': text} for case_idx, text in store.read(start, end)])
 
 
 if __name__ == '__main__':
-  flask_app.run(host='0.0.0.0', port=5000)
+  flask_app.run(host='0.0.0.0', port=PORT)
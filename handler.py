@@ -1,25 +1,115 @@
 import os
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import cpu_count
 from io import StringIO
 
 from werkzeug.contrib.cache import MemcachedCache
 
-from config.config import Verdict, TRACEBACK_LIMIT, DEBUG
+from config.config import Verdict, TRACEBACK_LIMIT, DEBUG, JUDGE_CONCURRENCY, DEFAULT_CHECKER, FAIL_FAST
+from config.config import CHECKER_DAEMON
+from config.config import STATUS_FLUSH_INTERVAL, STATUS_FLUSH_CASES, STATUS_POLL_INTERVAL
+from core.cancel import CancelToken, watch_cancel, clear_cancel
 from core.case import Case
-from core.exception import CompileError
+from core.exception import CompileError, JudgeCancelled
 from core.interaction import InteractiveRunner
 from core.judge import SpecialJudge
+from core.metrics import SUBMISSIONS, CASES, CACHE_WRITE_SECONDS
+from core.pool import CaseRunnerPool
+from core.report import ReportStore
 from core.runner import CaseRunner
+from core.stats import CaseStats
 from core.submission import Submission
+from core.timing import timed
 
 
 cache = MemcachedCache([os.environ.get("MEMCACHED", "localhost") + ':11211'])
+case_stats = CaseStats()
 
 
 def reject_with_traceback():
   return {'status': 'reject', 'message': traceback.format_exc(TRACEBACK_LIMIT)}
 
 
+class JudgeStatus(object):
+  """
+  The status of a judge is kept in cache as a header, which is the response without detail, and the detail
+  in chunks, so that every case result is sent to the cache only once. Writes are coalesced: a new chunk is
+  flushed when it has STATUS_FLUSH_CASES cases, or STATUS_FLUSH_INTERVAL seconds after the last flush.
+  """
+
+  def __init__(self, fingerprint):
+    self.fingerprint = fingerprint
+    self.chunks = 0
+    self.flushed_cases = 0
+    self.last_flush = time.time()
+
+  @staticmethod
+  def chunk_key(fingerprint, chunk):
+    return '%s_detail_%d' % (fingerprint, chunk)
+
+  def write(self, response, force=False):
+    detail = response.get('detail')
+    pending = len(detail) - self.flushed_cases if detail is not None else 0
+    if not force and pending < STATUS_FLUSH_CASES and time.time() - self.last_flush < STATUS_FLUSH_INTERVAL:
+      return
+    with CACHE_WRITE_SECONDS.time():
+      if pending > 0:
+        cache.set(self.chunk_key(self.fingerprint, self.chunks), detail[self.flushed_cases:], timeout=3600)
+        self.chunks += 1
+        self.flushed_cases = len(detail)
+      header = {k: v for k, v in response.items() if k != 'detail'}
+      if detail is not None:
+        header['detail_chunks'] = self.chunks
+      cache.set(self.fingerprint, header, timeout=3600)
+    self.last_flush = time.time()
+
+  @classmethod
+  def read_chunks(cls, fingerprint, start, end):
+    detail = []
+    if end > start:
+      for chunk in cache.get_many(*[cls.chunk_key(fingerprint, i) for i in range(start, end)]):
+        detail.extend(chunk or [])
+    return detail
+
+  @classmethod
+  def read(cls, fingerprint):
+    """
+    :return: the response as it was written, or None if it is not found
+    """
+    status = cache.get(fingerprint)
+    if status is not None and 'detail_chunks' in status:
+      status['detail'] = cls.read_chunks(fingerprint, 0, status.pop('detail_chunks'))
+    return status
+
+  @classmethod
+  def watch(cls, fingerprint, timeout=3600):
+    """
+    Poll the cache and yield ('case', index, result) for every new case and ('status', header) whenever the
+    header changes, until the judge is finished.
+    """
+    chunks, cases, last_header = 0, 0, None
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+      header = cache.get(fingerprint)
+      if header is None:
+        yield 'status', {'status': 'reject', 'message': 'fingerprint not found'}
+        return
+      new_chunks = header.pop('detail_chunks', chunks)
+      for result in cls.read_chunks(fingerprint, chunks, new_chunks):
+        yield 'case', cases, result
+        cases += 1
+      chunks = new_chunks
+      if header != last_header:
+        yield 'status', header
+        last_header = header
+      if header.get('status') == 'reject' or header.get('cancelled') or \
+          header.get('verdict') not in (Verdict.WAITING.value, Verdict.JUDGING.value):
+        return
+      time.sleep(STATUS_POLL_INTERVAL)
+
+
 def trace_group_dependencies(dep):
   def dfs(x, graph, reachable):
     reachable.add(x)
@@ -42,13 +132,29 @@ def trace_group_dependencies(dep):
   return ret
 
 
+def compile_submission(submission, code, max_time, cancel_token):
+  with timed("compile"):
+    submission.compile(code, max_time, cancel_token=cancel_token)
+
+
 def judge_handler(sub_fingerprint, sub_code, sub_lang,
                   case_list, max_time, max_memory,
                   checker_fingerprint='',
                   interactor_fingerprint=None,
                   run_until_complete=False,
                   group_list=None,
-                  group_dependencies=None):
+                  group_dependencies=None,
+                  concurrency=None,
+                  fail_fast=None,
+                  checker_daemon=None):
+  """
+  :param fail_fast: unless run_until_complete, run first the cases that are likely to fail, according to
+                    their statistics (FAIL_FAST by default); results are reported in the order of case_list
+  :param checker_daemon: to run an uploaded checker in one sandbox for many cases (CHECKER_DAEMON by default)
+  """
+  status = JudgeStatus(sub_fingerprint)
+  cancel_token = CancelToken()
+  stop_watching_cancel = watch_cancel(sub_fingerprint, cancel_token)
   try:
     assert group_list is None or len(group_list) == len(case_list)
     # group should be like [1,1,2,2,2,3,3,3,3] and similar
@@ -57,6 +163,7 @@ def judge_handler(sub_fingerprint, sub_code, sub_lang,
 
     try:
       detail = []
+      results = dict()  # results of the cases run, by index in case_list
       skipped_groups = set()
       # enum is converted into value manually for json serialization
       response = {'status': 'received', 'verdict': Verdict.JUDGING.value, 'detail': detail}
@@ -64,35 +171,89 @@ def judge_handler(sub_fingerprint, sub_code, sub_lang,
       time_verdict = -1
       memory_verdict = -1
 
-      report = StringIO()
+      def is_skipped(case_idx):
+        if run_until_complete:
+          return False
+        if group_list is not None:
+          return group_list[case_idx] in skipped_groups
+        return sum_verdict_value != Verdict.ACCEPTED.value
+
+      def waiting_result(case_idx):
+        if group_list is not None:
+          return {'group': group_list[case_idx], 'verdict': Verdict.WAITING.value}
+        return {'verdict': Verdict.WAITING.value}
+
+      report = ReportStore(sub_fingerprint)
+      report.create()
       submission = Submission(sub_lang)
-      submission.compile(sub_code, max(max_time * 5, 15))
+      # the submission is compiled while the rest is set up, so that a judge that cannot run fails right away
+      compile_token = CancelToken(parent=cancel_token)
+      compile_executor = ThreadPoolExecutor(max_workers=1)
+      compile_future = compile_executor.submit(compile_submission, submission, sub_code,
+                                               max(max_time * 5, 15), compile_token)
+      try:
+        cases = [Case(case_fingerprint) for case_fingerprint in case_list]
+        missing_cases = [case.fingerprint for case in cases if not case.exists()]
+        if missing_cases:
+          raise FileNotFoundError("Case data does not exist: %s" % ", ".join(missing_cases))
+        for case in cases:
+          case.prefetch()  # in the background
 
-      if not checker_fingerprint:
-        checker_fingerprint = 'defaultspj'
-      checker = SpecialJudge.fromExistingFingerprint(checker_fingerprint)
+        if not checker_fingerprint:
+          checker_fingerprint = DEFAULT_CHECKER
+        checker = SpecialJudge.fromExistingFingerprint(checker_fingerprint)
 
-      if interactor_fingerprint:
-        interactor = SpecialJudge.fromExistingFingerprint(interactor_fingerprint)
-        case_runner = InteractiveRunner(submission, interactor, checker, max_time, max_memory, report_file=report)
-      else:
-        case_runner = CaseRunner(submission, checker, max_time, max_memory, report_file=report)
+        if checker_daemon is None:
+          checker_daemon = CHECKER_DAEMON
+        if interactor_fingerprint:
+          interactor = SpecialJudge.fromExistingFingerprint(interactor_fingerprint)
+          make_case_runner = lambda: InteractiveRunner(submission, interactor, checker, max_time, max_memory,
+                                                       report_file=StringIO(), cancel_token=cancel_token,
+                                                       checker_daemon=checker_daemon)
+        else:
+          make_case_runner = lambda: CaseRunner(submission, checker, max_time, max_memory, report_file=StringIO(),
+                                                cancel_token=cancel_token, checker_daemon=checker_daemon)
 
-      for case_idx, case_fingerprint in enumerate(case_list):
-        if group_list is not None:
-          case_result = {'group': group_list[case_idx], 'verdict': -3}
-          if not run_until_complete and group_list[case_idx] in skipped_groups:
-            detail.append(case_result)
-            continue
+        # each worker of the pool has a case runner (and thus a workspace) of its own
+        concurrency = min(concurrency or JUDGE_CONCURRENCY, cpu_count(), max(len(case_list), 1))
+        case_pool = CaseRunnerPool(make_case_runner, concurrency)
+
+        if fail_fast is None:
+          fail_fast = FAIL_FAST
+        if fail_fast and not run_until_complete:
+          order = case_stats.fail_fast_order(case_list, group_list,
+                                             input_sizes=[case.input_size() for case in cases])
         else:
-          case_result = dict()
+          order = list(range(len(case_list)))
+      except:
+        compile_token.cancel()  # of no use any more
+        wait([compile_future])
+        raise
+      finally:
+        compile_executor.shutdown(wait=False)
+      try:
+        compile_future.result()
+      finally:
+        compile_token.close()
 
-        case = Case(case_fingerprint)
-        case_result.update(case_runner.run(case))
-        case_result['verdict'] = case_result['verdict'].value
+      case_results = case_pool.imap((cases[case_idx] for case_idx in order), skip=lambda i: is_skipped(order[i]))
+      for case_idx, (run_result, case_report) in zip(order, case_results):
+        if is_skipped(case_idx):
+          # a case might have been started before its group is skipped, its result is discarded then
+          results[case_idx] = waiting_result(case_idx)
+          continue
+        case_result = {'group': group_list[case_idx]} if group_list is not None else dict()
 
-        detail.append(case_result)
-        cache.set(sub_fingerprint, response, timeout=3600)
+        case_result.update(run_result)
+        CASES.inc(lang=sub_lang, verdict=case_result['verdict'].name)
+        case_result['verdict'] = case_result['verdict'].value
+        results[case_idx] = case_result
+        # the detail is published in the order of the case list, as far as the cases are done
+        while len(detail) in results:
+          detail.append(results[len(detail)])
+        with timed("report"):
+          report.write(case_idx, case_report)
+          status.write(response)
         if case_result.get('time'):
           time_verdict = max(time_verdict, case_result['time'])
         if case_result.get('memory'):
@@ -104,19 +265,39 @@ def judge_handler(sub_fingerprint, sub_code, sub_lang,
             skipped_groups |= group_dependencies.get(case_result['group'], {case_result['group']})
           if not run_until_complete and not group_list:
             break
+      # cases not run before the last case run (by the order of the case list) are left waiting
+      last_case = len(case_list) if group_list is not None else max(results, default=-1) + 1
+      detail.extend(results.get(case_idx) or waiting_result(case_idx) for case_idx in range(len(detail), last_case))
+      if fail_fast:
+        # statistics are only kept where they are used, to spare other judges a write
+        case_stats.record([(case_list[case_idx], result['verdict'] != Verdict.ACCEPTED.value,
+                            result.get('time', 0), cases[case_idx].input_size())
+                           for case_idx, result in results.items() if 'time' in result])
     except CompileError as ce:
       sum_verdict_value = Verdict.COMPILE_ERROR.value
       response.update(message=ce.detail)
+    except JudgeCancelled:
+      # cases that are not judged are left waiting
+      detail.extend(results.get(case_idx) or waiting_result(case_idx) for case_idx in range(len(detail), len(case_list)))
+      sum_verdict_value = Verdict.WAITING.value
+      response.update(cancelled=True)
     response.update(verdict=sum_verdict_value)
     if time_verdict >= 0:
       response.update(time=time_verdict)
     if memory_verdict >= 0:
       response.update(memory=memory_verdict)
-    cache.set('report_%s' % sub_fingerprint, report.getvalue(), timeout=1800)
   except:
     response = reject_with_traceback()
   finally:
-    cache.set(sub_fingerprint, response, timeout=3600)
+    stop_watching_cancel()
+    cancel_token.cancel()  # anything still running is of no use
+    clear_cancel(sub_fingerprint)
+    status.write(response, force=True)
+    SUBMISSIONS.inc(lang=sub_lang, verdict=Verdict(response['verdict']).name if 'verdict' in response else 'REJECT')
+    try:
+      report.close()
+    except NameError:
+      pass
 
     if not DEBUG:
       try:
@@ -124,7 +305,7 @@ def judge_handler(sub_fingerprint, sub_code, sub_lang,
       except NameError:
         pass
       try:
-        case_runner.clean()
+        case_pool.clean()
       except NameError:
         pass
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+    Runs a testlib checker for many cases inside one sandbox, so that the sandbox is set up once per
+    submission instead of once per case.
+
+      python3 checker_daemon.py -- <checker command>
+
+    Every line read from stdin is a JSON request {"args": [input, output, answer, result], "time_limit": t}.
+    The checker command is run with the args, without stdin and stdout, and killed if it runs for more than
+    2t + 1 seconds (or t + 1 seconds of CPU), the same limits a checker has in a sandbox of its own.
+    A JSON line {"exit_code", "signal", "time", "wall_time", "memory"} is written back for every request,
+    memory being the peak resident memory of the checker in KB (which includes what the daemon had resident
+    when it started the checker, a few MB).
+    The daemon exits at the end of stdin.
+"""
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+
+def check(command, args, time_limit):
+  def limit_cpu():
+    cpu_limit = int(math.ceil(time_limit)) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+
+  wall_start = time.time()
+  process = subprocess.Popen(command + args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, preexec_fn=limit_cpu)
+  timer = threading.Timer(time_limit * 2 + 1, process.kill)
+  timer.start()
+  try:
+    # waited for here rather than by Popen, for the resource usage of this checker alone
+    _, status, usage = os.wait4(process.pid, 0)
+  finally:
+    timer.cancel()
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+  return {"exit_code": max(process.returncode, 0), "signal": max(-process.returncode, 0),
+          "time": round(usage.ru_utime + usage.ru_stime, 3), "wall_time": round(time.time() - wall_start, 3),
+          "memory": usage.ru_maxrss}
+
+
+def main():
+  command = sys.argv[sys.argv.index("--") + 1:]
+  for line in sys.stdin:
+    request = json.loads(line)
+    sys.stdout.write(json.dumps(check(command, request["args"], request["time_limit"])) + "\n")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1 @@
+#include <bits/stdc++.h>
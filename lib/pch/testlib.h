@@ -0,0 +1 @@
+#include <testlib.h>
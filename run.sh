@@ -12,6 +12,12 @@ echo "password:" $PASSWORD >> config/token.yaml
 ./nsjail/setup.sh
 chown compiler -R /sys/fs/cgroup/memory/NSJAIL /sys/fs/cgroup/cpu/NSJAIL /sys/fs/cgroup/pids/NSJAIL
 chgrp compiler -R /sys/fs/cgroup/memory/NSJAIL /sys/fs/cgroup/cpu/NSJAIL /sys/fs/cgroup/pids/NSJAIL
-chown compiler:compiler run/log run/tmp run/sub run/spj
-gunicorn flask_server:flask_app --workers $n --worker-connections 1000 --error-logfile /ejudge/run/log/gunicorn.log \
+chown compiler:compiler run/log run/tmp run/sub run/spj run/state run/report run/metrics run/cancel run/warm
+su compiler -s /bin/sh -c "python3 -m core.warmup"
+su compiler -s /bin/sh -c "python3 worker.py >> /ejudge/run/log/worker.log 2>&1" &
+# server-sent events hold their connection as long as the judge runs: one gevent worker serves them all
+gunicorn stream_server:stream_app -k gevent --workers 1 --worker-connections 1000 \
+    --error-logfile /ejudge/run/log/gunicorn-stream.log --log-level warning -u compiler -g compiler \
+    --bind 0.0.0.0:5001 &
+gunicorn flask_server:flask_app --workers $n --error-logfile /ejudge/run/log/gunicorn.log \
     --timeout 600 --log-level warning -u compiler -g compiler --bind 0.0.0.0:5000
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+    Server-sent events of the judges of a node, on STREAM_PORT. A stream is open as long as its judge runs, so they
+    are served apart from flask_server.py, by a gevent worker (see run.sh) on which an open stream costs a greenlet
+    and not a whole worker. No judge runs here: judges block in system calls, which would stop every stream.
+"""
+import json
+
+from flask import Response, Flask, stream_with_context
+
+from api import auth_required, request_data, with_traceback_on_err
+from config.config import STREAM_PORT, STREAM_TIMEOUT
+from handler import JudgeStatus
+
+stream_app = Flask(__name__)
+
+
+@stream_app.route('/ping')
+def ping():
+  return Response("pong")
+
+
+@stream_app.route('/query/stream', methods=['GET'])
+@auth_required
+@with_traceback_on_err
+def query_stream():
+  """
+  Server-sent events of a judge: a "case" event with its index for every case finished,
+  and a "status" event whenever the rest of the response changes. The stream ends when the judge does,
+  or after STREAM_TIMEOUT seconds. If the last status is not final then, the client reconnects (EventSource
+  does by itself, after "retry" ms), and the events are sent again from the first case.
+
+  Each stream polls the cache until it ends, so this must be served by an async worker (gevent): on a sync
+  worker, a few open streams would take every worker.
+  """
+  fingerprint = request_data()['fingerprint']
+
+  def generate():
+    yield 'retry: 1000\n\n'
+    for event in JudgeStatus.watch(fingerprint, timeout=STREAM_TIMEOUT):
+      if event[0] == 'case':
+        _, index, result = event
+        data = dict(result, index=index)
+      else:
+        _, data = event
+        data.setdefault('status', 'received')
+      yield 'event: %s\ndata: %s\n\n' % (event[0], json.dumps(data))
+
+  return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+if __name__ == '__main__':
+  stream_app.run(host='0.0.0.0', port=STREAM_PORT, threaded=True)
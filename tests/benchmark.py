@@ -0,0 +1,309 @@
+"""
+Judging benchmark.
+
+  python3 tests/benchmark.py --lang cpp,python --problem aplusb,interactive --submissions 40 --concurrency 4
+
+Submissions are judged by judge_handler in this process, which needs what the judge needs (nsjail, memcached,
+the run directories), or by a running server with --url. The problems are built from tests/data/aplusb and
+tests/interact, the solutions from tests/submission/aplusb.<lang>.
+
+The result is written as JSON (--output): submissions and cases per second, latency percentiles per
+submission, and, when judging in process, the time spent in every phase (compile, sandbox_setup,
+execution, check, report). With --baseline, the result is compared to an earlier one and the exit code is
+non-zero if the throughput drops by more than --tolerance.
+
+To measure the judge alone, without nsjail or root, set SANDBOX_BACKEND=fake (or local), see core/sandbox.py:
+
+  SANDBOX_BACKEND=fake FAKE_SANDBOX_LATENCY=0.005 python3 tests/benchmark.py --lang cpp --submissions 1000
+
+With --startup, the solutions are run directly in a sandbox instead, with and without the warm start of
+their language (see core/warmup.py), and the CPU and wall time of every run are compared:
+
+  python3 tests/benchmark.py --startup --lang java,python --submissions 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import LANGUAGE_CONFIG, Verdict
+from core import timing
+from core.util import random_string
+
+TESTS_BASE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_content(file, mode='r'):
+  with open(os.path.join(TESTS_BASE, file), mode) as f:
+    return f.read()
+
+
+def summarize(values):
+  values = sorted(values)
+  if not values:
+    return {'count': 0}
+
+  def percentile(p):
+    return round(values[min(len(values) - 1, max(int(len(values) * p + 0.5) - 1, 0))], 6)
+
+  return {'count': len(values), 'total': round(sum(values), 6), 'mean': round(sum(values) / len(values), 6),
+          'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99), 'max': round(values[-1], 6)}
+
+
+class PhaseRecorder(object):
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.phases = {phase: [] for phase in timing.PHASES}
+
+  def __call__(self, phase, seconds):
+    with self.lock:
+      self.phases.setdefault(phase, []).append(seconds)
+
+  def summary(self):
+    return {phase: summarize(values) for phase, values in self.phases.items()}
+
+
+class LocalJudge(object):
+
+  def upload_case(self, fingerprint, input_data, output_data):
+    from core.case import Case
+    case = Case(fingerprint)
+    case.write_input_binary(input_data)
+    case.write_output_binary(output_data)
+
+  def upload_spj(self, fingerprint, lang, code):
+    from core.judge import SpecialJudge
+    from core.registry import spj_registry
+    program = SpecialJudge(lang, fingerprint)
+    program.compile(code, 30)
+    spj_registry.add(fingerprint, lang, program.exe_file)
+
+  def judge(self, **kwargs):
+    from handler import judge_handler
+    return judge_handler(**kwargs)
+
+
+class HttpJudge(object):
+
+  def __init__(self, url, token):
+    self.url = url.rstrip('/')
+    self.token = token
+
+  def post(self, route, **kwargs):
+    response = requests.post(self.url + route, auth=self.token, **kwargs).json()
+    if response.get('status') != 'received':
+      raise RuntimeError('%s failed: %s' % (route, response))
+    return response
+
+  def upload_case(self, fingerprint, input_data, output_data):
+    self.post('/upload/case/%s/input' % fingerprint, data=input_data)
+    self.post('/upload/case/%s/output' % fingerprint, data=output_data)
+
+  def upload_spj(self, fingerprint, lang, code):
+    self.post('/upload/spj', json=dict(fingerprint=fingerprint, lang=lang, code=code))
+
+  def judge(self, sub_fingerprint, sub_code, sub_lang, case_list, max_time, max_memory,
+            checker_fingerprint, interactor_fingerprint, run_until_complete, concurrency):
+    data = dict(fingerprint=sub_fingerprint, code=sub_code, lang=sub_lang, cases=case_list,
+                max_time=max_time, max_memory=max_memory, checker=checker_fingerprint,
+                run_until_complete=run_until_complete)
+    if interactor_fingerprint:
+      data.update(interactor=interactor_fingerprint)
+    if concurrency:
+      data.update(concurrency=concurrency)
+    return requests.post(self.url + '/judge', json=data, auth=self.token).json()
+
+
+def prepare_problems(judge, problems, languages):
+  prepared = []
+  if 'aplusb' in problems:
+    cases = []
+    count = len([file for file in os.listdir(os.path.join(TESTS_BASE, 'data', 'aplusb'))
+                 if file.startswith('ex_input')])
+    for i in range(1, count + 1):
+      fingerprint = 'bench_' + random_string()
+      judge.upload_case(fingerprint, read_content('data/aplusb/ex_input%d.txt' % i, 'rb'),
+                        read_content('data/aplusb/ex_output%d.txt' % i, 'rb'))
+      cases.append(fingerprint)
+    submissions = {lang: read_content('submission/aplusb.%s' % lang) for lang in languages
+                   if os.path.exists(os.path.join(TESTS_BASE, 'submission', 'aplusb.%s' % lang))}
+    prepared.append(dict(name='aplusb', cases=cases, interactor=None, submissions=submissions))
+  if 'interactive' in problems:
+    interactor = 'bench_' + random_string()
+    judge.upload_spj(interactor, 'cpp', read_content('interact/interactor-a-plus-b.cpp'))
+    case = 'bench_' + random_string()
+    judge.upload_case(case, read_content('interact/a-plus-b-input.txt', 'rb'),
+                      read_content('interact/a-plus-b-output.txt', 'rb'))
+    submissions = {'python': read_content('interact/a-plus-b.py')} if 'python' in languages else {}
+    prepared.append(dict(name='interactive', cases=[case] * 10, interactor=interactor, submissions=submissions))
+  return [problem for problem in prepared if problem['submissions']]
+
+
+def run_benchmark(judge, problems, args):
+  jobs = []
+  for i in range(args.warmup + args.submissions):
+    problem = problems[i % len(problems)]
+    langs = sorted(problem['submissions'])
+    lang = langs[i // len(problems) % len(langs)]
+    code = problem['submissions'][lang]
+    if args.cold and lang != 'text':
+      code += '\n' * (i + 1)  # a different code each time defeats the compile cache
+    jobs.append((i < args.warmup, problem, lang, code))
+
+  def judge_one(job):
+    warmup, problem, lang, code = job
+    start = time.perf_counter()
+    response = judge.judge(sub_fingerprint='bench_' + random_string(), sub_code=code, sub_lang=lang,
+                           case_list=problem['cases'], max_time=args.max_time, max_memory=args.max_memory,
+                           checker_fingerprint=args.checker, interactor_fingerprint=problem['interactor'],
+                           run_until_complete=True, concurrency=args.case_concurrency)
+    return dict(warmup=warmup, problem=problem['name'], lang=lang, latency=time.perf_counter() - start,
+                cases=len(response.get('detail', [])), verdict=response.get('verdict'),
+                status=response.get('status'))
+
+  with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+    for job in jobs[:args.warmup]:
+      judge_one(job)
+    recorder = PhaseRecorder()
+    timing.add_listener(recorder)
+    try:
+      start = time.perf_counter()
+      samples = list(executor.map(judge_one, jobs[args.warmup:]))
+      elapsed = time.perf_counter() - start
+    finally:
+      timing.remove_listener(recorder)
+  return samples, elapsed, recorder
+
+
+def make_report(samples, elapsed, recorder, args):
+  cases = sum(sample['cases'] for sample in samples)
+  verdicts = Counter(Verdict(sample['verdict']).name if sample['verdict'] is not None else sample['status']
+                     for sample in samples)
+  by_group = {}
+  for sample in samples:
+    by_group.setdefault('%s/%s' % (sample['problem'], sample['lang']), []).append(sample['latency'])
+  return {
+    'node': {'hostname': socket.gethostname(), 'cpus': os.cpu_count()},
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'config': vars(args),
+    'submissions': len(samples),
+    'cases': cases,
+    'elapsed': round(elapsed, 6),
+    'submissions_per_sec': round(len(samples) / elapsed, 3) if elapsed else 0,
+    'cases_per_sec': round(cases / elapsed, 3) if elapsed else 0,
+    'latency': summarize([sample['latency'] for sample in samples]),
+    'latency_by_problem': {group: summarize(latencies) for group, latencies in sorted(by_group.items())},
+    'phases': recorder.summary() if not args.url else {},
+    'verdicts': dict(verdicts),
+  }
+
+
+def startup_benchmark(languages, args):
+  from core import warmup
+  from core.submission import Submission
+  from core.util import make_temp_dir
+  report = {}
+  for lang in languages:
+    submission = Submission(lang)
+    submission.compile(read_content('submission/aplusb.%s' % lang), 30)
+    working_directory = make_temp_dir()
+    report[lang] = {'warm_start': warmup.has_warmup(lang) and warmup.build(lang)}
+    try:
+      for warm_start in (False, True):
+        submission.warm_start = warm_start
+        cpu, wall = [], []
+        for _ in range(args.submissions):
+          start = time.perf_counter()
+          result = submission.run(args.max_time, args.max_memory, working_directory,
+                                  stdin_file=os.path.join(TESTS_BASE, 'data', 'aplusb', 'ex_input1.txt'),
+                                  stdout_file='/dev/null', stderr_file='/dev/null')
+          wall.append(time.perf_counter() - start)
+          cpu.append(result.time)
+        report[lang]['warm' if warm_start else 'cold'] = {'cpu': summarize(cpu), 'wall': summarize(wall)}
+    finally:
+      submission.clean()
+      shutil.rmtree(working_directory, ignore_errors=True)
+  return report
+
+
+def compare_with_baseline(report, baseline_file, tolerance):
+  with open(baseline_file) as f:
+    baseline = json.load(f)
+  regressed = False
+  for key in ('submissions_per_sec', 'cases_per_sec'):
+    if baseline.get(key):
+      ratio = report[key] / baseline[key]
+      print('%s: %.3f (baseline %.3f, x%.3f)' % (key, report[key], baseline[key], ratio))
+      regressed = regressed or ratio < 1 - tolerance
+  return regressed
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark judging throughput and latency')
+  parser.add_argument('--lang', default='cpp', help='comma separated languages from lang.yaml')
+  parser.add_argument('--problem', default='aplusb', help='comma separated, among aplusb and interactive')
+  parser.add_argument('--submissions', type=int, default=20)
+  parser.add_argument('--warmup', type=int, default=1, help='submissions judged before measuring')
+  parser.add_argument('--concurrency', type=int, default=1, help='submissions judged at the same time')
+  parser.add_argument('--case-concurrency', type=int, default=None, help='cases of a submission run at the same time')
+  parser.add_argument('--max-time', type=float, default=1)
+  parser.add_argument('--max-memory', type=int, default=128)
+  parser.add_argument('--checker', default='', help='checker fingerprint, the default checker if empty')
+  parser.add_argument('--cold', action='store_true', help='make every submission compile')
+  parser.add_argument('--url', default=None, help='judge through a server, e.g. http://localhost:5000')
+  parser.add_argument('--token', default='ejudge:naive', help='username:password of the server')
+  parser.add_argument('--output', default='benchmark.json')
+  parser.add_argument('--baseline', default=None, help='an earlier result to compare with')
+  parser.add_argument('--tolerance', type=float, default=0.1)
+  parser.add_argument('--startup', action='store_true',
+                      help='compare the startup of the solutions with and without warm start')
+  args = parser.parse_args()
+
+  languages = [lang for lang in args.lang.split(',') if lang]
+  for lang in languages:
+    if lang not in LANGUAGE_CONFIG:
+      parser.error('unknown language %s' % lang)
+  if args.startup:
+    report = startup_benchmark(languages, args)
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+    for lang, result in report.items():
+      print('%s (warm start %s): cpu p50 %.3fs -> %.3fs, wall p50 %.3fs -> %.3fs' % (
+        lang, 'ready' if result['warm_start'] else 'unavailable', result['cold']['cpu']['p50'],
+        result['warm']['cpu']['p50'], result['cold']['wall']['p50'], result['warm']['wall']['p50']))
+    return
+  judge = HttpJudge(args.url, tuple(args.token.split(':', 1))) if args.url else LocalJudge()
+  problems = prepare_problems(judge, args.problem.split(','), languages)
+  if not problems:
+    parser.error('no solution for these languages and problems')
+
+  samples, elapsed, recorder = run_benchmark(judge, problems, args)
+  report = make_report(samples, elapsed, recorder, args)
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+  print('%d submissions, %d cases in %.3fs: %.3f submissions/s, %.3f cases/s, latency p50 %.3fs p95 %.3fs p99 %.3fs'
+        % (report['submissions'], report['cases'], report['elapsed'], report['submissions_per_sec'],
+           report['cases_per_sec'], report['latency'].get('p50', 0), report['latency'].get('p95', 0),
+           report['latency'].get('p99', 0)))
+  for phase, summary in report['phases'].items():
+    if summary['count']:
+      print('  %-14s %6d x  mean %.4fs  p50 %.4fs  p95 %.4fs  p99 %.4fs' % (
+        phase, summary['count'], summary['mean'], summary['p50'], summary['p95'], summary['p99']))
+  if args.baseline and compare_with_baseline(report, args.baseline, args.tolerance):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import admission
+from core.admission import admit, status
+from core.cancel import CancelToken
+from core.exception import JudgeCancelled
+from tests.test_base import TestBase
+
+
+class AdmissionTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/admission'
+    super(AdmissionTest, self).setUp()
+    self.ledger_file = os.path.join(self.workspace, 'admission.json')
+    self.saved = admission.ADMISSION_MEMORY, admission.ADMISSION_CPUS
+    admission.ADMISSION_MEMORY, admission.ADMISSION_CPUS = 100, 4
+
+  def tearDown(self):
+    admission.ADMISSION_MEMORY, admission.ADMISSION_CPUS = self.saved
+
+  def admit_later(self, memory, reservations, cancel_token=None):
+    """
+    Admit in a thread, which puts the reservation (or the exception) in reservations
+    """
+    def wait():
+      try:
+        reservations.append(admit(memory, cancel_token=cancel_token, ledger_file=self.ledger_file))
+      except JudgeCancelled as e:
+        reservations.append(e)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.2)
+    return thread
+
+  def status(self):
+    return status(self.ledger_file)
+
+  def test_budget_exceeded(self):
+    first = admit(60, ledger_file=self.ledger_file)
+    reservations = []
+    thread = self.admit_later(60, reservations)
+    self.assertEqual([], reservations)
+    self.assertEqual((1, 1), (self.status()['running'], self.status()['waiting']))
+    first.release()
+    thread.join()
+    self.assertEqual(1, len(reservations))
+    self.assertEqual((60, 1, 0), (self.status()['memory_used'], self.status()['running'], self.status()['waiting']))
+    reservations[0].release()
+
+  def test_lone_run(self):
+    reservation = admit(1000, 8, ledger_file=self.ledger_file)  # larger than the budget, but alone
+    self.assertEqual(1000, self.status()['memory_used'])
+    reservation.release()
+    self.assertEqual(0, self.status()['memory_used'])
+
+  def test_first_come_first_admitted(self):
+    first = admit(60, ledger_file=self.ledger_file)
+    large, small = [], []
+    large_thread = self.admit_later(60, large)
+    small_thread = self.admit_later(30, small)
+    self.assertEqual([], small)  # it fits, but the large one came first
+    first.release()
+    large_thread.join()
+    small_thread.join()
+    self.assertEqual((90, 2), (self.status()['memory_used'], self.status()['running']))
+    for reservation in large + small:
+      reservation.release()
+
+  def test_dead_pid(self):
+    process = subprocess.Popen(['true'])
+    process.wait()
+    with open(self.ledger_file, 'w') as fs:
+      json.dump({'running': {'%d:dead' % process.pid: [100, 4]},
+                 'waiting': {'%d:gone' % process.pid: [10, 1, 1]}}, fs)
+    reservation = admit(60, ledger_file=self.ledger_file)
+    self.assertEqual((60, 1, 0), (self.status()['memory_used'], self.status()['running'], self.status()['waiting']))
+    reservation.release()
+
+  def test_cancel_while_waiting(self):
+    first = admit(60, ledger_file=self.ledger_file)
+    token, reservations = CancelToken(), []
+    thread = self.admit_later(60, reservations, token)
+    self.assertEqual(1, self.status()['waiting'])
+    token.cancel()
+    thread.join()
+    self.assertIsInstance(reservations[0], JudgeCancelled)
+    self.assertEqual((1, 0), (self.status()['running'], self.status()['waiting']))
+    first.release()
+
+  def test_no_write_while_waiting(self):
+    first = admit(60, ledger_file=self.ledger_file)
+    reservations = []
+    thread = self.admit_later(60, reservations)
+    inode = os.stat(self.ledger_file).st_ino
+    time.sleep(0.3)  # polls that change nothing
+    self.status()
+    self.assertEqual(inode, os.stat(self.ledger_file).st_ino)
+    first.release()
+    thread.join()
+    reservations[0].release()
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import case_cache
+from core.case_cache import CaseCache
+from tests.test_base import TestBase
+
+
+class CaseCacheTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/case_cache'
+    super(CaseCacheTest, self).setUp()
+    self.cache = CaseCache(os.path.join(self.workspace, 'cache'), 1000)
+
+  def make_file(self, size):
+    return self.make_input('x' * size)
+
+  def age(self, file, seconds):
+    entry = self.cache.lookup(file)
+    self.assertNotEqual(file, entry)
+    os.utime(entry, (time.time() - seconds, time.time() - seconds))
+
+  def test_admission(self):
+    file = self.make_file(100)
+    self.assertEqual(file, self.cache.lookup(file))  # a lookup does not copy
+    self.assertTrue(self.cache.fetch(file))
+    entry = self.cache.lookup(file)
+    self.assertNotEqual(file, entry)
+    self.assertEqual('x' * 100, self.output_content(entry))
+    self.assertEqual(entry, self.cache.lookup(file))
+    self.assertEqual(file, CaseCache(self.cache.directory, 0).lookup(file))
+
+  def test_too_large(self):
+    file = self.make_file(300)  # more than a quarter of the cache
+    self.assertFalse(self.cache.fetch(file))
+    self.assertEqual(file, self.cache.lookup(file))
+
+  def test_eviction_order(self):
+    old, recent, new = self.make_file(200), self.make_file(200), self.make_file(200)
+    for file in (old, recent):
+      self.assertTrue(self.cache.fetch(file))
+    self.age(old, 300)
+    self.age(recent, 200)
+    fillers = [self.make_file(200) for _ in range(3)]
+    for filler in fillers:
+      self.assertTrue(self.cache.fetch(filler))
+      self.age(filler, 100)
+    self.assertTrue(self.cache.fetch(new))  # the least recently used one makes room
+    self.assertEqual(old, self.cache.lookup(old))
+    self.assertNotEqual(recent, self.cache.lookup(recent))
+    self.assertNotEqual(new, self.cache.lookup(new))
+
+  def test_grace_window(self):
+    files = [self.make_file(200) for _ in range(5)]
+    for file in files:
+      self.assertTrue(self.cache.fetch(file))
+    self.age(files[0], case_cache.EVICTION_GRACE // 2)
+    self.assertFalse(self.cache.fetch(self.make_file(200)))  # every copy might be about to be mounted
+    self.age(files[0], case_cache.EVICTION_GRACE * 2)
+    self.assertTrue(self.cache.fetch(self.make_file(200)))
+    self.assertEqual(files[0], self.cache.lookup(files[0]))
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import LANGUAGE_CONFIG
+from core.compile_cache import CompileCache
+from tests.test_base import TestBase
+
+
+class CompileCacheTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/compile_cache'
+    super(CompileCacheTest, self).setUp()
+    self.cache = CompileCache(os.path.join(self.workspace, 'cache'), 1000)
+
+  def key(self, code):
+    return self.cache.make_key(code, 'cpp', LANGUAGE_CONFIG['cpp'])
+
+  def store(self, code, size):
+    self.cache.store_executable(self.key(code), 'bin', self.make_input('x' * size))
+
+  def test_key(self):
+    self.assertEqual(self.key('a'), self.key('a'))
+    self.assertNotEqual(self.key('a'), self.key('b'))
+    self.assertNotEqual(self.key('a'), self.cache.make_key('a', 'cc14', LANGUAGE_CONFIG['cc14']))
+
+  def test_executable(self):
+    self.assertEqual((None, None), self.cache.lookup(self.key('a'), 'bin', self.output_path()))
+    self.store('a', 10)
+    target = self.output_path()
+    self.assertEqual(('exe', target), self.cache.lookup(self.key('a'), 'bin', target))
+    self.assertEqual('x' * 10, self.output_content(target))
+    self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+  def test_error(self):
+    self.cache.store_error(self.key('a'), 'expected ;')
+    self.assertEqual(('error', 'expected ;'), self.cache.lookup(self.key('a'), 'bin', self.output_path()))
+
+  def test_copy_failed(self):
+    self.store('a', 10)
+    target = os.path.join(self.workspace, 'missing', 'exe')
+    self.assertEqual((None, None), self.cache.lookup(self.key('a'), 'bin', target))
+    self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+
+  def test_disabled(self):
+    cache = CompileCache(self.cache.directory, 0)
+    cache.store_error(self.key('a'), 'expected ;')
+    self.assertEqual((None, None), cache.lookup(self.key('a'), 'bin', self.output_path()))
+    self.assertFalse(os.path.exists(self.cache.directory))
+
+  def test_eviction(self):
+    for code in ('old', 'recent'):
+      self.store(code, 400)
+    past = time.time() - 100
+    os.utime(self.cache._entry_path(self.key('old'), 'bin'), (past, past))
+    self.store('new', 400)
+    self.assertEqual((None, None), self.cache.lookup(self.key('old'), 'bin', self.output_path()))
+    for code in ('recent', 'new'):
+      self.assertEqual('exe', self.cache.lookup(self.key(code), 'bin', self.output_path())[0])
+
+  def test_no_walk_within_bound(self):
+    walks = []
+    evict = self.cache.evict
+    self.cache.evict = lambda: walks.append(evict())
+    for code in range(9):
+      self.store(str(code), 100)
+    self.assertEqual(1, len(walks))  # the first store finds the size of the cache
+    self.store('9', 200)
+    self.assertEqual(2, len(walks))
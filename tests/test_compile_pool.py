@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import compile_pool
+from core.compile_pool import compile_slot
+from core.util import parse_cpu_list
+from tests.test_base import TestBase
+
+
+class CompilePoolTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/compile_pool'
+    super(CompilePoolTest, self).setUp()
+    self.saved = compile_pool.COMPILE_SLOT_BASE, compile_pool.COMPILE_CONCURRENCY
+    compile_pool.COMPILE_SLOT_BASE, compile_pool.COMPILE_CONCURRENCY = self.workspace, 2
+
+  def tearDown(self):
+    compile_pool.COMPILE_SLOT_BASE, compile_pool.COMPILE_CONCURRENCY = self.saved
+
+  def compile_all(self, keys, duration=0.2):
+    """
+    :return: the events of compiles of keys, started at once, as (enter or exit, index)
+    """
+    events, lock = [], threading.Lock()
+
+    def compile_one(index):
+      with compile_slot(keys[index]):
+        with lock:
+          events.append(("enter", index))
+        time.sleep(duration)
+        with lock:
+          events.append(("exit", index))
+
+    threads = [threading.Thread(target=compile_one, args=(index,)) for index in range(len(keys))]
+    for thread in threads:
+      thread.start()
+      time.sleep(0.02)
+    for thread in threads:
+      thread.join()
+    return events
+
+  @staticmethod
+  def max_running(events):
+    running, max_running = 0, 0
+    for kind, _ in events:
+      running += 1 if kind == "enter" else -1
+      max_running = max(max_running, running)
+    return max_running
+
+  def test_parse_cpu_list(self):
+    self.assertEqual({0, 1, 2, 3, 8}, parse_cpu_list("0-3,8"))
+    self.assertEqual({5}, parse_cpu_list("5"))
+    self.assertEqual(set(), parse_cpu_list(""))
+
+  def test_slot_limit(self):
+    events = self.compile_all(["%02x" % index * 32 for index in range(4)])
+    self.assertEqual(2, self.max_running(events))
+
+  def test_same_key(self):
+    events = self.compile_all(["ab" * 32, "ab" * 32, "cd" * 32])
+    # the second compile of a key waits for the first, without keeping the other key from its slot
+    self.assertEqual([("enter", 0), ("enter", 2)], events[:2])
+    self.assertLess(events.index(("exit", 0)), events.index(("enter", 1)))
+
+  def test_key_not_locked_while_waiting(self):
+    compile_pool.COMPILE_CONCURRENCY = 1
+    entered = threading.Event()
+    with compile_slot("ab" * 32):
+      thread = threading.Thread(target=self.enter_and_signal, args=("cd" * 32, entered))
+      thread.start()
+      time.sleep(0.2)
+      self.assertFalse(entered.is_set())
+      key_fd = compile_pool._try_lock(os.path.join(self.workspace, "key%d.lock" % 0xcd))
+      self.assertIsNotNone(key_fd)
+      compile_pool._unlock(key_fd)
+    thread.join()
+    self.assertTrue(entered.is_set())
+
+  @staticmethod
+  def enter_and_signal(key, entered):
+    with compile_slot(key):
+      entered.set()
@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Verdict
+from coordinator import merge_results, split_units, assign_units, missing_cases
+from core.cluster import rendezvous
+from tests.test_base import TestBase
+
+AC, WA, WAITING = Verdict.ACCEPTED.value, Verdict.WRONG_ANSWER.value, Verdict.WAITING.value
+
+
+class CoordinatorTest(TestBase):
+
+  def test_assign_units(self):
+    self.assertEqual([[0, 1], [2], [3, 4]], split_units(5, [1, 1, 2, 3, 3]))
+    self.assertEqual([[0], [1], [2]], split_units(3))
+    holders = {'n1': {'a', 'b', 'c'}, 'n2': {'b', 'c'}}
+    self.assertEqual({'n1': [0, 2], 'n2': [1]}, assign_units(['a', 'b', 'c'], split_units(3), holders))
+    self.assertEqual({'n1': [0, 1], 'n2': [2]}, assign_units(['a', 'b', 'c'], split_units(3, [1, 1, 2]), holders))
+    # cases no node has, or has all of, still go somewhere
+    self.assertEqual({'n1': [0], 'n2': [1]}, assign_units(['a', 'd'], split_units(2), holders))
+    self.assertEqual({'n1': [0, 1]}, assign_units(['a', 'b'], split_units(2, [1, 1]), {'n1': {'a'}, 'n2': {'b'}}))
+    with self.assertRaises(ValueError):
+      assign_units(['a'], split_units(1), {})
+
+  def test_missing_cases(self):
+    holders = {'n1': {'a'}, 'n2': {'b'}}
+    self.assertEqual([('b', 'n2', 'n1')], missing_cases(['a', 'b', 'c'], {'n1': [0, 1, 2]}, holders))
+    self.assertEqual([], missing_cases(['a', 'b'], {'n1': [0], 'n2': [1]}, holders))
+    nodes = ['http://n%d' % i for i in range(5)]
+    self.assertEqual(rendezvous('a', nodes, 2), rendezvous('a', nodes[::-1], 2))
+    self.assertEqual(5, len(rendezvous('a', nodes, 0)))
+
+  def test_merge_stop_at_failure(self):
+    shards = [([0, 2], {'verdict': WA, 'time': 0.3, 'detail': [{'verdict': AC, 'time': 0.1},
+                                                                {'verdict': WA, 'time': 0.3}]}),
+              ([1, 3], {'verdict': WA, 'time': 0.5, 'detail': [{'verdict': WA, 'time': 0.2},
+                                                                {'verdict': WA, 'time': 0.5}]})]
+    response = merge_results(4, shards)
+    self.assertEqual(WA, response['verdict'])
+    self.assertEqual([AC, WA], [result['verdict'] for result in response['detail']])
+    self.assertEqual(0.2, response['time'])
+    response = merge_results(4, shards, run_until_complete=True)
+    self.assertEqual([AC, WA, WA, WA], [result['verdict'] for result in response['detail']])
+    self.assertEqual(0.5, response['time'])
+
+  def test_merge_groups(self):
+    group_list = [1, 1, 2, 3]
+    shards = [([0, 1], {'verdict': WA, 'detail': [{'group': 1, 'verdict': WA}, {'group': 1, 'verdict': WAITING}]}),
+              ([2], {'verdict': AC, 'detail': [{'group': 2, 'verdict': AC}]}),
+              ([3], {'verdict': AC, 'detail': [{'group': 3, 'verdict': AC}]})]
+    response = merge_results(4, shards, group_list, [(3, 1)])
+    self.assertEqual(WA, response['verdict'])
+    self.assertEqual([WA, WAITING, AC, WAITING], [result['verdict'] for result in response['detail']])
+
+  def test_merge_compile_error(self):
+    shards = [([0], {'verdict': Verdict.COMPILE_ERROR.value, 'message': 'error'}),
+              ([1], {'verdict': Verdict.COMPILE_ERROR.value, 'message': 'error'})]
+    self.assertEqual({'status': 'received', 'verdict': Verdict.COMPILE_ERROR.value, 'message': 'error'},
+                     merge_results(2, shards))
@@ -4,6 +4,8 @@ Before running this test, you need to run both flask server and celery
 """
 
 import requests
+import hashlib
+import io
 import json
 import logging
 import base64
@@ -12,6 +14,7 @@ import unittest
 import shutil
 import sys
 import time
+import zipfile
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -22,6 +25,7 @@ from config.config import SUB_BASE
 from handler import trace_group_dependencies
 
 URL_BASE = 'http://localhost:5000'
+STREAM_URL_BASE = 'http://localhost:5001'
 
 
 class FlaskTest(TestBase):
@@ -56,12 +60,63 @@ class FlaskTest(TestBase):
     with open(case.output_file, 'r') as f2:
       self.assertEqual(f2.read(), '456456')
 
+  def test_upload_deduplicated(self):
+    fingerprints = ['test_%s' % self.rand_str() for _ in range(2)]
+    for fingerprint in fingerprints:
+      result = requests.post(self.url_base + '/upload/case/%s/input' % fingerprint, data=b'789789',
+                             auth=self.token).json()
+      self.assertEqual(result['status'], 'received')
+      self.assertEqual(result['sha256'], hashlib.sha256(b'789789').hexdigest())
+    self.assertTrue(os.path.samefile(Case(fingerprints[0]).input_file, Case(fingerprints[1]).input_file))
+
+  def test_upload_archive(self):
+    fingerprints = ['test_%s' % self.rand_str() for _ in range(2)]
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+      for i in range(2):
+        zip_file.writestr('%d.in' % i, '%d %d\n' % (i, i))
+        zip_file.writestr('%d.out' % i, '%d\n' % (i * 2))
+    manifest = [{'fingerprint': fp, 'input': '%d.in' % i, 'output': '%d.out' % i}
+                for i, fp in enumerate(fingerprints)]
+    result = requests.post(self.url_base + '/upload/cases', data={'manifest': json.dumps(manifest)},
+                           files={'archive': ('cases.zip', archive.getvalue())}, auth=self.token).json()
+    self.assertEqual(result['status'], 'received')
+    for i, fp in enumerate(fingerprints):
+      self.assertEqual(result['cases'][fp]['output'], hashlib.sha256(b'%d\n' % (i * 2)).hexdigest())
+      with open(Case(fp).input_file, 'r') as f:
+        self.assertEqual(f.read(), '%d %d\n' % (i, i))
+
+  def test_upload_archive_bad_fingerprint(self):
+    fingerprint = 'test_%s' % self.rand_str()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+      zip_file.writestr('0.in', '1 2\n')
+    manifest = [{'fingerprint': fingerprint, 'input': '0.in'}, {'fingerprint': '../../x', 'input': '0.in'}]
+    result = requests.post(self.url_base + '/upload/cases', data={'manifest': json.dumps(manifest)},
+                           files={'archive': ('cases.zip', archive.getvalue())}, auth=self.token).json()
+    self.assertEqual(result['status'], 'reject')
+    self.assertIn('Invalid fingerprint', result['message'])
+    self.assertFalse(os.path.exists(Case(fingerprint).input_file))
+
+  def test_metrics(self):
+    metrics = requests.get(self.url_base + '/metrics', auth=self.token).text
+    self.assertIn('# TYPE ejudge_queue_jobs gauge', metrics)
+    self.assertIn('ejudge_tmp_dirs ', metrics)
+
   def test_upload_fail(self):
     fingerprint = 'test_%s' % self.rand_str()
     result = requests.post(self.url_base + '/upload/case/%s/input' % fingerprint, data=b'123123',
                            auth=('123', '345')).json()
     self.assertEqual(result['status'], 'reject')
 
+  def test_upload_bad_fingerprint(self):
+    result = requests.post(self.url_base + '/upload/case/test.%s/input' % self.rand_str(), data=b'123123',
+                           auth=self.token).json()
+    self.assertEqual(result['status'], 'reject')
+    self.assertIn('Invalid fingerprint', result['message'])
+    result = requests.post(self.url_base + '/query/cases', json={'cases': ['..']}, auth=self.token).json()
+    self.assertEqual(result['status'], 'reject')
+
   def test_upload_checker_fail(self):
     fingerprint = 'test_%s' % self.rand_str()
     json_data = {'fingerprint': fingerprint, 'code': 'code', 'lang': 'cpp'}
@@ -83,7 +138,7 @@ class FlaskTest(TestBase):
     self.assertEqual('received', result['status'])
     self.assertGreater(len(result["spj"]), 0)
 
-  def judge_aplusb(self, code, lang, hold=True):
+  def judge_aplusb(self, code, lang, hold=True, concurrency=None):
     checker_fingerprint = self.rand_str(True)
     case_fingerprints = [self.rand_str(True) for _ in range(31)]
     checker_dict = dict(fingerprint=checker_fingerprint, lang='cpp', code=self.read_content('./submission/ncmp.cpp'))
@@ -102,6 +157,8 @@ class FlaskTest(TestBase):
     judge_upload = dict(fingerprint=self.rand_str(True), lang=lang, code=code,
                         cases=case_fingerprints, max_time=1, max_memory=128, checker=checker_fingerprint,
                         )
+    if concurrency:
+      judge_upload.update(concurrency=concurrency)
 
     if not hold:
       judge_upload.update(hold=False)
@@ -113,6 +170,11 @@ class FlaskTest(TestBase):
       report = requests.get(self.url_base + '/query/report', json={'fingerprint': judge_upload['fingerprint']},
                             auth=self.token).text
       logging.warning(report)
+      ranged_report = requests.get(self.url_base + '/query/report',
+                                   json={'fingerprint': judge_upload['fingerprint'], 'start': 0, 'end': 2},
+                                   auth=self.token).json()
+      self.assertEqual('received', ranged_report['status'])
+      self.assertLessEqual(len(ranged_report['report']), 2)
     else:
       result = requests.post(self.url_base + '/judge', json=judge_upload,
                              auth=self.token).json()
@@ -155,6 +217,45 @@ class FlaskTest(TestBase):
     self.assertEqual(self.judge_aplusb(self.read_content('./submission/aplusb2.cpp'), 'cpp', False),
                      Verdict.ACCEPTED.value)
 
+  def test_aplusb_judge_parallel(self):
+    self.assertEqual(self.judge_aplusb(self.read_content('./submission/aplusb.cpp'), 'cpp', concurrency=4),
+                     Verdict.ACCEPTED.value)
+    self.assertEqual(self.judge_aplusb(self.read_content('./submission/aplusb-wrong.py'), 'python', concurrency=4),
+                     Verdict.WRONG_ANSWER.value)
+
+  def test_aplusb_judge_stream(self):
+    checker_fingerprint = self.rand_str(True)
+    case_fingerprints = [self.rand_str(True) for _ in range(5)]
+    checker_dict = dict(fingerprint=checker_fingerprint, lang='cpp', code=self.read_content('./submission/ncmp.cpp'))
+    response = requests.post(self.url_base + "/upload/spj", json=checker_dict, auth=self.token).json()
+    self.assertEqual(response['status'], 'received')
+    for i, fingerprint in enumerate(case_fingerprints):
+      for io_name in ('input', 'output'):
+        response = requests.post(self.url_base + '/upload/case/%s/%s' % (fingerprint, io_name),
+                                 data=self.read_content('./data/aplusb/ex_%s%d.txt' % (io_name, i + 1), 'rb'),
+                                 auth=self.token)
+        self.assertEqual(response.json()['status'], 'received')
+    fingerprint = self.rand_str(True)
+    judge_upload = dict(fingerprint=fingerprint, lang='cpp', code=self.read_content('./submission/aplusb.cpp'),
+                        cases=case_fingerprints, max_time=1, max_memory=128, checker=checker_fingerprint,
+                        hold=False)
+    response = requests.post(self.url_base + '/judge', json=judge_upload, auth=self.token).json()
+    self.assertEqual('received', response['status'])
+    events = []
+    with requests.get(STREAM_URL_BASE + '/query/stream', params={'fingerprint': fingerprint},
+                      auth=self.token, stream=True) as stream:
+      for line in stream.iter_lines(decode_unicode=True):
+        if line.startswith('event: '):
+          event = line[len('event: '):]
+        elif line.startswith('data: '):
+          events.append((event, json.loads(line[len('data: '):])))
+    cases = [data for event, data in events if event == 'case']
+    self.assertEqual(list(range(len(case_fingerprints))), [data['index'] for data in cases])
+    for data in cases:
+      self.assertEqual(Verdict.ACCEPTED.value, data['verdict'])
+    self.assertEqual('status', events[-1][0])
+    self.assertEqual(Verdict.ACCEPTED.value, events[-1][1]['verdict'])
+
   def test_aplusb_judge_traceback(self):
     judge_upload = dict(fingerprint=self.rand_str(True), lang='cpp', code='int main() { return 0; }',
                         cases=[], max_time=1, max_memory=128, checker='ttt', hold=False)
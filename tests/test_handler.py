@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handler
+from config.config import Verdict
+from core.cancel import request_cancel
+from core.case import Case
+from core.exception import CompileError, JudgeCancelled
+from handler import judge_handler
+from tests.test_base import TestBase
+
+COMPILE_TIMEOUT = 5
+
+
+class PipelinedSetupTest(TestBase):
+  """
+  The submission is compiled while the rest of the judge is set up: a judge that cannot run is rejected
+  without waiting for the compile, which is cancelled.
+  """
+
+  def setUp(self):
+    self.workspace = '/tmp/handler'
+    super(PipelinedSetupTest, self).setUp()
+    self.compile_error = None
+    self.compile_cancelled = threading.Event()
+    self.saved_compile = handler.compile_submission
+    handler.compile_submission = self.compile_submission
+
+  def tearDown(self):
+    handler.compile_submission = self.saved_compile
+
+  def compile_submission(self, submission, code, max_time, cancel_token):
+    if self.compile_error is not None:
+      raise CompileError(self.compile_error)
+    deadline = time.time() + COMPILE_TIMEOUT
+    while time.time() < deadline:
+      try:
+        cancel_token.check()
+      except JudgeCancelled:
+        self.compile_cancelled.set()
+        raise
+      time.sleep(0.01)
+
+  def make_case(self):
+    case = Case(self.rand_str())
+    case.write_input_binary(b'1 2\n')
+    case.write_output_binary(b'3\n')
+    return case.fingerprint
+
+  def judge(self, case_list, fingerprint=None, **kwargs):
+    start = time.time()
+    response = judge_handler(fingerprint or self.rand_str(), '', 'cpp', case_list, 1, 128, **kwargs)
+    return response, time.time() - start
+
+  def test_missing_case(self):
+    response, duration = self.judge([self.make_case(), self.rand_str()])
+    self.assertEqual('reject', response['status'])
+    self.assertIn('Case data does not exist', response['message'])
+    self.assertLess(duration, COMPILE_TIMEOUT)
+    self.assertTrue(self.compile_cancelled.is_set())
+
+  def test_missing_checker(self):
+    response, duration = self.judge([self.make_case()], checker_fingerprint=self.rand_str())
+    self.assertEqual('reject', response['status'])
+    self.assertIn('SPJ fingerprint does not exist', response['message'])
+    self.assertLess(duration, COMPILE_TIMEOUT)
+    self.assertTrue(self.compile_cancelled.is_set())
+
+  def test_compile_error(self):
+    self.compile_error = 'expected ;'
+    response, _ = self.judge([self.make_case()], checker_fingerprint='builtin')
+    self.assertEqual(Verdict.COMPILE_ERROR.value, response['verdict'], response)
+    self.assertEqual('expected ;', response['message'])
+
+  def test_cancel_while_compiling(self):
+    fingerprint = self.rand_str()
+    threading.Timer(0.5, request_cancel, args=(fingerprint,)).start()
+    response, duration = self.judge([self.make_case(), self.make_case()], fingerprint=fingerprint,
+                                    checker_fingerprint='builtin', group_list=[1, 2])
+    self.assertEqual('received', response['status'], response)
+    self.assertTrue(response['cancelled'])
+    self.assertEqual(Verdict.WAITING.value, response['verdict'])
+    self.assertEqual([{'group': 1, 'verdict': Verdict.WAITING.value}, {'group': 2, 'verdict': Verdict.WAITING.value}],
+                     response['detail'])
+    self.assertLess(duration, COMPILE_TIMEOUT)
+    self.assertTrue(self.compile_cancelled.is_set())
@@ -0,0 +1,47 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.interaction import ProxyChannel, stream_proxy_run
+from tests.test_base import TestBase
+
+
+class ProxyChannelTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/interaction'
+    super(ProxyChannelTest, self).setUp()
+
+  def test_slow_reader_while_recording(self):
+    data = os.urandom(4 * 1024 * 1024)  # far more than a pipe holds
+    input_read, input_write = os.pipe()
+    output_read, output_write = os.pipe()
+    record_file = self.output_path()
+    received = []
+
+    def write():
+      with open(input_write, "wb") as fs:
+        fs.write(data)
+
+    def read():
+      with open(output_read, "rb") as fs:
+        while True:
+          chunk = fs.read1(65536)
+          if not chunk:
+            break
+          received.append(chunk)
+          time.sleep(0.001)
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read)]
+    for thread in threads:
+      thread.start()
+    channel = ProxyChannel(input_read, output_write, record_file, record_limit=-1)
+    self.assertFalse(channel.splicing)
+    stream_proxy_run([channel])
+    for thread in threads:
+      thread.join()
+    self.assertEqual(data, b"".join(received))
+    self.assertEqual(data, self.read_content(record_file, 'rb'))
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.exception import QueueFullError
+from core.jobs import JobQueue, MAX_ATTEMPTS
+from tests.test_base import TestBase
+
+
+class JobQueueTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/jobs'
+    super(JobQueueTest, self).setUp()
+    self.queue = JobQueue(os.path.join(self.workspace, 'queue.sqlite3'), max_size=3)
+
+  def test_fifo(self):
+    for fingerprint in ('a', 'b', 'c'):
+      self.queue.push(fingerprint, [fingerprint], {'hold': False})
+    self.assertEqual(2, self.queue.position('c'))
+    job_id, fingerprint, args, kwargs = self.queue.pop(worker=0)
+    self.assertEqual(('a', ['a'], {'hold': False}), (fingerprint, args, kwargs))
+    self.assertIsNone(self.queue.position('a'))
+    self.assertEqual(1, self.queue.position('c'))
+    self.assertEqual((2, 1), (self.queue.waiting_count(), self.queue.running_count()))
+    self.queue.finish(job_id)
+    self.assertTrue(self.queue.remove('b'))
+    self.assertFalse(self.queue.remove('b'))
+    self.assertEqual(0, self.queue.position('c'))
+
+  def test_full(self):
+    for fingerprint in ('a', 'b', 'c'):
+      self.queue.push(fingerprint, [], {})
+    with self.assertRaises(QueueFullError):
+      self.queue.push('d', [], {})
+    self.queue.pop(worker=0)  # a running job leaves room
+    self.queue.push('d', [], {})
+
+  def test_requeue(self):
+    self.queue.push('a', [], {})
+    self.queue.push('b', [], {})
+    self.queue.pop(worker=0)
+    self.queue.pop(worker=1)
+    self.assertEqual([], self.queue.requeue(worker=1))
+    self.assertEqual('b', self.queue.pop(worker=2)[1])
+    self.assertEqual([], self.queue.requeue())
+    self.assertEqual(2, self.queue.waiting_count())
+    for _ in range(MAX_ATTEMPTS - 2):  # 'a' has been tried once already
+      self.queue.pop(worker=0)
+      self.assertEqual([], self.queue.requeue(worker=0))
+    self.queue.pop(worker=0)
+    self.assertEqual(['a'], self.queue.requeue(worker=0))  # tried too many times
+    self.assertEqual(0, self.queue.position('b'))
+
+  def test_busy_response(self):
+    import api
+    import flask_server
+    flask_server.job_queue = JobQueue(os.path.join(self.workspace, 'full.sqlite3'), max_size=0)
+    client = flask_server.flask_app.test_client()
+    tokens = api.load_tokens()
+    response = client.post('/judge', json={'fingerprint': 'test_busy', 'code': '', 'lang': 'cpp', 'cases': [],
+                                           'max_time': 1, 'max_memory': 64, 'hold': False},
+                           auth=(tokens['username'], tokens['password']))
+    self.assertEqual(503, response.status_code)
+    self.assertEqual('busy', response.get_json()['status'])
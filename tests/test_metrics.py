@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.metrics import _merge_snapshots, _start_time, RETIRED_FILE
+from tests.test_base import TestBase
+
+
+def snapshot(counter, gauge):
+  return {"jobs": {"kind": "counter", "documentation": "", "labels": [], "values": [[[], counter]]},
+          "running": {"kind": "gauge", "documentation": "", "labels": [], "values": [[[], gauge]]}}
+
+
+class MetricsTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/metrics'
+    super(MetricsTest, self).setUp()
+
+  def write(self, name, content):
+    with open(os.path.join(self.workspace, name), 'w') as fs:
+      json.dump(content, fs)
+
+  def test_merge_and_retire(self):
+    pid = os.getpid()
+    self.write('%d-%d.json' % (pid, _start_time(pid)), snapshot(1, 5))
+    self.write('%d-%d.json' % (pid, _start_time(pid) + 1), snapshot(2, 7))  # an earlier process with the same pid
+    self.write('999999999-1.json', snapshot(4, 11))  # a process that has exited
+    merged = _merge_snapshots(self.workspace)
+    self.assertEqual({(): 7}, merged['jobs']['values'])
+    self.assertEqual({(): 5}, merged['running']['values'])
+    self.assertEqual(sorted(['%d-%d.json' % (pid, _start_time(pid)), RETIRED_FILE]),
+                     sorted(file for file in os.listdir(self.workspace) if file.endswith('.json')))
+    self.assertEqual({(): 7}, _merge_snapshots(self.workspace)['jobs']['values'])
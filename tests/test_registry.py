@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import LIB_BASE
+from core import registry
+from core.registry import SpjRegistry
+from tests.test_base import TestBase
+
+
+class SpjRegistryTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/registry'
+    super(SpjRegistryTest, self).setUp()
+    self.spj_base = os.path.join(self.workspace, 'spj')
+    self.lib_base = os.path.join(self.workspace, 'lib')
+    for directory in (self.spj_base, self.lib_base, os.path.join(self.lib_base, 'helpers')):
+      os.makedirs(directory)
+    self.index_file = os.path.join(self.workspace, 'state', 'spj_index.json')
+
+  def registry(self):
+    return SpjRegistry((self.spj_base, self.lib_base), self.index_file)
+
+  def write(self, directory, name, content='checker'):
+    file = os.path.join(directory, name)
+    with open(file, 'w') as fs:
+      fs.write(content)
+    # a directory modified within the resolution of its mtime is still seen as modified
+    self.touch(directory)
+    return file
+
+  @staticmethod
+  def touch(file):
+    later = time.time() + 1
+    os.utime(file, (later, later))
+
+  def test_lookup(self):
+    lib_checker = self.write(self.lib_base, 'ncmp.bin11')
+    spj_checker = self.write(self.spj_base, 'wcmp.py3')
+    entry = self.registry().get('ncmp')
+    self.assertEqual((lib_checker, 'cpp'), (entry['path'], entry['lang']))
+    self.assertEqual(spj_checker, self.registry().get('wcmp')['path'])
+    self.assertIsNone(self.registry().get('lcmp'))
+    self.assertEqual(['wcmp.py3'], self.registry().list(self.spj_base))
+
+  def test_spj_first(self):
+    self.write(self.lib_base, 'ncmp.bin11')
+    spj_checker = self.write(self.spj_base, 'ncmp.bin17')
+    self.assertEqual(spj_checker, self.registry().get('ncmp')['path'])
+
+  def test_not_checkers(self):
+    self.write(os.path.join(self.lib_base, 'helpers'), 'checker_daemon.py')
+    self.write(self.lib_base, 'defaultspj.cpp')
+    self.write(self.lib_base, '.py')
+    spj_registry = self.registry()
+    spj_registry.refresh()
+    self.assertEqual({}, spj_registry.entries)
+    self.assertIsNone(SpjRegistry(index_file=self.index_file).get('checker_daemon'))  # the real LIB_BASE
+    self.assertTrue(os.path.exists(os.path.join(LIB_BASE, 'helpers', 'checker_daemon.py')))
+
+  def test_refresh(self):
+    spj_registry = self.registry()
+    self.assertIsNone(spj_registry.get('ncmp'))
+    checker = self.write(self.spj_base, 'ncmp.bin11', 'v1')
+    first = spj_registry.get('ncmp')['checksum']
+    self.assertEqual(checker, spj_registry.get('ncmp')['path'])
+    self.write(self.spj_base, 'ncmp.bin11', 'v2')
+    self.touch(checker)
+    self.assertNotEqual(first, spj_registry.get('ncmp')['checksum'])
+
+  def test_index_shared(self):
+    self.write(self.spj_base, 'ncmp.bin11')
+    self.registry().get('ncmp')
+    checksums = []
+    saved = registry._file_checksum
+    registry._file_checksum = lambda file: checksums.append(file) or saved(file)
+    try:
+      self.assertIsNotNone(self.registry().get('ncmp'))  # loaded from the index of the first one
+      self.write(self.spj_base, 'wcmp.bin11')
+      self.assertIsNotNone(self.registry().get('wcmp'))
+    finally:
+      registry._file_checksum = saved
+    self.assertEqual([os.path.join(self.spj_base, 'wcmp.bin11')], checksums)  # only the new file is read
+
+  def test_add(self):
+    spj_registry = self.registry()
+    spj_registry.get('ncmp')
+    checker = self.write(self.spj_base, 'ncmp.bin11')
+    spj_registry.add('ncmp', 'cpp', checker)
+    self.assertEqual(checker, self.registry().get('ncmp')['path'])
@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import report
+from core.report import ReportStore, evict_reports
+from tests.test_base import TestBase
+
+
+class ReportStoreTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/report'
+    super(ReportStoreTest, self).setUp()
+
+  def test_ranges(self):
+    store = ReportStore('test_report', base=self.workspace)
+    store.create()
+    store.write(2, 'two\n')
+    store.write(0, 'zero\n')
+    store.close()
+    self.assertEqual('zero\ntwo\n', store.read_all())
+    self.assertEqual([(2, 'two\n')], store.read(1, 3))
+    self.assertEqual([], store.read(3))
+
+  def test_bad_fingerprint(self):
+    for fingerprint in ('', '..', '../..', 'a/b', '.', 'a b', None):
+      with self.assertRaises(ValueError):
+        ReportStore(fingerprint, base=self.workspace)
+    self.assertTrue(os.path.isdir(self.workspace))
+
+  def test_evict_vanished(self):
+    old = ReportStore('test_old', base=self.workspace)
+    old.create()
+    old.close()
+    os.utime(old.directory, (0, 0))
+    os.utime(os.path.join(old.directory, 'index'), (0, 0))
+    kept = ReportStore('test_kept', base=self.workspace)
+    kept.create()
+    kept.close()
+    # a report removed by another process between listing and stat looks like a dangling link
+    os.symlink(os.path.join(self.workspace, 'gone'), os.path.join(self.workspace, 'te', 'test_gone'))
+    report._last_sweep = 0
+    evict_reports(max_age=60, base=self.workspace)
+    self.assertEqual(['test_gone', 'test_kept'], sorted(os.listdir(os.path.join(self.workspace, 'te'))))
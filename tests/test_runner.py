@@ -1,6 +1,8 @@
 import logging
 import os
 import sys
+import threading
+import time
 import unittest
 
 logging.basicConfig(level=logging.INFO)
@@ -12,7 +14,8 @@ from core.runner import CaseRunner
 from core.interaction import InteractiveRunner
 from core.submission import Submission
 from core.judge import SpecialJudge
-from core.exception import CompileError
+from core.cancel import CancelToken
+from core.exception import CompileError, JudgeCancelled
 from config.config import Verdict
 from tests.test_base import TestBase
 
@@ -87,6 +90,44 @@ class RunnerTest(TestBase):
     result = case_runner.run(case)
     self.assertEqual(result['verdict'], Verdict.WRONG_ANSWER)
 
+  def test_aplusb_builtin_checker(self):
+    code = self.read_content('./submission/aplusb.cpp')
+    case = Case(self.rand_str(True))
+    case.write_input_binary(b"1\n2\n")
+    case.write_output_binary(b"3  \r\n\n")
+    checker = SpecialJudge.fromExistingFingerprint('builtin')
+    submission = Submission('cpp')
+    submission.compile(code, 5)
+    case_runner = CaseRunner(submission, checker, 1, 128)
+    result = case_runner.run(case)
+    self.assertEqual(result['verdict'], Verdict.ACCEPTED)
+
+  def test_aplusb_builtin_checker_wrong(self):
+    code = self.read_content('./submission/aplusb.cpp')
+    case = Case(self.rand_str(True))
+    case.write_input_binary(b"1\n2\n")
+    case.write_output_binary(b"4\n")
+    checker = SpecialJudge.fromExistingFingerprint('builtin')
+    submission = Submission('cpp')
+    submission.compile(code, 5)
+    case_runner = CaseRunner(submission, checker, 1, 128)
+    result = case_runner.run(case)
+    self.assertEqual(result['verdict'], Verdict.WRONG_ANSWER)
+
+  def test_aplusb_checker_daemon(self):
+    code = self.read_content('./submission/aplusb.cpp')
+    checker = SpecialJudge.fromExistingFingerprint(self.ncmp)
+    submission = Submission('cpp')
+    submission.compile(code, 5)
+    case_runner = CaseRunner(submission, checker, 1, 128, checker_daemon=True)
+    for answer, verdict in [(b"3\n", Verdict.ACCEPTED), (b"4\n", Verdict.WRONG_ANSWER), (b"3\n", Verdict.ACCEPTED)]:
+      case = Case(self.rand_str(True))
+      case.write_input_binary(b"1\n2\n")
+      case.write_output_binary(answer)
+      self.assertEqual(case_runner.run(case)['verdict'], verdict)
+    self.assertIsNotNone(case_runner.checker_daemon)
+    case_runner.clean()
+
   def test_aplusb_compile_error(self):
     with self.assertRaises(CompileError):
       code = self.read_content('./submission/aplusb.cpp')
@@ -151,6 +192,22 @@ class RunnerTest(TestBase):
     result = case_runner.run(case)
     self.assertEqual(result['verdict'], Verdict.RUNTIME_ERROR)
 
+  def test_cancelled(self):
+    code = 'while True:\n    pass\n'
+    case = Case(self.rand_str(True))
+    case.write_input_binary(b"1 2\n")
+    case.write_output_binary(b"3\n")
+    checker = SpecialJudge.fromExistingFingerprint('defaultspj')
+    submission = Submission('python')
+    submission.compile(code, 10)
+    cancel_token = CancelToken()
+    case_runner = CaseRunner(submission, checker, 5, 128, cancel_token=cancel_token)
+    threading.Timer(0.5, cancel_token.cancel).start()
+    start = time.time()
+    with self.assertRaises(JudgeCancelled):
+      case_runner.run(case)
+    self.assertLess(time.time() - start, 2)
+
   def test_interactive_bad_interactor(self):
     code = self.read_content('./interact/a-plus-b.py')
     case = Case(self.rand_str(True))
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import slot
+from core.slot import acquire_slot
+from tests.test_base import TestBase
+
+HOLD_LOCK = "import fcntl, os, sys; fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT); " \
+            "fcntl.flock(fd, fcntl.LOCK_EX); print(flush=True); sys.stdin.read()"
+
+
+class SandboxSlotTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/slot'
+    super(SandboxSlotTest, self).setUp()
+    self.saved_base = slot.SLOT_BASE
+    slot.SLOT_BASE = self.workspace
+
+  def tearDown(self):
+    slot.SLOT_BASE = self.saved_base
+
+  def test_reuse(self):
+    first, second = acquire_slot(), acquire_slot()
+    self.assertEqual((0, 1), (first.index, second.index))
+    first.release()
+    first.release()  # released twice is harmless
+    third = acquire_slot()
+    self.assertEqual(0, third.index)
+    second.release()
+    third.release()
+
+  def test_reset(self):
+    used = acquire_slot()
+    for file in (used.usage_path, os.path.join(used.root_dir, 'left')):
+      open(file, 'w').close()
+    used.release()
+    clean = acquire_slot()
+    self.assertEqual(used.root_dir, clean.root_dir)
+    self.assertEqual([], os.listdir(clean.info_dir))
+    self.assertEqual([], os.listdir(clean.root_dir))
+    clean.release()
+
+  def test_other_process(self):
+    holder = subprocess.Popen([sys.executable, '-c', HOLD_LOCK, os.path.join(self.workspace, '0.lock')],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    holder.stdout.readline()
+    taken = acquire_slot()
+    self.assertEqual(1, taken.index)
+    taken.release()
+    holder.stdin.close()  # the holder exits, and its slot is free again
+    holder.wait()
+    taken = acquire_slot()
+    self.assertEqual(0, taken.index)
+    taken.release()
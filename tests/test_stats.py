@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.stats import CaseStats
+from tests.test_base import TestBase
+
+
+class CaseStatsTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/stats'
+    super(CaseStatsTest, self).setUp()
+
+  def test_fail_fast_order(self):
+    stats = CaseStats(os.path.join(self.workspace, 'stats.sqlite3'))
+    stats.record([('a', False, 1.0, 100), ('b', True, 1.0, 100), ('c', False, 0.1, 100), ('d', True, 1.0, 100)])
+    self.assertEqual([2, 1, 3, 0], stats.fail_fast_order(['a', 'b', 'c', 'd']))
+    self.assertEqual([1, 0, 2, 3], stats.fail_fast_order(['a', 'b', 'c', 'd'], group_list=[1, 1, 2, 2]))
@@ -7,6 +7,8 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.config import Verdict
+from core.exception import CompileError
+from core.sandbox import LocalSandbox, FakeSandbox
 from core.submission import Submission
 from tests.test_base import TestBase
 
@@ -120,6 +122,45 @@ class TrustedSubmissionTest(TestBase):
     self.assertEqual(self.result.verdict, Verdict.ACCEPTED)
     self.submission.clean()
 
+  def test_python_syntax_error(self):
+    self.submission = Submission('python')
+    with self.assertRaises(CompileError):
+      self.submission.compile('print(1 +)\n', 5)
+
+
+class SandboxBackendTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/backend'
+    super(SandboxBackendTest, self).setUp()
+    self.running_config = {
+      'stdin_file': self.make_input('1\n2\n'),
+      'stdout_file': self.output_path(),
+      'stderr_file': self.output_path(),
+      'max_time': 1,
+      'max_memory': 128,
+      'working_directory': self.workspace
+    }
+
+  def test_local(self):
+    self.submission = Submission('cpp')
+    self.submission.sandbox = LocalSandbox()
+    self.submission.compile(self.read_content('./submission/aplusb.cpp'), 10)
+    result = self.submission.run(**self.running_config)
+    self.assertEqual(Verdict.ACCEPTED, result.verdict)
+    self.assertEqual('3', self.output_content(self.running_config['stdout_file']).strip())
+    self.assertEqual(Verdict.TIME_LIMIT_EXCEEDED,
+                     self.submission.run(exe_file='/bin/sh', extra_arguments=['-c', 'while :; do :; done'],
+                                         **self.running_config).verdict)
+    self.submission.clean()
+
+  def test_fake(self):
+    submission = Submission('cpp', exe_file='/bin/false')
+    for verdict in (Verdict.ACCEPTED, Verdict.TIME_LIMIT_EXCEEDED, Verdict.IDLENESS_LIMIT_EXCEEDED,
+                    Verdict.MEMORY_LIMIT_EXCEEDED, Verdict.RUNTIME_ERROR):
+      submission.sandbox = FakeSandbox(0, verdict.name)
+      self.assertEqual(verdict, submission.run(**self.running_config).verdict)
+
 
 if __name__ == '__main__':
   unittest.main()
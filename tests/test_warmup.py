@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import LANGUAGE_CONFIG, LIB_BASE, Verdict
+from core import warmup
+from core.sandbox import LocalSandbox
+from core.submission import Submission
+from tests.test_base import TestBase
+
+WARMUP_CONFIG = {
+  'compile': ['/bin/true {code_file}'],
+  'execute': '/bin/cat {exe_file}',
+  'warmup': ['/bin/touch {warm_dir}/artifact'],
+  'warm_execute': '/bin/cat {warm_dir}/artifact {exe_file}',
+}
+PCH_CODE = '#include <bits/stdc++.h>\nint main() { std::cout << %d << std::endl; }\n'
+
+
+class WarmupTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/warmup'
+    super(WarmupTest, self).setUp()
+    self.saved_base = warmup.WARM_BASE
+    warmup.WARM_BASE = os.path.join(self.workspace, 'warm')
+    LANGUAGE_CONFIG['test_warmup'] = dict(WARMUP_CONFIG)
+    self.clear()
+
+  def tearDown(self):
+    warmup.WARM_BASE = self.saved_base
+    LANGUAGE_CONFIG.pop('test_warmup')
+    self.clear()
+
+  @staticmethod
+  def clear():
+    warmup._ready.clear()
+    warmup._stamps.pop('test_warmup', None)
+
+  def test_build(self):
+    self.assertTrue(warmup.has_warmup('test_warmup'))
+    self.assertFalse(warmup.has_warmup('c'))
+    self.assertEqual((WARMUP_CONFIG['execute'], []), warmup.execute_command('test_warmup'))
+    self.assertTrue(warmup.build('test_warmup'))
+    self.assertTrue(os.path.exists(os.path.join(warmup.warm_dir('test_warmup'), 'artifact')))
+    self.assertEqual((WARMUP_CONFIG['warm_execute'], [(warmup.warm_dir('test_warmup'), warmup.WARM_MOUNT, 'R')]),
+                     warmup.execute_command('test_warmup'))
+    self.assertEqual((WARMUP_CONFIG['execute'], []), warmup.execute_command('test_warmup', warm_start=False))
+    self.assertEqual((WARMUP_CONFIG['compile'], []), warmup.compile_commands('test_warmup'))
+    self.assertEqual(['.stamp', 'artifact'], sorted(os.listdir(warmup.warm_dir('test_warmup'))))
+    self.assertEqual(['test_warmup'], os.listdir(warmup.WARM_BASE))  # no build directory left over
+
+  def test_stale(self):
+    self.assertTrue(warmup.build('test_warmup'))
+    LANGUAGE_CONFIG['test_warmup']['warmup'] = ['/bin/touch {warm_dir}/other']
+    self.clear()
+    self.assertFalse(warmup.is_ready('test_warmup'))  # built from other commands
+    self.assertEqual(WARMUP_CONFIG['execute'], warmup.execute_command('test_warmup')[0])
+    self.assertTrue(warmup.build('test_warmup'))
+    self.assertEqual(['.stamp', 'other'], sorted(os.listdir(warmup.warm_dir('test_warmup'))))
+
+  def test_failed(self):
+    LANGUAGE_CONFIG['test_warmup']['warmup'] = ['/bin/touch {warm_dir}/artifact', '/bin/false']
+    self.assertFalse(warmup.build('test_warmup'))
+    self.assertEqual([], os.listdir(warmup.WARM_BASE))
+    self.assertEqual(WARMUP_CONFIG['execute'], warmup.execute_command('test_warmup')[0])
+
+
+class PrecompiledHeaderTest(TestBase):
+
+  def setUp(self):
+    self.workspace = '/tmp/warmup'
+    super(PrecompiledHeaderTest, self).setUp()
+    self.saved_base = warmup.WARM_BASE
+    warmup.WARM_BASE = os.path.join(self.workspace, 'warm')
+    warmup._ready.clear()
+    # only the precompiled bits/stdc++.h is built, as testlib.h might not be installed
+    os.makedirs(warmup.warm_dir('cpp'))
+    for command in LANGUAGE_CONFIG['cpp']['warmup'][:2]:
+      subprocess.run(command.format(warm_dir=warmup.warm_dir('cpp'), lib_dir=LIB_BASE).split(), check=True)
+    with open(os.path.join(warmup.warm_dir('cpp'), warmup.STAMP_FILE), 'w') as stamp:
+      stamp.write(warmup.stamp('cpp'))
+    self.assertTrue(warmup.is_ready('cpp'))
+    self.header = os.path.join(warmup.warm_dir('cpp'), 'bits', 'stdc++.h.gch')
+
+  def tearDown(self):
+    warmup.WARM_BASE = self.saved_base
+    warmup._ready.clear()
+
+  def compile_and_run(self, code):
+    submission = Submission('cpp')
+    submission.sandbox = LocalSandbox()
+    submission.compile(code, 10)
+    output = self.output_path()
+    result = submission.run(stdin_file='/dev/null', stdout_file=output, stderr_file='/dev/null',
+                            max_time=1, max_memory=128, working_directory=self.workspace)
+    submission.clean()
+    self.assertEqual(Verdict.ACCEPTED, result.verdict)
+    return self.output_content(output).strip()
+
+  def test_pch_used(self):
+    code_file = os.path.join(self.workspace, 'main.cpp')
+    with open(code_file, 'w') as code:
+      code.write(PCH_CODE % 1)
+    command = LANGUAGE_CONFIG['cpp']['warm_compile'][0].format(
+      warm_dir=warmup.warm_dir('cpp'), exe_file=self.output_path(), code_file=code_file).split() + ['-H']
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    self.assertEqual(0, process.returncode, process.stderr)
+    self.assertIn('! ' + self.header, process.stderr.splitlines())  # "!" for a header that is used
+
+  def test_pch_fallback(self):
+    with open(self.header, 'r+b') as header:
+      header.truncate(4096)
+    self.assertEqual(str(os.getpid()), self.compile_and_run(PCH_CODE % os.getpid()))
+
+  def test_pch_failed(self):
+    mounts = [(warmup.warm_dir('cpp'), warmup.WARM_MOUNT, 'R')]
+    self.assertTrue(warmup.pch_failed('a.cpp:1:25: error: while reading precompiled header: x', mounts))
+    self.assertTrue(warmup.pch_failed('cc1plus: fatal error: cannot read /warm/bits/stdc++.h.gch: x', mounts))
+    self.assertFalse(warmup.pch_failed('a.cpp:1:25: error: while reading precompiled header: x', []))
+    self.assertFalse(warmup.pch_failed('a.cpp:1:2: error: #error /warm/bits/stdc++.h.gch: x', mounts))
+    self.assertFalse(warmup.pch_failed('a.cpp:1:2: error: #error .gch', mounts))
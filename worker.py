@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+    Judge worker processes consuming the job queue filled by /judge (with hold=False).
+
+    There is one supervisor and JUDGE_WORKERS workers. At startup, the supervisor requeues the jobs that were
+    in flight when the node went down; later on, it requeues the jobs of any worker that dies, and restarts it.
+"""
+import logging
+import time
+from multiprocessing import Process
+
+from config.config import JUDGE_WORKERS, Verdict
+from core.jobs import JobQueue
+from handler import judge_handler, cache
+
+POLL_INTERVAL = 0.2
+
+
+def reject_dropped(fingerprints):
+  for fingerprint in fingerprints:
+    logging.error("job %s is dropped after too many attempts", fingerprint)
+    cache.set(fingerprint, {'status': 'reject', 'verdict': Verdict.JUDGE_ERROR.value,
+                            'message': 'judge worker crashed repeatedly on this job'}, timeout=3600)
+
+
+def work(worker):
+  job_queue = JobQueue()
+  while True:
+    job = job_queue.pop(worker)
+    if job is None:
+      time.sleep(POLL_INTERVAL)
+      continue
+    job_id, fingerprint, args, kwargs = job
+    try:
+      judge_handler(*args, **kwargs)
+    finally:
+      job_queue.finish(job_id)
+
+
+def start_worker(worker):
+  process = Process(target=work, args=(worker,), daemon=True)
+  process.start()
+  return process
+
+
+def main():
+  job_queue = JobQueue()
+  reject_dropped(job_queue.requeue())
+  workers = {worker: start_worker(worker) for worker in range(JUDGE_WORKERS)}
+  while True:
+    time.sleep(1)
+    for worker, process in workers.items():
+      if not process.is_alive():
+        logging.error("judge worker %d exited with %s, restarting", worker, process.exitcode)
+        reject_dropped(job_queue.requeue(worker))
+        workers[worker] = start_worker(worker)
+
+
+if __name__ == '__main__':
+  main()